@@ -1,5 +1,5 @@
 """应用配置模块."""
-from typing import List
+from typing import Dict, List
 
 from pydantic import AnyHttpUrl, EmailStr, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -65,6 +65,11 @@ class Settings(BaseSettings):
     MILVUS_NLIST: int = 1024
     MILVUS_NPROBE: int = 16
     MILVUS_POOL_SIZE: int = 10
+    # 按过滤条件删除时每批删除的主键数
+    MILVUS_DELETE_BATCH_SIZE: int = 1000
+    # 已通过schema迁移提升为独立标量列的元数据字段, 过滤时按列名访问;
+    # 当前schema的元数据都在JSON字段中, 未迁移前必须留空
+    MILVUS_SCALAR_INDEX_FIELDS: List[str] = []
 
     # OpenAI配置
     OPENAI_API_KEY: str
@@ -74,9 +79,101 @@ class Settings(BaseSettings):
     OPENAI_BATCH_SIZE: int = 32
     OPENAI_MAX_RETRIES: int = 3
     OPENAI_TIMEOUT: float = 30.0
+    # 并发上限; 自适应限流在[OPENAI_MIN_CONCURRENT, OPENAI_MAX_CONCURRENT]内
+    # 按429响应加性增、乘性减
     OPENAI_MAX_CONCURRENT: int = 5
+    OPENAI_MIN_CONCURRENT: int = 1
+    # 每分钟请求数/token数上限, 0表示不限制; 响应头中的账户限额更低时以其为准
+    OPENAI_RPM_LIMIT: int = 0
+    OPENAI_TPM_LIMIT: int = 0
+    OPENAI_EMBEDDING_RPM_LIMIT: int = 0
+    OPENAI_EMBEDDING_TPM_LIMIT: int = 0
+    # 未指定max_tokens时, 准入按此估计补全的输出token数
+    OPENAI_COMPLETION_TOKENS_ESTIMATE: int = 512
+    # 优先级类别的准入权重: interactive(用户等待中) / background / batch(批量导入)
+    OPENAI_PRIORITY_WEIGHTS: Dict[str, int] = {
+        "interactive": 8,
+        "background": 2,
+        "batch": 1,
+    }
     OPENAI_ENABLE_CACHE: bool = True
     OPENAI_CACHE_TTL: int = 86400
+    # 嵌入缓存存储精度: float32 / float16 / int8
+    OPENAI_EMBEDDING_CACHE_DTYPE: str = "float32"
+    # 相同请求合并: 跨进程锁过期时间、等待其他副本结果的超时和轮询间隔(秒)
+    OPENAI_SINGLEFLIGHT_LOCK_TTL: float = 30.0
+    OPENAI_SINGLEFLIGHT_WAIT_TIMEOUT: float = 30.0
+    OPENAI_SINGLEFLIGHT_POLL_INTERVAL: float = 0.1
+
+    # AI额度配置
+    # 每个用户在滚动窗口(秒)内可用的token数, 0表示不限制
+    AI_TOKEN_QUOTA: int = 200000
+    AI_TOKEN_QUOTA_WINDOW: int = 3600
+
+    # RAG配置
+    # 嵌入后端: openai / local, 切换后需同步调整MILVUS_DIMENSION
+    RAG_EMBEDDING_BACKEND: str = "openai"
+    RAG_LOCAL_EMBEDDING_MODEL: str = "BAAI/bge-small-zh-v1.5"
+    RAG_LOCAL_EMBEDDING_DEVICE: str = "cpu"
+    RAG_LOCAL_EMBEDDING_BATCH_SIZE: int = 32
+    # 向量存储: milvus / memory(进程内NumPy矩阵, 持久化为内存映射的.npy) / hnsw
+    # memory和hnsw只支持单个worker进程, 多进程部署请使用milvus
+    RAG_VECTOR_STORE: str = "milvus"
+    RAG_MEMORY_STORE_PATH: str = "data/rag/vectors"
+    RAG_MEMORY_STORE_METRIC: str = "cosine"
+    # 累计变更行数或未保存时长(秒)达到阈值时自动落盘
+    RAG_MEMORY_STORE_PERSIST_ROWS: int = 1000
+    RAG_MEMORY_STORE_PERSIST_INTERVAL: float = 60.0
+    RAG_HNSW_M: int = 16
+    RAG_HNSW_EF_CONSTRUCTION: int = 200
+    RAG_HNSW_EF_SEARCH: int = 64
+    # 批量入库流水线: 清理分块进程数(0为在当前进程中执行), 阶段队列长度,
+    # 嵌入批大小/并发批数, 写入批大小
+    RAG_INGEST_WORKERS: int = 0
+    RAG_INGEST_QUEUE_SIZE: int = 64
+    RAG_INGEST_EMBED_BATCH_SIZE: int = 256
+    RAG_INGEST_EMBED_CONCURRENCY: int = 4
+    RAG_INGEST_INSERT_BATCH_SIZE: int = 1000
+    # 流式上传入库: 每次读取的字节数与每段文本的字符数
+    RAG_UPLOAD_READ_SIZE: int = 65536
+    RAG_INGEST_STREAM_SEGMENT_SIZE: int = 262144
+    # 后台入库任务: Redis流/消费组/进度频道, 本进程工作协程数(0表示不消费),
+    # 认领失联任务的空闲时间(毫秒), 最大尝试次数, 进度推送间隔(秒),
+    # 任务记录和暂存上传内容的过期时间(秒)
+    RAG_INGEST_JOB_STREAM: str = "rag:ingest:jobs"
+    RAG_INGEST_JOB_GROUP: str = "ingest"
+    RAG_INGEST_JOB_CHANNEL: str = "rag:ingest:events"
+    RAG_INGEST_JOB_WORKERS: int = 1
+    RAG_INGEST_JOB_CLAIM_IDLE_MS: int = 60000
+    RAG_INGEST_JOB_MAX_ATTEMPTS: int = 3
+    RAG_INGEST_JOB_PROGRESS_INTERVAL: float = 1.0
+    RAG_INGEST_JOB_TTL: int = 7 * 24 * 3600
+    # 查询编码微批窗口(毫秒), 小于等于0时关闭
+    RAG_QUERY_BATCH_WINDOW_MS: float = 5.0
+    RAG_QUERY_BATCH_MAX_SIZE: int = 16
+    # 语义回答缓存
+    RAG_SEMANTIC_CACHE_ENABLED: bool = True
+    RAG_SEMANTIC_CACHE_THRESHOLD: float = 0.95
+    RAG_SEMANTIC_CACHE_MAX_ENTRIES: int = 2048
+    RAG_SEMANTIC_CACHE_TTL: int = 3600
+    # 查询重写模式: none / llm(带缓存的LLM重写) / template(本地术语扩展)
+    RAG_QUERY_REWRITE_MODE: str = "llm"
+    RAG_QUERY_REWRITE_CACHE_SIZE: int = 1024
+    RAG_QUERY_REWRITE_CACHE_TTL: int = 86400
+    # 混合检索(BM25 + 向量, 倒数排名融合)
+    RAG_HYBRID_SEARCH_ENABLED: bool = True
+    RAG_LEXICAL_INDEX_PATH: str = "data/rag/lexical_index.jsonl"
+    RAG_RRF_K: int = 60
+    RAG_HYBRID_CANDIDATES: int = 4
+    # Token计数: 分块单位(token / char)、tiktoken编码、计数缓存与上下文token预算;
+    # 分块ID为内容哈希, 已有知识库切换分块单位后需清空向量库重新导入
+    RAG_CHUNK_UNIT: str = "char"
+    RAG_TOKENIZER_ENCODING: str = "cl100k_base"
+    RAG_TOKEN_CACHE_SIZE: int = 65536
+    RAG_CONTEXT_TOKEN_BUDGET: int = 3000
+    # 文本处理器: default(按句子分块) / screenplay(按场景/对白块分块);
+    # 与分块单位相同, 已有知识库切换后需清空向量库重新导入
+    RAG_TEXT_PROCESSOR: str = "default"
 
     # 文件存储配置
     OSS_ACCESS_KEY: str
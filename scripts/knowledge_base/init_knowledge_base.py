@@ -2,14 +2,23 @@
 """
 知识库初始化脚本
 用于导入和处理初始知识库数据
+
+使用 --sync 时按清单(manifest)增量同步: 未变化的文件直接跳过,
+变化的文件只替换过期的分块, 已删除文件的向量会被移除.
 """
+import argparse
 import asyncio
+import hashlib
+import json
 import logging
+import os
+import time
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-from app.services.rag import RAGService, DocumentProcessor
-from app.core.config import settings
+from scriptai.core.openai import Priority, llm_priority, llm_user
+from scriptai.services.rag.base import Document, RAGService
+from scriptai.services.rag.service import ScriptRAGService
 
 # 配置日志
 logging.basicConfig(
@@ -21,6 +30,10 @@ logger = logging.getLogger(__name__)
 # 知识库数据目录
 KNOWLEDGE_BASE_DIR = Path("knowledge_base")
 
+# 增量同步清单
+MANIFEST_PATH = KNOWLEDGE_BASE_DIR / ".manifest.json"
+MANIFEST_VERSION = 1
+
 # 知识分类
 CATEGORIES = {
     "theory": {
@@ -46,7 +59,7 @@ async def scan_files(directory: Path) -> List[Path]:
     if not directory.exists():
         logger.warning(f"目录不存在: {directory}")
         return []
-        
+
     files = []
     for file_path in directory.rglob("*"):
         if file_path.is_file() and file_path.suffix in [".txt", ".md"]:
@@ -63,6 +76,16 @@ async def read_file(file_path: Path) -> str:
         return ""
 
 
+def build_metadata(category: str, file_path: Path) -> Dict[str, Any]:
+    """构建文件的元数据"""
+    return {
+        **CATEGORIES[category]["metadata"],
+        "filename": file_path.name,
+        "category": category,
+        "path": str(file_path.relative_to(KNOWLEDGE_BASE_DIR))
+    }
+
+
 async def process_category(
     category: str,
     rag_service: RAGService
@@ -70,11 +93,11 @@ async def process_category(
     """处理一个知识分类"""
     category_info = CATEGORIES[category]
     logger.info(f"处理分类: {category} - {category_info['description']}")
-    
+
     # 扫描文件
     files = await scan_files(category_info["path"])
     logger.info(f"找到 {len(files)} 个文件")
-    
+
     # 处理每个文件
     for file_path in files:
         try:
@@ -82,49 +105,249 @@ async def process_category(
             content = await read_file(file_path)
             if not content:
                 continue
-                
+
             # 准备元数据
-            metadata = {
-                **category_info["metadata"],
-                "filename": file_path.name,
-                "category": category,
-                "path": str(file_path.relative_to(KNOWLEDGE_BASE_DIR))
-            }
-            
+            metadata = build_metadata(category, file_path)
+
             # 添加到知识库
-            success = await rag_service.add_document(content, metadata)
-            
+            success = await rag_service.add_document(
+                content, metadata, priority=Priority.BATCH
+            )
+
             if success:
                 logger.info(f"成功添加文件: {file_path.name}")
             else:
                 logger.warning(f"添加文件失败: {file_path.name}")
-                
+
         except Exception as e:
             logger.error(f"处理文件失败 {file_path}: {e}")
 
 
+def load_manifest(path: Path) -> Dict[str, Dict[str, Any]]:
+    """读取同步清单, 返回 相对路径 -> 文件记录"""
+    if not path.exists():
+        return {}
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except Exception as e:
+        logger.warning(f"读取清单失败, 将全量同步: {e}")
+        return {}
+    if data.get("version") != MANIFEST_VERSION:
+        logger.warning("清单版本不匹配, 将全量同步")
+        return {}
+    return data.get("files", {})
+
+
+def save_manifest(path: Path, files: Dict[str, Dict[str, Any]]) -> None:
+    """写入同步清单(先写临时文件再原子替换)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(
+        json.dumps(
+            {"version": MANIFEST_VERSION, "files": files},
+            ensure_ascii=False,
+            indent=2,
+            sort_keys=True,
+        ),
+        encoding="utf-8",
+    )
+    os.replace(tmp_path, path)
+
+
+def read_and_hash(file_path: Path) -> Tuple[str, str]:
+    """读取文件并计算内容哈希"""
+    content = file_path.read_text(encoding="utf-8")
+    return content, hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+async def sync_file(
+    category: str,
+    file_path: Path,
+    entry: Optional[Dict[str, Any]],
+    rag_service: RAGService,
+    stats: Dict[str, int],
+) -> Tuple[Optional[Dict[str, Any]], Set[str]]:
+    """同步单个文件, 返回(新的清单记录, 过期的分块ID)"""
+    stat = file_path.stat()
+    # mtime和大小都未变化时不读取文件
+    if (
+        entry is not None
+        and entry["mtime"] == stat.st_mtime_ns
+        and entry["size"] == stat.st_size
+    ):
+        stats["unchanged"] += 1
+        return entry, set()
+
+    content, digest = await asyncio.to_thread(read_and_hash, file_path)
+    if entry is not None and entry["hash"] == digest:
+        stats["unchanged"] += 1
+        return {**entry, "mtime": stat.st_mtime_ns, "size": stat.st_size}, set()
+
+    results = await rag_service.add_documents(
+        [Document(content=content, metadata=build_metadata(category, file_path))],
+        priority=Priority.BATCH,
+    )
+    result = results[0]
+    if not result.success:
+        logger.warning(f"同步文件失败 {file_path}: {result.error}")
+        stats["failed"] += 1
+        # 保留旧记录, 下次重试
+        return entry, set()
+
+    stats["updated" if entry is not None else "added"] += 1
+    stats["chunks_inserted"] += result.chunks
+    stats["chunks_skipped"] += result.skipped
+    stale = set(entry["chunk_ids"]) - set(result.chunk_ids) if entry else set()
+    return {
+        "category": category,
+        "mtime": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "hash": digest,
+        "chunk_ids": result.chunk_ids,
+    }, stale
+
+
+async def sync_knowledge_base(
+    rag_service: RAGService,
+    manifest_path: Path = MANIFEST_PATH,
+    concurrency: int = 8,
+) -> Dict[str, int]:
+    """按清单增量同步知识库, 返回统计信息"""
+    begin_time = time.perf_counter()
+    manifest = load_manifest(manifest_path)
+    stats = {
+        key: 0
+        for key in (
+            "added",
+            "updated",
+            "unchanged",
+            "deleted",
+            "failed",
+            "chunks_inserted",
+            "chunks_skipped",
+            "chunks_removed",
+        )
+    }
+
+    # 扫描文件
+    files: List[Tuple[str, Path]] = []
+    for category, category_info in CATEGORIES.items():
+        for file_path in await scan_files(category_info["path"]):
+            files.append((category, file_path))
+    logger.info(f"找到 {len(files)} 个文件, 清单中记录 {len(manifest)} 个")
+
+    # 并发同步
+    semaphore = asyncio.Semaphore(concurrency)
+    updated: Dict[str, Dict[str, Any]] = {}
+    stale: Set[str] = set()
+    done = 0
+
+    async def run(category: str, file_path: Path) -> None:
+        nonlocal done
+        key = str(file_path.relative_to(KNOWLEDGE_BASE_DIR))
+        async with semaphore:
+            try:
+                entry, file_stale = await sync_file(
+                    category,
+                    file_path,
+                    manifest.get(key),
+                    rag_service,
+                    stats,
+                )
+            except Exception as e:
+                logger.error(f"处理文件失败 {file_path}: {e}")
+                stats["failed"] += 1
+                entry, file_stale = manifest.get(key), set()
+        if entry is not None:
+            updated[key] = entry
+        stale.update(file_stale)
+        done += 1
+        if done % 100 == 0 or done == len(files):
+            logger.info(f"进度: {done}/{len(files)}")
+
+    await asyncio.gather(*(run(category, path) for category, path in files))
+
+    # 已删除文件的分块全部过期
+    for key, entry in manifest.items():
+        if key not in updated:
+            stats["deleted"] += 1
+            stale.update(entry["chunk_ids"])
+
+    # 仍被其他文件引用的分块(内容相同)不删除
+    referenced = {
+        chunk for entry in updated.values() for chunk in entry["chunk_ids"]
+    }
+    stale -= referenced
+    if stale:
+        if not await rag_service.delete_chunks(sorted(stale)):
+            logger.warning(f"删除过期分块失败: {len(stale)} 个")
+        stats["chunks_removed"] = len(stale)
+
+    save_manifest(manifest_path, updated)
+    logger.info(
+        "同步完成: 新增 {added}, 更新 {updated}, 未变化 {unchanged}, "
+        "删除 {deleted}, 失败 {failed}; 分块 新增 {chunks_inserted}, "
+        "跳过 {chunks_skipped}, 移除 {chunks_removed}".format(**stats)
+        + f"; 耗时 {time.perf_counter() - begin_time:.2f}s"
+    )
+    return stats
+
+
 async def create_knowledge_base_structure() -> None:
     """创建知识库目录结构"""
     for category_info in CATEGORIES.values():
         category_info["path"].mkdir(parents=True, exist_ok=True)
 
 
+def parse_args() -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="初始化或同步知识库")
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="按清单增量同步, 只处理新增、修改和删除的文件",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=Path,
+        default=MANIFEST_PATH,
+        help="同步清单路径",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="同时处理的文件数",
+    )
+    return parser.parse_args()
+
+
 async def main():
     """主函数"""
+    args = parse_args()
     try:
         # 创建目录结构
         await create_knowledge_base_structure()
-        
+
         # 初始化RAG服务
-        rag_service = RAGService()
+        rag_service = ScriptRAGService()
         await rag_service.initialize()
-        
-        # 处理每个分类
-        for category in CATEGORIES:
-            await process_category(category, rag_service)
-            
+
+        # 批量导入属于系统任务: 以批量优先级排队, 不计入任何用户的额度
+        with llm_user(None), llm_priority(Priority.BATCH):
+            if args.sync:
+                await sync_knowledge_base(
+                    rag_service,
+                    manifest_path=args.manifest,
+                    concurrency=args.concurrency,
+                )
+            else:
+                # 处理每个分类
+                for category in CATEGORIES:
+                    await process_category(category, rag_service)
+
         logger.info("知识库初始化完成")
-        
+
     except Exception as e:
         logger.error(f"知识库初始化失败: {e}")
         raise
@@ -135,4 +358,4 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
@@ -1,16 +1,48 @@
 """知识库管理相关的API端点."""
-from typing import Any, Dict, List, Optional
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
 
 from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from scriptai.core.security import get_current_active_superuser
+from scriptai.config import settings
+from scriptai.core.security import get_current_active_superuser, get_current_ai_user
 from scriptai.db.session import get_db
+from scriptai.models.user import User
+from scriptai.services.rag.base import Document
+from scriptai.services.rag.jobs import ingest_jobs
 from scriptai.services.rag.service import rag_service
 
 router = APIRouter()
 
 
+def _event_stream(tokens: AsyncIterator[str]) -> StreamingResponse:
+    """将生成的文本片段包装为Server-Sent Events响应."""
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for token in tokens:
+                data = json.dumps({"token": token}, ensure_ascii=False)
+                yield f"data: {data}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            data = json.dumps({"detail": str(e)}, ensure_ascii=False)
+            yield f"event: error\ndata: {data}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _read_upload(file: UploadFile) -> AsyncIterator[bytes]:
+    """分块读取上传文件."""
+    while chunk := await file.read(settings.RAG_UPLOAD_READ_SIZE):
+        yield chunk
+
+
 @router.post("/documents", status_code=status.HTTP_200_OK)
 async def add_document(
     *,
@@ -42,17 +74,22 @@ async def add_documents(
 ) -> Dict[str, Any]:
     """批量添加文档到知识库."""
     try:
-        success_count = 0
-        for doc in documents:
-            if await rag_service.add_document(
-                doc["content"],
-                metadata=doc.get("metadata"),
-            ):
-                success_count += 1
+        results = await rag_service.add_documents(
+            [
+                Document(content=doc["content"], metadata=doc.get("metadata") or {})
+                for doc in documents
+            ]
+        )
         return {
             "status": "success",
             "total": len(documents),
-            "success": success_count,
+            "success": sum(result.success for result in results),
+            "skipped": sum(result.skipped for result in results),
+            "failed": [
+                {"index": index, "error": result.error}
+                for index, result in enumerate(results)
+                if not result.success
+            ],
         }
     except Exception as e:
         raise HTTPException(
@@ -68,12 +105,12 @@ async def upload_document(
     type: str = Query(..., description="文档类型，如theory、example、guideline等"),
     current_user: User = Depends(get_current_active_superuser),
 ) -> Dict[str, Any]:
-    """上传文档文件到知识库."""
-    try:
-        # 读取文件内容
-        content = await file.read()
-        text = content.decode("utf-8")
+    """上传文档文件到知识库.
 
+    文件分段暂存到Redis后立即返回任务ID, 由后台工作协程流式入库;
+    进度通过WebSocket推送, 也可通过任务查询接口获取.
+    """
+    try:
         # 准备元数据
         metadata = {
             "type": type,
@@ -81,17 +118,14 @@ async def upload_document(
             "content_type": file.content_type,
         }
 
-        # 添加到知识库
-        success = await rag_service.add_document(
-            text,
+        # 提交后台入库任务
+        job = await ingest_jobs.submit(
+            _read_upload(file),
+            user_id=current_user.id,
             metadata=metadata,
+            filename=file.filename,
         )
-        if not success:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="添加文档失败",
-            )
-        return {"status": "success"}
+        return {"status": job.status, "job_id": job.id}
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -99,24 +133,49 @@ async def upload_document(
         )
 
 
+@router.get("/jobs/{job_id}", status_code=status.HTTP_200_OK)
+async def get_ingest_job(
+    *,
+    job_id: str,
+    current_user: User = Depends(get_current_active_superuser),
+) -> Dict[str, Any]:
+    """查询后台入库任务进度."""
+    job = await ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在",
+        )
+    return job.event()
+
+
 @router.get("/search", status_code=status.HTTP_200_OK)
 async def search_documents(
     *,
     query: str,
     limit: int = Query(5, ge=1, le=20),
     type: Optional[str] = Query(None, description="文档类型过滤"),
-    current_user: User = Depends(get_current_active_user),
+    category: Optional[str] = Query(None, description="知识分类过滤"),
+    importance: Optional[str] = Query(None, description="重要程度过滤"),
+    rewrite: Optional[str] = Query(
+        None,
+        pattern="^(none|llm|template)$",
+        description="查询重写模式, 默认使用服务配置",
+    ),
+    current_user: User = Depends(get_current_ai_user),
 ) -> List[Dict[str, Any]]:
     """搜索知识库文档."""
     try:
         # 准备过滤条件
-        filter = {"type": type} if type else None
+        conditions = {"type": type, "category": category, "importance": importance}
+        filter = {field: value for field, value in conditions.items() if value} or None
 
         # 执行搜索
         results = await rag_service.search(
             query=query,
             limit=limit,
             filter=filter,
+            rewrite=rewrite,
         )
 
         # 转换结果
@@ -135,15 +194,28 @@ async def search_documents(
         )
 
 
-@router.post("/suggestions/writing", status_code=status.HTTP_200_OK)
+@router.post(
+    "/suggestions/writing",
+    status_code=status.HTTP_200_OK,
+    response_model=None,
+)
 async def get_writing_suggestions(
     *,
     context: str,
     query: str,
-    current_user: User = Depends(get_current_active_user),
-) -> Dict[str, str]:
+    stream: bool = Query(False, description="是否以SSE流式返回"),
+    current_user: User = Depends(get_current_ai_user),
+) -> Union[Dict[str, str], StreamingResponse]:
     """获取写作建议."""
     try:
+        if stream:
+            return _event_stream(
+                rag_service.stream_writing_suggestions(
+                    context=context,
+                    query=query,
+                )
+            )
+
         suggestion = await rag_service.get_writing_suggestions(
             context=context,
             query=query,
@@ -156,14 +228,26 @@ async def get_writing_suggestions(
         )
 
 
-@router.post("/suggestions/character", status_code=status.HTTP_200_OK)
+@router.post(
+    "/suggestions/character",
+    status_code=status.HTTP_200_OK,
+    response_model=None,
+)
 async def get_character_suggestions(
     *,
     description: str,
-    current_user: User = Depends(get_current_active_user),
-) -> Dict[str, str]:
+    stream: bool = Query(False, description="是否以SSE流式返回"),
+    current_user: User = Depends(get_current_ai_user),
+) -> Union[Dict[str, str], StreamingResponse]:
     """获取角色设计建议."""
     try:
+        if stream:
+            return _event_stream(
+                rag_service.stream_character_suggestions(
+                    character_description=description,
+                )
+            )
+
         suggestion = await rag_service.get_character_suggestions(
             character_description=description,
         )
@@ -175,14 +259,26 @@ async def get_character_suggestions(
         )
 
 
-@router.post("/suggestions/plot", status_code=status.HTTP_200_OK)
+@router.post(
+    "/suggestions/plot",
+    status_code=status.HTTP_200_OK,
+    response_model=None,
+)
 async def get_plot_suggestions(
     *,
     description: str,
-    current_user: User = Depends(get_current_active_user),
-) -> Dict[str, str]:
+    stream: bool = Query(False, description="是否以SSE流式返回"),
+    current_user: User = Depends(get_current_ai_user),
+) -> Union[Dict[str, str], StreamingResponse]:
     """获取情节设计建议."""
     try:
+        if stream:
+            return _event_stream(
+                rag_service.stream_plot_suggestions(
+                    plot_description=description,
+                )
+            )
+
         suggestion = await rag_service.get_plot_suggestions(
             plot_description=description,
         )
@@ -194,14 +290,26 @@ async def get_plot_suggestions(
         )
 
 
-@router.post("/suggestions/dialogue", status_code=status.HTTP_200_OK)
+@router.post(
+    "/suggestions/dialogue",
+    status_code=status.HTTP_200_OK,
+    response_model=None,
+)
 async def get_dialogue_suggestions(
     *,
     dialogue: str,
-    current_user: User = Depends(get_current_active_user),
-) -> Dict[str, str]:
+    stream: bool = Query(False, description="是否以SSE流式返回"),
+    current_user: User = Depends(get_current_ai_user),
+) -> Union[Dict[str, str], StreamingResponse]:
     """获取对话优化建议."""
     try:
+        if stream:
+            return _event_stream(
+                rag_service.stream_dialogue_suggestions(
+                    dialogue=dialogue,
+                )
+            )
+
         suggestion = await rag_service.get_dialogue_suggestions(
             dialogue=dialogue,
         )
@@ -213,14 +321,26 @@ async def get_dialogue_suggestions(
         )
 
 
-@router.post("/suggestions/scene", status_code=status.HTTP_200_OK)
+@router.post(
+    "/suggestions/scene",
+    status_code=status.HTTP_200_OK,
+    response_model=None,
+)
 async def get_scene_suggestions(
     *,
     description: str,
-    current_user: User = Depends(get_current_active_user),
-) -> Dict[str, str]:
+    stream: bool = Query(False, description="是否以SSE流式返回"),
+    current_user: User = Depends(get_current_ai_user),
+) -> Union[Dict[str, str], StreamingResponse]:
     """获取场景设计建议."""
     try:
+        if stream:
+            return _event_stream(
+                rag_service.stream_scene_suggestions(
+                    scene_description=description,
+                )
+            )
+
         suggestion = await rag_service.get_scene_suggestions(
             scene_description=description,
         )
@@ -232,14 +352,26 @@ async def get_scene_suggestions(
         )
 
 
-@router.post("/analysis/structure", status_code=status.HTTP_200_OK)
+@router.post(
+    "/analysis/structure",
+    status_code=status.HTTP_200_OK,
+    response_model=None,
+)
 async def get_structure_analysis(
     *,
     content: str,
-    current_user: User = Depends(get_current_active_user),
-) -> Dict[str, str]:
+    stream: bool = Query(False, description="是否以SSE流式返回"),
+    current_user: User = Depends(get_current_ai_user),
+) -> Union[Dict[str, str], StreamingResponse]:
     """获取剧本结构分析."""
     try:
+        if stream:
+            return _event_stream(
+                rag_service.stream_structure_analysis(
+                    script_content=content,
+                )
+            )
+
         analysis = await rag_service.get_structure_analysis(
             script_content=content,
         )
@@ -248,4 +380,4 @@ async def get_structure_analysis(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e),
-        ) 
\ No newline at end of file
+        )
@@ -0,0 +1,75 @@
+"""嵌入向量缓存编解码模块.
+
+缓存值格式(小端):
+
+    版本(uint8) | 类型(uint8) | 维度(uint32) | [缩放系数(float32)] | 数据
+
+float32/float16按原值打包; int8采用对称量化, 额外存储一个缩放系数.
+"""
+import hashlib
+import struct
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+CODEC_VERSION = 1
+
+_HEADER = struct.Struct("<BBI")
+_SCALE = struct.Struct("<f")
+
+# 类型名称 -> (类型编码, numpy类型)
+_DTYPES = {
+    "float32": (0, np.dtype("<f4")),
+    "float16": (1, np.dtype("<f2")),
+    "int8": (2, np.dtype("i1")),
+}
+_DTYPE_BY_CODE = {code: (name, dtype) for name, (code, dtype) in _DTYPES.items()}
+
+
+def embedding_cache_key(model: str, text: str) -> str:
+    """生成嵌入缓存键(模型+文本的哈希, 避免把原文放进键里)."""
+    digest = hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+    return f"embedding:v{CODEC_VERSION}:{digest}"
+
+
+def encode_embedding(
+    embedding: Sequence[float],
+    dtype: str = "float32",
+) -> bytes:
+    """将嵌入向量编码为紧凑的二进制格式."""
+    if dtype not in _DTYPES:
+        raise ValueError(f"不支持的嵌入缓存类型: {dtype}")
+    code, np_dtype = _DTYPES[dtype]
+    vector = np.asarray(embedding, dtype=np.float32)
+    header = _HEADER.pack(CODEC_VERSION, code, vector.shape[0])
+
+    if dtype == "int8":
+        peak = float(np.max(np.abs(vector))) if vector.size else 0.0
+        scale = peak / 127.0 if peak > 0 else 1.0
+        quantized = np.clip(np.rint(vector / scale), -127, 127).astype(np_dtype)
+        return header + _SCALE.pack(scale) + quantized.tobytes()
+
+    return header + vector.astype(np_dtype).tobytes()
+
+
+def decode_embedding(data: bytes) -> Optional[List[float]]:
+    """解码嵌入向量, 版本或格式不符时返回None(视为缓存未命中)."""
+    if not data or len(data) < _HEADER.size:
+        return None
+    version, code, dim = _HEADER.unpack_from(data)
+    if version != CODEC_VERSION or code not in _DTYPE_BY_CODE:
+        return None
+    name, np_dtype = _DTYPE_BY_CODE[code]
+    offset = _HEADER.size
+
+    scale = 1.0
+    if name == "int8":
+        (scale,) = _SCALE.unpack_from(data, offset)
+        offset += _SCALE.size
+
+    if len(data) - offset != dim * np_dtype.itemsize:
+        return None
+    vector = np.frombuffer(data, dtype=np_dtype, count=dim, offset=offset)
+    if name == "int8":
+        return (vector.astype(np.float32) * np.float32(scale)).tolist()
+    return vector.astype(np.float32).tolist()
@@ -9,6 +9,7 @@ from scriptai.core.logging import setup_logging
 from scriptai.core.middleware import setup_middleware
 from scriptai.core.openai import openai_client
 from scriptai.core.redis import redis_client
+from scriptai.services.rag.jobs import ingest_jobs
 from scriptai.services.rag.service import rag_service
 
 
@@ -50,12 +51,14 @@ def create_app() -> FastAPI:
         """应用启动时的事件处理."""
         await redis_client.init()
         await rag_service.initialize()
+        await ingest_jobs.start(settings.RAG_INGEST_JOB_WORKERS)
 
     @app.on_event("shutdown")
     async def shutdown_event() -> None:
         """应用关闭时的事件处理."""
+        await ingest_jobs.stop()
         await redis_client.close()
         await openai_client.close()
         await rag_service.close()
 
-    return app 
\ No newline at end of file
+    return app
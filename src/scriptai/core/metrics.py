@@ -91,12 +91,111 @@ ai_request_duration_seconds = Histogram(
     ["operation"],
 )
 
+ai_time_to_first_token_seconds = Histogram(
+    "ai_time_to_first_token_seconds",
+    "Time from request to first streamed token in seconds",
+    ["model"],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0),
+)
+
+ai_embedding_batch_duration_seconds = Histogram(
+    "ai_embedding_batch_duration_seconds",
+    "Embedding batch request duration in seconds",
+    ["model"],
+)
+
+ai_embedding_cache_total = Counter(
+    "ai_embedding_cache_total",
+    "Total number of embedding cache lookups",
+    ["model", "result"],
+)
+
+ai_embedding_microbatch_fill_ratio = Histogram(
+    "ai_embedding_microbatch_fill_ratio",
+    "Query embedding micro-batch size relative to the batch size cap",
+    ["backend"],
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+)
+
 ai_tokens_total = Counter(
     "ai_tokens_total",
     "Total number of tokens used",
     ["operation", "model"],
 )
 
+ai_rate_limit = Gauge(
+    "ai_rate_limit",
+    "Current adaptive limits of AI requests",
+    ["limiter", "kind"],
+)
+
+ai_rate_limit_queue_depth = Gauge(
+    "ai_rate_limit_queue_depth",
+    "Number of AI requests waiting for admission",
+    ["limiter", "priority"],
+)
+
+ai_rate_limit_wait_seconds = Histogram(
+    "ai_rate_limit_wait_seconds",
+    "Time AI requests waited for admission in seconds",
+    ["limiter", "priority"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+ai_rate_limited_total = Counter(
+    "ai_rate_limited_total",
+    "Total number of rate limited (429) AI responses",
+    ["limiter"],
+)
+
+ai_singleflight_total = Counter(
+    "ai_singleflight_total",
+    "Total number of coalesced AI call keys by who computed the result",
+    ["name", "result"],
+)
+
+# RAG指标
+rag_semantic_cache_total = Counter(
+    "rag_semantic_cache_total",
+    "Total number of semantic answer cache lookups",
+    ["result"],
+)
+
+rag_semantic_cache_size = Gauge(
+    "rag_semantic_cache_size",
+    "Current number of semantic answer cache entries",
+)
+
+rag_ingest_chunks_total = Counter(
+    "rag_ingest_chunks_total",
+    "Total number of ingested chunks",
+    ["result"],
+)
+
+rag_ingest_jobs_total = Counter(
+    "rag_ingest_jobs_total",
+    "Total number of background ingest jobs by status",
+    ["status"],
+)
+
+rag_ingest_job_duration_seconds = Histogram(
+    "rag_ingest_job_duration_seconds",
+    "Background ingest job duration in seconds",
+    ["status"],
+)
+
+rag_vector_delete_total = Counter(
+    "rag_vector_delete_total",
+    "Total number of vectors deleted from the vector store",
+    ["partition"],
+)
+
+rag_vector_delete_duration_seconds = Histogram(
+    "rag_vector_delete_duration_seconds",
+    "Vector store filtered delete duration in seconds",
+    ["result"],
+)
+
 # 系统指标
 system_memory_bytes = Gauge(
     "system_memory_bytes",
@@ -113,4 +212,4 @@ system_disk_usage_bytes = Gauge(
     "system_disk_usage_bytes",
     "System disk usage in bytes",
     ["path"],
-) 
\ No newline at end of file
+)
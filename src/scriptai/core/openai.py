@@ -1,7 +1,22 @@
 """OpenAI服务模块."""
-import asyncio
-from typing import Any, Dict, List, Optional
+import hashlib
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import Enum
+from functools import partial
+from typing import (
+    Any,
+    AsyncContextManager,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
 
+import httpx
 import openai
 from loguru import logger
 from openai import AsyncOpenAI
@@ -13,7 +28,69 @@ from tenacity import (
 )
 
 from scriptai.config import settings
+from scriptai.core import metrics
+from scriptai.core.codec import decode_embedding, embedding_cache_key, encode_embedding
+from scriptai.core.quota import token_quota
+from scriptai.core.ratelimit import AdaptiveRateLimiter, Permit
 from scriptai.core.redis import redis_client
+from scriptai.core.singleflight import SingleFlight
+from scriptai.core.tokens import token_counter
+
+
+class Priority(str, Enum):
+    """LLM请求的优先级类别."""
+
+    # 用户正在等待结果, 如写作建议、问答
+    INTERACTIVE = "interactive"
+    # 不阻塞用户的后台处理, 如单篇知识入库
+    BACKGROUND = "background"
+    # 批量导入
+    BATCH = "batch"
+
+
+# 当前调用链的优先级, 未设置时视为交互请求; 创建的子任务继承该值
+_priority: ContextVar[Priority] = ContextVar(
+    "llm_priority", default=Priority.INTERACTIVE
+)
+
+
+@contextmanager
+def llm_priority(priority: Union[Priority, str]) -> Iterator[None]:
+    """在代码块(及其中创建的任务)内以指定优先级发送LLM请求."""
+    token = _priority.set(Priority(priority))
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> Priority:
+    """当前调用链的优先级."""
+    return _priority.get()
+
+
+# 当前调用链所属的用户, 用于公平排队和token额度; 系统任务为None
+_user: ContextVar[Optional[str]] = ContextVar("llm_user", default=None)
+
+
+@contextmanager
+def llm_user(user_id: Optional[Union[int, str]]) -> Iterator[None]:
+    """在代码块(及其中创建的任务)内以指定用户的名义发送LLM请求."""
+    token = _user.set(None if user_id is None else str(user_id))
+    try:
+        yield
+    finally:
+        _user.reset(token)
+
+
+def set_llm_user(user_id: Optional[Union[int, str]]) -> None:
+    """设置当前请求(任务)剩余部分所属的用户, 供请求依赖项使用."""
+    _user.set(None if user_id is None else str(user_id))
+
+
+def current_user_id() -> Optional[str]:
+    """当前调用链所属的用户."""
+    return _user.get()
 
 
 class OpenAIClient:
@@ -22,7 +99,37 @@ class OpenAIClient:
     def __init__(self) -> None:
         """初始化OpenAI客户端."""
         self._client: Optional[AsyncOpenAI] = None
-        self._semaphore = asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENT)
+        # 补全与嵌入在OpenAI侧分模型限额, 各用一个限流器;
+        # 排队的请求按优先级类别加权公平准入
+        self._completion_limiter = AdaptiveRateLimiter(
+            "completion",
+            requests_per_minute=settings.OPENAI_RPM_LIMIT,
+            tokens_per_minute=settings.OPENAI_TPM_LIMIT,
+            max_concurrency=settings.OPENAI_MAX_CONCURRENT,
+            min_concurrency=settings.OPENAI_MIN_CONCURRENT,
+            weights=settings.OPENAI_PRIORITY_WEIGHTS,
+        )
+        self._embedding_limiter = AdaptiveRateLimiter(
+            "embedding",
+            requests_per_minute=settings.OPENAI_EMBEDDING_RPM_LIMIT,
+            tokens_per_minute=settings.OPENAI_EMBEDDING_TPM_LIMIT,
+            max_concurrency=settings.OPENAI_MAX_CONCURRENT,
+            min_concurrency=settings.OPENAI_MIN_CONCURRENT,
+            weights=settings.OPENAI_PRIORITY_WEIGHTS,
+        )
+        # 缓存未命中的相同请求只调用一次API, 跨副本以Redis短锁协调
+        self._completion_flight = SingleFlight(
+            "completion",
+            lock_ttl=settings.OPENAI_SINGLEFLIGHT_LOCK_TTL,
+            wait_timeout=settings.OPENAI_SINGLEFLIGHT_WAIT_TIMEOUT,
+            poll_interval=settings.OPENAI_SINGLEFLIGHT_POLL_INTERVAL,
+        )
+        self._embedding_flight = SingleFlight(
+            "embedding",
+            lock_ttl=settings.OPENAI_SINGLEFLIGHT_LOCK_TTL,
+            wait_timeout=settings.OPENAI_SINGLEFLIGHT_WAIT_TIMEOUT,
+            poll_interval=settings.OPENAI_SINGLEFLIGHT_POLL_INTERVAL,
+        )
 
     @property
     def client(self) -> AsyncOpenAI:
@@ -33,9 +140,79 @@ class OpenAIClient:
                 base_url=settings.OPENAI_API_BASE,
                 max_retries=settings.OPENAI_MAX_RETRIES,
                 timeout=settings.OPENAI_TIMEOUT,
+                # SDK内部重试的429也经过钩子, 限流器能看到每一次响应
+                http_client=httpx.AsyncClient(
+                    follow_redirects=True,
+                    event_hooks={"response": [self._observe_response]},
+                ),
             )
         return self._client
 
+    def _limiter_for(self, path: str) -> AdaptiveRateLimiter:
+        """按请求路径选择限流器."""
+        if path.endswith("/embeddings"):
+            return self._embedding_limiter
+        return self._completion_limiter
+
+    async def _observe_response(self, response: httpx.Response) -> None:
+        """读取响应头中的限流信息, 429时收缩并发."""
+        limiter = self._limiter_for(response.request.url.path)
+        if response.status_code == 429:
+            limiter.on_rate_limited(response.headers)
+        else:
+            limiter.update(response.headers)
+
+    @staticmethod
+    def _completion_tokens(
+        prompt: str,
+        system_prompt: Optional[str],
+        kwargs: Dict[str, Any],
+    ) -> int:
+        """估计补全请求计入TPM的token数(输入+最大输出)."""
+        max_tokens = (
+            kwargs.get("max_tokens") or settings.OPENAI_COMPLETION_TOKENS_ESTIMATE
+        )
+        return (
+            token_counter.count(prompt)
+            + token_counter.count(system_prompt or "")
+            + int(max_tokens)  # type: ignore[call-overload]
+        )
+
+    @staticmethod
+    def _count_tokens(
+        prompt: str,
+        system_prompt: Optional[str],
+        completion: Optional[str],
+    ) -> int:
+        """本地计数补全请求实际使用的token数(输入+输出)."""
+        return (
+            token_counter.count(prompt)
+            + token_counter.count(system_prompt or "")
+            + token_counter.count(completion or "")
+        )
+
+    @staticmethod
+    def _usage(response: Any) -> Optional[int]:
+        """响应中的实际token用量."""
+        usage = getattr(response, "usage", None)
+        return getattr(usage, "total_tokens", None)
+
+    @staticmethod
+    def _acquire(
+        limiter: AdaptiveRateLimiter,
+        tokens: int,
+    ) -> AsyncContextManager[Permit]:
+        """按当前调用链的优先级和用户排队准入."""
+        return limiter.acquire(tokens, current_priority().value, current_user_id())
+
+    @staticmethod
+    async def _record_usage(operation: str, model: str, tokens: int) -> None:
+        """记录token用量指标, 并计入当前用户的额度."""
+        metrics.ai_tokens_total.labels(operation=operation, model=model).inc(tokens)
+        user_id = current_user_id()
+        if user_id is not None:
+            await token_quota.record(user_id, tokens)
+
     async def _get_cache(self, key: str) -> Optional[str]:
         """获取缓存."""
         if not settings.OPENAI_ENABLE_CACHE:
@@ -52,44 +229,153 @@ class OpenAIClient:
             expire=settings.OPENAI_CACHE_TTL,
         )
 
+    async def _get_cache_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        """批量获取二进制缓存(单次往返)."""
+        if not settings.OPENAI_ENABLE_CACHE:
+            return [None] * len(keys)
+        return await redis_client.mget(keys, binary=True)
+
+    async def _set_cache_many(self, mapping: Dict[str, bytes]) -> None:
+        """批量设置二进制缓存(单次管道往返)."""
+        if not settings.OPENAI_ENABLE_CACHE:
+            return
+        await redis_client.mset(
+            mapping,
+            expire=settings.OPENAI_CACHE_TTL,
+            binary=True,
+        )
+
     @retry(
         retry=retry_if_exception_type(openai.RateLimitError),
         wait=wait_exponential(multiplier=1, min=4, max=60),
         stop=stop_after_attempt(5),
     )
+    async def _embed_batch(
+        self,
+        texts: List[str],
+        model: str,
+    ) -> List[List[float]]:
+        """以单个多输入请求生成一批嵌入."""
+        tokens = sum(token_counter.count(text) for text in texts)
+        async with self._acquire(self._embedding_limiter, tokens) as permit:
+            response = await self.client.embeddings.create(
+                model=model,
+                input=texts,
+            )
+            permit.used = self._usage(response)
+        await self._record_usage("embedding", model, permit.used or tokens)
+        # 按index排序, 保证与输入顺序一致
+        return [
+            item.embedding
+            for item in sorted(response.data, key=lambda item: item.index)
+        ]
+
+    async def _embed_and_cache(
+        self,
+        texts: Dict[str, str],
+        model: str,
+        keys: List[str],
+    ) -> List[List[float]]:
+        """为缓存键对应的文本生成嵌入, 并通过一次管道写回缓存."""
+        fresh = await self._embed_batch([texts[key] for key in keys], model)
+        await self._set_cache_many(
+            {
+                key: encode_embedding(
+                    embedding,
+                    settings.OPENAI_EMBEDDING_CACHE_DTYPE,
+                )
+                for key, embedding in zip(keys, fresh)
+            }
+        )
+        return fresh
+
+    async def _load_embeddings(
+        self,
+        keys: List[str],
+    ) -> List[Optional[List[float]]]:
+        """读取其他副本写入的嵌入缓存."""
+        cached = await self._get_cache_many(keys)
+        return [decode_embedding(value) if value else None for value in cached]
+
     async def create_embeddings(
         self,
         texts: List[str],
         model: str = settings.OPENAI_EMBEDDING_MODEL,
     ) -> List[List[float]]:
-        """创建文本嵌入."""
-        async with self._semaphore:
-            embeddings = []
-            for i in range(0, len(texts), settings.OPENAI_BATCH_SIZE):
-                batch = texts[i : i + settings.OPENAI_BATCH_SIZE]
-                batch_embeddings = []
-
-                for text in batch:
-                    # 尝试从缓存获取
-                    cache_key = f"embedding:{model}:{text}"
-                    if cached := await self._get_cache(cache_key):
-                        batch_embeddings.append(eval(cached))
-                        continue
-
-                    # 调用API
-                    response = await self.client.embeddings.create(
-                        model=model,
-                        input=text,
-                    )
-                    embedding = response.data[0].embedding
+        """创建文本嵌入.
+
+        每批先用一次MGET查缓存, 只把未命中的文本合并成一个请求发送,
+        结果再通过一次管道写回缓存. 并发请求中相同的文本只生成一次.
+        """
+        embeddings: List[List[float]] = []
+        for i in range(0, len(texts), settings.OPENAI_BATCH_SIZE):
+            batch = texts[i : i + settings.OPENAI_BATCH_SIZE]
+            begin_time = time.perf_counter()
 
-                    # 设置缓存
-                    await self._set_cache(cache_key, str(embedding))
-                    batch_embeddings.append(embedding)
+            # 批量查询缓存
+            cache_keys = [embedding_cache_key(model, text) for text in batch]
+            cached = await self._get_cache_many(cache_keys)
+            batch_embeddings: List[Optional[List[float]]] = [
+                decode_embedding(value) if value else None for value in cached
+            ]
+            misses = [
+                index
+                for index, embedding in enumerate(batch_embeddings)
+                if embedding is None
+            ]
+            metrics.ai_embedding_cache_total.labels(
+                model=model,
+                result="hit",
+            ).inc(len(batch) - len(misses))
+            metrics.ai_embedding_cache_total.labels(
+                model=model,
+                result="miss",
+            ).inc(len(misses))
+
+            # 未命中的文本合并为一个请求, 其他调用者正在计算的文本等待其结果
+            if misses:
+                fresh = await self._embedding_flight.do_many(
+                    [cache_keys[index] for index in misses],
+                    partial(
+                        self._embed_and_cache,
+                        {cache_keys[index]: batch[index] for index in misses},
+                        model,
+                    ),
+                    self._load_embeddings if settings.OPENAI_ENABLE_CACHE else None,
+                )
+                for index, embedding in zip(misses, fresh):
+                    batch_embeddings[index] = embedding
 
-                embeddings.extend(batch_embeddings)
+            metrics.ai_embedding_batch_duration_seconds.labels(
+                model=model,
+            ).observe(time.perf_counter() - begin_time)
+            embeddings.extend(batch_embeddings)  # type: ignore[arg-type]
+
+        return embeddings
 
-            return embeddings
+    @staticmethod
+    def _build_messages(
+        prompt: str,
+        system_prompt: Optional[str] = None,
+    ) -> List[Dict[str, str]]:
+        """构建对话消息."""
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    @staticmethod
+    def _completion_cache_key(
+        model: str,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+    ) -> str:
+        """生成补全缓存键, 系统提示词(含检索上下文)参与区分."""
+        if not system_prompt:
+            return f"completion:{model}:{prompt}"
+        digest = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+        return f"completion:{model}:{digest}:{prompt}"
 
     @retry(
         retry=retry_if_exception_type(openai.RateLimitError),
@@ -100,26 +386,112 @@ class OpenAIClient:
         self,
         prompt: str,
         model: str = "gpt-4-turbo-preview",
+        system_prompt: Optional[str] = None,
         **kwargs: Dict[str, Any],
     ) -> str:
-        """创建文本补全."""
-        async with self._semaphore:
-            # 尝试从缓存获取
-            cache_key = f"completion:{model}:{prompt}"
-            if cached := await self._get_cache(cache_key):
-                return cached
-
-            # 调用API
+        """创建文本补全.
+
+        缓存未命中时, 并发的相同请求(含其他副本)只调用一次API, 其余等待
+        其结果.
+        """
+        # 尝试从缓存获取, 命中时不占用限流额度
+        cache_key = self._completion_cache_key(model, prompt, system_prompt)
+        if cached := await self._get_cache(cache_key):
+            return cached
+
+        return await self._completion_flight.do(
+            cache_key,
+            partial(
+                self._complete,
+                cache_key,
+                prompt,
+                model,
+                system_prompt,
+                kwargs,
+            ),
+            self._get_cache if settings.OPENAI_ENABLE_CACHE else None,
+        )
+
+    async def _complete(
+        self,
+        cache_key: str,
+        prompt: str,
+        model: str,
+        system_prompt: Optional[str],
+        kwargs: Dict[str, Any],
+    ) -> str:
+        """调用API生成补全并写入缓存."""
+        tokens = self._completion_tokens(prompt, system_prompt, kwargs)
+        async with self._acquire(self._completion_limiter, tokens) as permit:
             response = await self.client.chat.completions.create(
                 model=model,
-                messages=[{"role": "user", "content": prompt}],
+                messages=self._build_messages(prompt, system_prompt),
+                **kwargs,
+            )
+            permit.used = self._usage(response)
+        completion = response.choices[0].message.content
+        await self._record_usage(
+            "completion",
+            model,
+            permit.used or self._count_tokens(prompt, system_prompt, completion),
+        )
+
+        # 设置缓存
+        await self._set_cache(cache_key, completion)
+        return completion
+
+    async def create_completion_stream(
+        self,
+        prompt: str,
+        model: str = "gpt-4-turbo-preview",
+        system_prompt: Optional[str] = None,
+        **kwargs: Dict[str, Any],
+    ) -> AsyncIterator[str]:
+        """流式创建文本补全, 逐段产出生成的文本.
+
+        命中缓存时一次性产出完整结果; 否则边接收边产出, 结束后写入缓存,
+        与非流式接口共用同一缓存.
+        """
+        cache_key = self._completion_cache_key(model, prompt, system_prompt)
+        if cached := await self._get_cache(cache_key):
+            yield cached
+            return
+
+        tokens = self._completion_tokens(prompt, system_prompt, kwargs)
+        async with self._acquire(self._completion_limiter, tokens):
+            begin_time = time.perf_counter()
+            stream = await self.client.chat.completions.create(
+                model=model,
+                messages=self._build_messages(prompt, system_prompt),
+                stream=True,
                 **kwargs,
             )
-            completion = response.choices[0].message.content
 
-            # 设置缓存
+            parts: List[str] = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                token = chunk.choices[0].delta.content
+                if not token:
+                    continue
+                if not parts:
+                    metrics.ai_time_to_first_token_seconds.labels(
+                        model=model,
+                    ).observe(time.perf_counter() - begin_time)
+                parts.append(token)
+                yield token
+
+        # 流式响应不含用量, 按本地计数记录
+        completion = "".join(parts)
+        await self._record_usage(
+            "completion_stream",
+            model,
+            self._count_tokens(prompt, system_prompt, completion),
+        )
+
+        # 设置缓存
+        if parts:
             await self._set_cache(cache_key, completion)
-            return completion
 
     async def close(self) -> None:
         """关闭客户端."""
@@ -129,4 +501,4 @@ class OpenAIClient:
 
 
 # 创建全局OpenAI客户端实例
-openai_client = OpenAIClient() 
\ No newline at end of file
+openai_client = OpenAIClient()
@@ -0,0 +1,118 @@
+"""AI调用token额度模块.
+
+按用户统计滚动时间窗口内的token用量, 采用滑动窗口计数: 每个窗口一个
+Redis计数器, 当前用量 = 本窗口计数 + 上一窗口计数 * 上一窗口仍在滑动窗口
+内的比例. 检查只读两个计数器(一次MGET), 记录为一次INCRBY+EXPIRE管道,
+都与用户的请求数无关.
+"""
+import time
+from typing import Optional, Tuple
+
+from loguru import logger
+
+from scriptai.config import settings
+from scriptai.core.redis import redis_client
+
+
+class QuotaExceededError(Exception):
+    """token额度已用完."""
+
+    def __init__(self, usage: int, limit: int, retry_after: float) -> None:
+        """初始化异常.
+
+        Args:
+            usage: 当前滚动窗口内的用量
+            limit: 额度
+            retry_after: 预计用量回落到额度以下所需的秒数
+        """
+        super().__init__(f"AI调用额度已用完: {usage}/{limit} tokens")
+        self.usage = usage
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+class TokenQuota:
+    """按用户的滚动token额度."""
+
+    def __init__(
+        self,
+        limit: int = settings.AI_TOKEN_QUOTA,
+        window: int = settings.AI_TOKEN_QUOTA_WINDOW,
+        prefix: str = "quota:tokens",
+    ) -> None:
+        """初始化额度.
+
+        Args:
+            limit: 每个滚动窗口内的token额度, 0表示不限制
+            window: 滚动窗口长度(秒)
+            prefix: Redis键前缀
+        """
+        self.limit = limit
+        self.window = window
+        self.prefix = prefix
+
+    def _keys(self, user_id: str, now: float) -> Tuple[str, str, float]:
+        """本窗口和上一窗口的计数键, 以及本窗口已过去的比例."""
+        bucket, elapsed = divmod(now, self.window)
+        return (
+            f"{self.prefix}:{user_id}:{int(bucket)}",
+            f"{self.prefix}:{user_id}:{int(bucket) - 1}",
+            elapsed / self.window,
+        )
+
+    async def _read(self, user_id: str, now: float) -> Tuple[int, int, float]:
+        """读取(本窗口计数, 上一窗口计数, 本窗口已过去的比例), 一次往返."""
+        current_key, previous_key, fraction = self._keys(user_id, now)
+        values = await redis_client.mget([current_key, previous_key])
+        current, previous = (int(value or 0) for value in values)
+        return current, previous, fraction
+
+    async def usage(self, user_id: str, now: Optional[float] = None) -> int:
+        """用户当前滚动窗口内的用量."""
+        now = time.time() if now is None else now
+        current, previous, fraction = await self._read(user_id, now)
+        return current + int(previous * (1 - fraction))
+
+    async def check(self, user_id: str, now: Optional[float] = None) -> None:
+        """检查额度, 用完时抛出QuotaExceededError; Redis不可用时放行."""
+        if not self.limit:
+            return
+        now = time.time() if now is None else now
+        try:
+            current, previous, fraction = await self._read(user_id, now)
+        except Exception as e:
+            logger.warning(f"读取token用量失败: {e}")
+            return
+        usage = current + int(previous * (1 - fraction))
+        if usage < self.limit:
+            return
+
+        # 上一窗口的计数随窗口滑动线性退出; 本窗口已超额时要等它成为上一窗口
+        if current < self.limit:
+            wait = (1 - (self.limit - current) / previous) - fraction
+        else:
+            wait = (1 - fraction) + (1 - self.limit / current)
+        raise QuotaExceededError(usage, self.limit, max(wait, 0.0) * self.window)
+
+    async def record(
+        self,
+        user_id: str,
+        tokens: int,
+        now: Optional[float] = None,
+    ) -> None:
+        """记录用户使用的token数, 失败时只记日志."""
+        if not self.limit or tokens <= 0:
+            return
+        now = time.time() if now is None else now
+        current_key, _, _ = self._keys(user_id, now)
+        try:
+            async with redis_client.client.pipeline(transaction=False) as pipe:
+                pipe.incrby(current_key, tokens)
+                pipe.expire(current_key, self.window * 2)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"记录token用量失败: {e}")
+
+
+# 创建全局token额度实例
+token_quota = TokenQuota()
@@ -0,0 +1,378 @@
+"""自适应限流模块.
+
+按每分钟请求数(RPM)和token数(TPM)两个令牌桶准入请求, 并发上限按AIMD调整:
+每个成功请求使上限增加1/上限(约每轮满并发加1), 遇到429时乘以backoff.
+响应头中的账户限额和剩余额度用于校正令牌桶, 多个副本共用同一账户时
+各自的桶也能跟上实际余量. 等待准入的请求按优先级类别加权公平排队,
+同一类别内按用户轮转.
+"""
+import asyncio
+import re
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Hashable, Mapping, Optional
+
+from scriptai.core import metrics
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+# 429响应未给出等待时间时暂停准入的秒数
+DEFAULT_RETRY_AFTER = 1.0
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """解析限流响应头中的时长("20ms"、"1.5s"、"6m0s"或秒数), 单位秒."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _UNITS[unit] for number, unit in parts)
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    """解析整数响应头."""
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+class _Bucket:
+    """按分钟额度匀速补充的令牌桶, 容量为0时不限制."""
+
+    def __init__(self, per_minute: int) -> None:
+        self.configured = max(per_minute, 0)
+        self.capacity = float(self.configured)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        """按流逝时间补充令牌."""
+        if self.capacity:
+            elapsed = now - self.updated
+            self.level = min(self.capacity, self.level + elapsed * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """取出amount个令牌前需等待的秒数."""
+        if not self.capacity:
+            return 0.0
+        self.refill(now)
+        # 超过容量的请求按容量计, 否则永远无法准入
+        deficit = min(amount, self.capacity) - self.level
+        return max(deficit, 0.0) * 60 / self.capacity
+
+    def take(self, amount: float) -> None:
+        """取出令牌."""
+        if self.capacity:
+            self.level -= min(amount, self.capacity)
+
+    def refund(self, amount: float) -> None:
+        """退回预估多扣的令牌; amount为负时补扣."""
+        if self.capacity:
+            self.level = min(self.capacity, self.level + amount)
+
+    def set_limit(self, per_minute: int) -> None:
+        """以响应头中的账户限额更新容量, 配置值更低时以配置为准."""
+        capacity = float(
+            min(per_minute, self.configured) if self.configured else per_minute
+        )
+        if capacity > 0 and capacity != self.capacity:
+            # 首次得知限额时桶视为满, 之后由剩余额度校正
+            self.level = min(self.level, capacity) if self.capacity else capacity
+            self.capacity = capacity
+
+    def set_remaining(self, remaining: int) -> None:
+        """以服务端剩余额度校正桶内令牌."""
+        if self.capacity:
+            self.level = min(self.level, float(remaining))
+
+
+class WeightedFairQueue:
+    """按权重在多个类别间分配准入顺序.
+
+    采用虚拟时间(stride)调度: 各类别都有请求排队时, 准入次数与权重成正比;
+    空闲的类别重新到达时从当前虚拟时间起算, 不会积攒额度一次性插队.
+    同一类别内的请求按流(如用户)分组轮转, 每轮每个流准入一个请求,
+    同一流内按到达顺序, 一个流排再多请求也不会挤占其他流.
+    """
+
+    def __init__(self, weights: Mapping[str, float]) -> None:
+        """初始化队列.
+
+        Args:
+            weights: 类别 -> 权重, 第一个类别为未指定类别时的默认类别
+        """
+        self.weights = {key: float(weight) for key, weight in weights.items()}
+        if not self.weights or min(self.weights.values()) <= 0:
+            raise ValueError("优先级权重必须为正数")
+        self.default = next(iter(self.weights))
+        # 类别 -> 流 -> 等待中的请求, 流的顺序即轮转顺序
+        self._waiters: Dict[
+            str, "OrderedDict[Optional[Hashable], Deque[asyncio.Future]]"
+        ] = {key: OrderedDict() for key in self.weights}
+        self._finish = {key: 0.0 for key in self.weights}
+        self._virtual = 0.0
+        self._busy = False
+
+    def resolve(self, key: Optional[str]) -> str:
+        """校验类别, None表示默认类别."""
+        if key is None:
+            return self.default
+        if key not in self.weights:
+            raise ValueError(f"未知的优先级: {key}")
+        return key
+
+    def depth(self, key: str) -> int:
+        """类别中排队的请求数."""
+        return sum(len(waiters) for waiters in self._waiters[key].values())
+
+    @asynccontextmanager
+    async def turn(
+        self,
+        key: str,
+        flow: Optional[Hashable] = None,
+    ) -> AsyncIterator[None]:
+        """等待轮到key类别中flow流的请求, 退出时交给下一个请求."""
+        if self._busy:
+            future = asyncio.get_running_loop().create_future()
+            flows = self._waiters[key]
+            flows.setdefault(flow, deque()).append(future)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # 已轮到但被取消, 交给下一个请求
+                    self._wake()
+                else:
+                    flows[flow].remove(future)
+                    if not flows[flow]:
+                        del flows[flow]
+                raise
+        else:
+            self._busy = True
+            self._charge(key)
+        try:
+            yield
+        finally:
+            self._wake()
+
+    def _charge(self, key: str) -> None:
+        """记一次准入: 类别的虚拟完成时间前进1/权重."""
+        start = max(self._finish[key], self._virtual)
+        self._virtual = start
+        self._finish[key] = start + 1 / self.weights[key]
+
+    def _wake(self) -> None:
+        """唤醒虚拟开始时间最早的类别(相同时权重大的优先)中轮到的流."""
+        candidates = [key for key, waiters in self._waiters.items() if waiters]
+        if not candidates:
+            self._busy = False
+            return
+        key = min(
+            candidates,
+            key=lambda key: (
+                max(self._finish[key], self._virtual),
+                -self.weights[key],
+            ),
+        )
+        self._charge(key)
+        flows = self._waiters[key]
+        flow, waiters = next(iter(flows.items()))
+        future = waiters.popleft()
+        if waiters:
+            flows.move_to_end(flow)
+        else:
+            del flows[flow]
+        future.set_result(None)
+
+
+class Permit:
+    """一次准入的凭证, 调用方可填入实际使用的token数."""
+
+    __slots__ = ("tokens", "used")
+
+    def __init__(self, tokens: int) -> None:
+        self.tokens = tokens
+        self.used: Optional[int] = None
+
+
+class AdaptiveRateLimiter:
+    """按RPM/TPM准入、并发上限AIMD自适应的限流器.
+
+    同一时刻只有一个请求(队首)等待额度和并发名额, 其余请求在加权公平
+    队列中排队; 同一类别内按流(用户)轮转, 同一流内按到达顺序,
+    大请求不会被后来的小请求饿死.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_concurrency: int = 5,
+        min_concurrency: int = 1,
+        backoff: float = 0.5,
+        cooldown: float = 1.0,
+        weights: Optional[Mapping[str, float]] = None,
+    ) -> None:
+        """初始化限流器.
+
+        Args:
+            name: 限流器名称(指标标签)
+            requests_per_minute: 每分钟请求数上限, 0表示只按响应头学习
+            tokens_per_minute: 每分钟token数上限, 0表示只按响应头学习
+            max_concurrency: 并发上限的最大值, 也是初始值
+            min_concurrency: 并发上限的最小值
+            backoff: 遇到429时并发上限的乘数
+            cooldown: 两次乘性减之间的最短间隔(秒), 同一波429只减一次
+            weights: 优先级类别 -> 权重, 默认只有一个类别
+        """
+        self.name = name
+        self.max_concurrency = max(max_concurrency, 1)
+        self.min_concurrency = min(max(min_concurrency, 1), self.max_concurrency)
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.concurrency = float(self.max_concurrency)
+        self.in_flight = 0
+        self._requests = _Bucket(requests_per_minute)
+        self._tokens = _Bucket(tokens_per_minute)
+        self._blocked_until = 0.0
+        self._last_decrease = float("-inf")
+        self._queue = WeightedFairQueue(weights or {"default": 1.0})
+        self._waiting = {key: 0 for key in self._queue.weights}
+        self._released = asyncio.Event()
+        for key in self._waiting:
+            self._export(key)
+
+    @property
+    def limit(self) -> int:
+        """当前并发上限."""
+        return max(self.min_concurrency, int(self.concurrency))
+
+    @property
+    def waiting(self) -> int:
+        """等待准入的请求数."""
+        return sum(self._waiting.values())
+
+    @asynccontextmanager
+    async def acquire(
+        self,
+        tokens: int = 0,
+        priority: Optional[str] = None,
+        flow: Optional[Hashable] = None,
+    ) -> AsyncIterator[Permit]:
+        """按优先级类别和流等待准入, 退出时释放; 正常退出视为成功, 用于加性增."""
+        await self._admit(tokens, self._queue.resolve(priority), flow)
+        permit = Permit(tokens)
+        try:
+            yield permit
+        except BaseException:
+            self._release(permit, success=False)
+            raise
+        self._release(permit, success=True)
+
+    async def _admit(
+        self,
+        tokens: int,
+        priority: str,
+        flow: Optional[Hashable],
+    ) -> None:
+        """排到队首后等待并发和额度都满足, 扣除额度."""
+        begin_time = time.perf_counter()
+        self._waiting[priority] += 1
+        self._export(priority)
+        try:
+            async with self._queue.turn(priority, flow):
+                while True:
+                    now = time.monotonic()
+                    delay = max(
+                        self._blocked_until - now,
+                        self._requests.wait_time(1, now),
+                        self._tokens.wait_time(tokens, now),
+                    )
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                        continue
+                    if self.in_flight >= self.limit:
+                        self._released.clear()
+                        await self._released.wait()
+                        continue
+                    self._requests.take(1)
+                    self._tokens.take(tokens)
+                    self.in_flight += 1
+                    metrics.ai_rate_limit_wait_seconds.labels(
+                        limiter=self.name, priority=priority
+                    ).observe(time.perf_counter() - begin_time)
+                    return
+        finally:
+            self._waiting[priority] -= 1
+            self._export(priority)
+
+    def _release(self, permit: Permit, success: bool) -> None:
+        """释放并发名额, 按实际用量校正token桶."""
+        self.in_flight -= 1
+        if permit.used is not None:
+            self._tokens.refund(permit.tokens - permit.used)
+        if success:
+            self.concurrency = min(
+                float(self.max_concurrency), self.concurrency + 1 / self.concurrency
+            )
+        self._released.set()
+        self._export()
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        """根据响应头中的限额和剩余额度校正令牌桶."""
+        for bucket, kind in ((self._requests, "requests"), (self._tokens, "tokens")):
+            limit = _parse_int(headers.get(f"x-ratelimit-limit-{kind}"))
+            if limit:
+                bucket.set_limit(limit)
+            remaining = _parse_int(headers.get(f"x-ratelimit-remaining-{kind}"))
+            if remaining is not None:
+                bucket.refill(time.monotonic())
+                bucket.set_remaining(remaining)
+        self._export()
+
+    def on_rate_limited(self, headers: Mapping[str, str]) -> None:
+        """遇到429: 乘性减小并发上限, 并在建议的等待时间内暂停准入."""
+        metrics.ai_rate_limited_total.labels(limiter=self.name).inc()
+        now = time.monotonic()
+        if now - self._last_decrease >= self.cooldown:
+            self._last_decrease = now
+            self.concurrency = max(
+                float(self.min_concurrency), self.concurrency * self.backoff
+            )
+
+        retry_after = parse_duration(headers.get("retry-after-ms"))
+        retry_after = retry_after / 1000 if retry_after is not None else None
+        if retry_after is None:
+            retry_after = parse_duration(headers.get("retry-after"))
+        self._blocked_until = max(
+            self._blocked_until,
+            now + (DEFAULT_RETRY_AFTER if retry_after is None else retry_after),
+        )
+        self.update(headers)
+
+    def _export(self, priority: Optional[str] = None) -> None:
+        """导出当前限额和指定类别的排队数."""
+        metrics.ai_rate_limit.labels(limiter=self.name, kind="concurrency").set(
+            self.limit
+        )
+        metrics.ai_rate_limit.labels(limiter=self.name, kind="requests_per_minute").set(
+            self._requests.capacity
+        )
+        metrics.ai_rate_limit.labels(limiter=self.name, kind="tokens_per_minute").set(
+            self._tokens.capacity
+        )
+        if priority is not None:
+            metrics.ai_rate_limit_queue_depth.labels(
+                limiter=self.name, priority=priority
+            ).set(self._waiting[priority])
@@ -1,9 +1,9 @@
 """Redis客户端模块."""
-from typing import Any, Optional
+from typing import Any, Dict, List, Optional
 
 import redis.asyncio as redis
-from redis.asyncio.connection import ConnectionPool
 from redis.asyncio.client import Redis
+from redis.asyncio.connection import ConnectionPool
 
 from scriptai.config import settings
 
@@ -15,6 +15,9 @@ class RedisClient:
         """初始化Redis客户端."""
         self._pool: Optional[ConnectionPool] = None
         self._client: Optional[Redis] = None
+        # 二进制安全连接(不做解码), 用于存储嵌入向量等字节数据
+        self._binary_pool: Optional[ConnectionPool] = None
+        self._binary_client: Optional[Redis] = None
 
     async def init(self) -> None:
         """初始化Redis连接池."""
@@ -26,6 +29,13 @@ class RedisClient:
                 decode_responses=True,
                 encoding="utf-8",
             )
+        if not self._binary_pool:
+            self._binary_pool = redis.ConnectionPool(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                password=settings.REDIS_PASSWORD,
+                decode_responses=False,
+            )
 
     @property
     def client(self) -> Redis:
@@ -36,6 +46,15 @@ class RedisClient:
             self._client = redis.Redis(connection_pool=self._pool)
         return self._client
 
+    @property
+    def binary_client(self) -> Redis:
+        """获取二进制安全的Redis客户端."""
+        if not self._binary_client:
+            if not self._binary_pool:
+                raise RuntimeError("Redis client not initialized")
+            self._binary_client = redis.Redis(connection_pool=self._binary_pool)
+        return self._binary_client
+
     async def close(self) -> None:
         """关闭Redis连接."""
         if self._client:
@@ -44,6 +63,12 @@ class RedisClient:
         if self._pool:
             await self._pool.disconnect()
             self._pool = None
+        if self._binary_client:
+            await self._binary_client.close()
+            self._binary_client = None
+        if self._binary_pool:
+            await self._binary_pool.disconnect()
+            self._binary_pool = None
 
     async def get(self, key: str) -> Any:
         """获取键值."""
@@ -58,6 +83,28 @@ class RedisClient:
         """设置键值."""
         return await self.client.set(key, value, ex=expire)
 
+    async def mget(self, keys: List[str], binary: bool = False) -> List[Any]:
+        """批量获取键值."""
+        if not keys:
+            return []
+        client = self.binary_client if binary else self.client
+        return await client.mget(keys)
+
+    async def mset(
+        self,
+        mapping: Dict[str, Any],
+        expire: Optional[int] = None,
+        binary: bool = False,
+    ) -> None:
+        """批量设置键值(单次管道往返)."""
+        if not mapping:
+            return
+        client = self.binary_client if binary else self.client
+        async with client.pipeline(transaction=False) as pipe:
+            for key, value in mapping.items():
+                pipe.set(key, value, ex=expire)
+            await pipe.execute()
+
     async def delete(self, key: str) -> bool:
         """删除键值."""
         return bool(await self.client.delete(key))
@@ -74,6 +121,24 @@ class RedisClient:
         """获取键的剩余生存时间."""
         return await self.client.ttl(key)
 
+    async def sadd(self, key: str, members: List[str]) -> int:
+        """向集合添加成员."""
+        if not members:
+            return 0
+        return await self.client.sadd(key, *members)
+
+    async def srem(self, key: str, members: List[str]) -> int:
+        """从集合移除成员."""
+        if not members:
+            return 0
+        return await self.client.srem(key, *members)
+
+    async def smismember(self, key: str, members: List[str]) -> List[bool]:
+        """批量判断成员是否在集合中."""
+        if not members:
+            return []
+        return [bool(flag) for flag in await self.client.smismember(key, members)]
+
     async def incr(self, key: str) -> int:
         """递增键的值."""
         return await self.client.incr(key)
@@ -1,4 +1,5 @@
 """安全相关的工具函数."""
+import math
 from datetime import datetime, timedelta
 from functools import wraps
 from typing import Any, Callable, List, Optional, Union
@@ -10,6 +11,8 @@ from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from scriptai.config import settings
+from scriptai.core.openai import set_llm_user
+from scriptai.core.quota import QuotaExceededError, token_quota
 from scriptai.db.session import get_db
 from scriptai.models.user import User
 
@@ -106,6 +109,26 @@ async def get_current_active_user(
     return current_user
 
 
+async def get_current_ai_user(
+    current_user: User = Depends(get_current_active_user),
+) -> User:
+    """获取调用AI接口的当前用户.
+
+    检查用户的滚动token额度(一次Redis往返), 用完时返回429; 并把本次请求
+    后续的LLM调用归属到该用户, 用于按用户公平排队和计入用量.
+    """
+    try:
+        await token_quota.check(str(current_user.id))
+    except QuotaExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    set_llm_user(current_user.id)
+    return current_user
+
+
 async def get_current_active_superuser(
     current_user: User = Depends(get_current_user),
 ) -> User:
@@ -0,0 +1,260 @@
+"""请求合并(single-flight)模块.
+
+同一个键同时只计算一次: 进程内并发的调用者共享同一个future; 跨进程时
+先用Redis短锁(SET NX PX)选出计算者, 其余副本轮询缓存等待结果. 计算函数
+负责在返回前写入缓存, 锁在写入后才释放. Redis不可用、等待超时或计算者
+失败时退回本进程计算, 合并只是优化, 不影响正确性.
+"""
+import asyncio
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from scriptai.core import metrics
+from scriptai.core.redis import redis_client
+
+# 只释放自己持有的锁, 避免锁过期后误删其他副本的锁
+_RELEASE_SCRIPT = """
+local released = 0
+for _, key in ipairs(KEYS) do
+    if redis.call('get', key) == ARGV[1] then
+        released = released + redis.call('del', key)
+    end
+end
+return released
+"""
+
+Compute = Callable[[List[str]], Awaitable[List[Any]]]
+Load = Callable[[List[str]], Awaitable[List[Optional[Any]]]]
+
+
+class SingleFlight:
+    """按键合并并发的相同计算."""
+
+    def __init__(
+        self,
+        name: str,
+        lock_ttl: float = 30.0,
+        wait_timeout: float = 30.0,
+        poll_interval: float = 0.1,
+        prefix: str = "singleflight",
+    ) -> None:
+        """初始化.
+
+        Args:
+            name: 名称, 用于指标标签和锁键
+            lock_ttl: 跨进程锁的过期时间(秒), 应覆盖一次计算的耗时
+            wait_timeout: 等待其他副本结果的最长时间(秒)
+            poll_interval: 轮询缓存的间隔(秒)
+            prefix: Redis锁键前缀
+        """
+        self.name = name
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    def _lock_key(self, key: str) -> str:
+        """锁键."""
+        return f"{self.prefix}:{self.name}:{key}"
+
+    def _count(self, result: str, amount: int = 1) -> None:
+        """记录合并结果(leader: 本进程计算, local/remote: 共享进程内/其他副本的结果)."""
+        if amount:
+            metrics.ai_singleflight_total.labels(
+                name=self.name,
+                result=result,
+            ).inc(amount)
+
+    async def do(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        load: Optional[Callable[[str], Awaitable[Optional[Any]]]] = None,
+    ) -> Any:
+        """合并单个键的计算.
+
+        Args:
+            key: 合并键, 通常为缓存键
+            compute: 计算并写入缓存
+            load: 读取缓存, 为None时只在进程内合并
+        """
+
+        async def compute_many(keys: List[str]) -> List[Any]:
+            return [await compute()]
+
+        load_many: Optional[Load] = None
+        if load is not None:
+            load_one = load
+
+            async def _load_many(keys: List[str]) -> List[Optional[Any]]:
+                return [await load_one(keys[0])]
+
+            load_many = _load_many
+
+        return (await self.do_many([key], compute_many, load_many))[0]
+
+    async def do_many(
+        self,
+        keys: List[str],
+        compute: Compute,
+        load: Optional[Load] = None,
+    ) -> List[Any]:
+        """合并一批键的计算, 按输入顺序返回结果.
+
+        已有进程内计算的键直接等待其结果, 其余键(重复的只算一次)交给
+        一次compute调用.
+
+        Args:
+            keys: 合并键列表, 可以重复
+            compute: 按键列表计算并写入缓存, 返回同序的结果
+            load: 按键列表读取缓存, 未命中为None; 为None时只在进程内合并
+        """
+        loop = asyncio.get_running_loop()
+        owned: Dict[str, asyncio.Future] = {}
+        joined: Dict[int, asyncio.Future] = {}
+        for index, key in enumerate(keys):
+            if key in owned:
+                continue
+            if key in self._calls:
+                joined[index] = self._calls[key]
+                continue
+            future = loop.create_future()
+            owned[key] = self._calls[key] = future
+
+        try:
+            if owned:
+                values = await self._lead(list(owned), compute, load)
+                for future, value in zip(owned.values(), values):
+                    future.set_result(value)
+        except BaseException as e:
+            for future in owned.values():
+                if isinstance(e, asyncio.CancelledError):
+                    # 计算者被取消时, 等待者各自重试
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    # 没有等待者时不报"exception was never retrieved"
+                    future.exception()
+            raise
+        finally:
+            for key, future in owned.items():
+                if self._calls.get(key) is future:
+                    del self._calls[key]
+
+        self._count("local", len(joined))
+        results: List[Any] = []
+        for index, key in enumerate(keys):
+            future = joined[index] if index in joined else owned[key]
+            try:
+                results.append(await asyncio.shield(future))
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                results.append((await self.do_many([key], compute, load))[0])
+        return results
+
+    async def _lead(
+        self,
+        keys: List[str],
+        compute: Compute,
+        load: Optional[Load],
+    ) -> List[Any]:
+        """本进程负责的键: 抢到锁的计算, 其余等待其他副本的结果."""
+        if load is None:
+            self._count("leader", len(keys))
+            return await compute(keys)
+
+        token = uuid.uuid4().hex
+        acquired = await self._acquire(keys, token)
+        if acquired is None:
+            self._count("leader", len(keys))
+            return await compute(keys)
+        values: List[Optional[Any]] = [None] * len(keys)
+
+        mine = [index for index, got in enumerate(acquired) if got]
+        if mine:
+            try:
+                fresh = await compute([keys[index] for index in mine])
+            finally:
+                await self._release([keys[index] for index in mine], token)
+            for index, value in zip(mine, fresh):
+                values[index] = value
+            self._count("leader", len(mine))
+
+        others = [index for index, got in enumerate(acquired) if not got]
+        if others:
+            waited = await self._wait([keys[index] for index in others], load)
+            for index, value in zip(others, waited):
+                values[index] = value
+            self._count("remote", sum(value is not None for value in waited))
+
+            # 其他副本失败或超时, 由本进程补算
+            missing = [index for index in others if values[index] is None]
+            if missing:
+                fresh = await compute([keys[index] for index in missing])
+                for index, value in zip(missing, fresh):
+                    values[index] = value
+                self._count("leader", len(missing))
+        return values
+
+    async def _acquire(self, keys: List[str], token: str) -> Optional[List[bool]]:
+        """为每个键抢锁(单次管道往返), Redis不可用时返回None."""
+        try:
+            async with redis_client.client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.set(
+                        self._lock_key(key),
+                        token,
+                        nx=True,
+                        px=int(self.lock_ttl * 1000),
+                    )
+                return [bool(got) for got in await pipe.execute()]
+        except Exception as e:
+            logger.warning(f"获取合并锁失败: {e}")
+            return None
+
+    async def _release(self, keys: List[str], token: str) -> None:
+        """释放本进程持有的锁."""
+        try:
+            await redis_client.client.eval(
+                _RELEASE_SCRIPT,
+                len(keys),
+                *(self._lock_key(key) for key in keys),
+                token,
+            )
+        except Exception as e:
+            logger.warning(f"释放合并锁失败: {e}")
+
+    async def _wait(self, keys: List[str], load: Load) -> List[Optional[Any]]:
+        """轮询缓存等待其他副本的结果, 锁释放或超时后仍未命中的为None."""
+        values: List[Optional[Any]] = [None] * len(keys)
+        deadline = time.monotonic() + self.wait_timeout
+        pending = list(range(len(keys)))
+        try:
+            while pending:
+                loaded = await load([keys[index] for index in pending])
+                for index, value in zip(pending, loaded):
+                    values[index] = value
+                pending = [index for index in pending if values[index] is None]
+                if not pending or time.monotonic() >= deadline:
+                    break
+
+                # 锁已释放而缓存仍未命中, 说明计算者失败, 不再等待
+                held = await redis_client.client.mget(
+                    [self._lock_key(keys[index]) for index in pending]
+                )
+                released = [index for index, lock in zip(pending, held) if not lock]
+                if released:
+                    loaded = await load([keys[index] for index in released])
+                    for index, value in zip(released, loaded):
+                        values[index] = value
+                pending = [index for index, lock in zip(pending, held) if lock]
+                if pending:
+                    await asyncio.sleep(self.poll_interval)
+        except Exception as e:
+            logger.warning(f"等待合并结果失败: {e}")
+        return values
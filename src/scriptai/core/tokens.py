@@ -0,0 +1,92 @@
+"""Token计数."""
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Optional
+
+from loguru import logger
+
+from scriptai.config import settings
+
+# 估算用: 汉字/假名/全角标点各计1个token, 其余按4个字符1个token
+_WIDE_PATTERN = re.compile(
+    r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]"
+)
+
+
+class TokenCounter:
+    """本地Token计数器.
+
+    优先使用tiktoken按模型编码精确计数; 未安装时退化为按字符类别估算.
+    相同文本的计数结果缓存在LRU中, 分块时重复出现的句子无需再次编码.
+    """
+
+    def __init__(
+        self,
+        encoding_name: str = settings.RAG_TOKENIZER_ENCODING,
+        cache_size: int = settings.RAG_TOKEN_CACHE_SIZE,
+    ) -> None:
+        """初始化计数器.
+
+        Args:
+            encoding_name: tiktoken编码名称
+            cache_size: 计数缓存条目数
+        """
+        self.encoding_name = encoding_name
+        self._encoding: Optional[Any] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._count = lru_cache(maxsize=cache_size)(self._count_uncached)
+
+    def _get_encoding(self) -> Optional[Any]:
+        """加载tiktoken编码, 未安装时返回None."""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        import tiktoken
+
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception as e:
+                        logger.warning(f"tiktoken不可用, 按字符估算token数: {e}")
+                    self._loaded = True
+        return self._encoding
+
+    def _count_uncached(self, text: str) -> int:
+        """计数(不经缓存)."""
+        encoding = self._get_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        wide = len(_WIDE_PATTERN.findall(text))
+        return wide + (len(text) - wide + 3) // 4
+
+    def count(self, text: str) -> int:
+        """文本的token数."""
+        if not text:
+            return 0
+        return self._count(text)
+
+    def truncate(self, text: str, max_tokens: int, keep: str = "head") -> str:
+        """截取不超过max_tokens的前缀(keep="head")或后缀(keep="tail")."""
+        if max_tokens <= 0:
+            return ""
+        total = self.count(text)
+        if total <= max_tokens:
+            return text
+        # 按比例估计字符数, 超出时逐步收缩; 只对截取结果计数, 不缓存
+        length = len(text) * max_tokens // total
+        while length > 0:
+            piece = text[:length] if keep == "head" else text[len(text) - length :]
+            tokens = self._count_uncached(piece)
+            if tokens <= max_tokens:
+                return piece
+            length = min(length - 1, length * max_tokens // tokens)
+        return ""
+
+    def clear_cache(self) -> None:
+        """清空计数缓存."""
+        self._count.cache_clear()
+
+
+# 创建全局Token计数器实例
+token_counter = TokenCounter()
@@ -1,8 +1,54 @@
 """RAG系统基础组件."""
+import asyncio
+import hashlib
+import json
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
-from pydantic import BaseModel
+from loguru import logger
+from pydantic import BaseModel, Field
+
+from scriptai.core import metrics
+from scriptai.core.openai import Priority, llm_priority
+from scriptai.services.rag.cache import SemanticCache
+from scriptai.services.rag.streaming import iter_segments
+
+if TYPE_CHECKING:
+    from scriptai.services.rag.stores.lexical import LexicalIndex
+
+
+# 标识文档来源的元数据字段, 取第一个存在的
+SOURCE_FIELDS = ("source", "path", "filename")
+
+
+def document_source(metadata: Dict[str, Any]) -> str:
+    """文档来源, 没有来源字段时为空."""
+    for field in SOURCE_FIELDS:
+        if metadata.get(field):
+            return str(metadata[field])
+    return ""
+
+
+def chunk_id(content: str, source: str = "") -> str:
+    """根据来源和内容生成稳定的分块ID.
+
+    来源参与哈希, 不同文件中的相同文本各自保留一份(及各自的元数据),
+    删除其中一个文件不会影响另一个; 同一来源内的相同文本只保留一份.
+    """
+    key = f"{source}\0{content}" if source else content
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
 
 
 class Document(BaseModel):
@@ -20,6 +66,35 @@ class SearchResult(BaseModel):
     metadata: Dict[str, Any]
 
 
+class IngestResult(BaseModel):
+    """单个文档的入库结果."""
+
+    success: bool
+    # 新写入的分块数、因内容重复而跳过的分块数和生成向量或写入失败的分块数
+    chunks: int = 0
+    skipped: int = 0
+    failed: int = 0
+    # 文档的全部分块ID(含跳过的)
+    chunk_ids: List[str] = Field(default_factory=list)
+    error: Optional[str] = None
+
+
+class IngestConfig(BaseModel):
+    """批量入库流水线配置."""
+
+    # 清理/分块的工作进程数, 0表示在事件循环中直接执行
+    workers: int = Field(default=0, ge=0)
+    # 阶段间队列长度(按文档计)
+    queue_size: int = Field(default=64, ge=1)
+    # 跨文档合并的嵌入批大小(按分块计)与并发批数
+    embed_batch_size: int = Field(default=256, ge=1)
+    embed_concurrency: int = Field(default=4, ge=1)
+    # 向量库批量写入大小(按分块计)
+    insert_batch_size: int = Field(default=1000, ge=1)
+    # 流式入库时每段文本的字符数
+    stream_segment_size: int = Field(default=262144, ge=1024)
+
+
 class VectorStore(ABC):
     """向量存储抽象基类."""
 
@@ -42,6 +117,10 @@ class VectorStore(ABC):
         """搜索相似文档."""
         pass
 
+    async def existing_ids(self, ids: List[str]) -> Set[str]:
+        """返回已存储的分块ID, 用于入库前去重; 默认不去重."""
+        return set()
+
     @abstractmethod
     async def delete(
         self,
@@ -69,6 +148,24 @@ class TextProcessor(ABC):
         """提取元数据."""
         pass
 
+    async def split_with_metadata(self, text: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """文本分块, 同时返回每个分块自身的元数据; 默认分块不带元数据."""
+        return [(chunk, {}) for chunk in await self.split(text)]
+
+    def segment_boundary(self, text: str) -> int:
+        """流式入库时文本段的切分位置: 最后一个空行之后, 没有空行时返回0."""
+        position = text.rfind("\n\n")
+        return position + 2 if position >= 0 else 0
+
+    async def split_stream(
+        self,
+        segments: AsyncIterator[str],
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """对按段到达的文本逐段清理、分块; 段之间不保留状态."""
+        async for segment in segments:
+            for item in await self.split_with_metadata(await self.clean(segment)):
+                yield item
+
 
 class EmbeddingModel(ABC):
     """嵌入模型抽象基类."""
@@ -97,12 +194,57 @@ class LLMModel(ABC):
         """生成文本."""
         pass
 
+    async def generate_stream(
+        self,
+        prompt: str,
+        context: List[str],
+        **kwargs: Dict[str, Any],
+    ) -> AsyncIterator[str]:
+        """流式生成文本.
+
+        默认实现一次性产出完整结果, 支持流式的模型应覆盖此方法.
+        """
+        yield await self.generate(prompt=prompt, context=context, **kwargs)
+
     @abstractmethod
     async def rewrite_query(self, query: str) -> str:
         """重写查询."""
         pass
 
 
+class QueryRewriter(ABC):
+    """查询重写策略抽象基类."""
+
+    @abstractmethod
+    async def rewrite(self, query: str) -> str:
+        """重写查询."""
+        pass
+
+
+async def _prepare_document(
+    processor: TextProcessor,
+    content: str,
+) -> Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, Any]]:
+    """清理、分块并提取元数据."""
+    cleaned_text = await processor.clean(content)
+    chunks = await processor.split_with_metadata(cleaned_text)
+    extracted = await processor.extract_metadata(cleaned_text)
+    return chunks, extracted
+
+
+def _prepare_document_in_worker(
+    processor: TextProcessor,
+    content: str,
+) -> Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, Any]]:
+    """在工作进程中执行_prepare_document."""
+    return asyncio.run(_prepare_document(processor, content))
+
+
+# 流水线阶段间传递的条目: (文档序号, 分块文档[, 向量])
+_Prepared = Tuple[int, List[Document]]
+_Embedded = Tuple[int, List[Document], List[List[float]]]
+
+
 class RAGService:
     """RAG服务基类."""
 
@@ -112,71 +254,750 @@ class RAGService:
         text_processor: TextProcessor,
         embedding_model: EmbeddingModel,
         llm_model: LLMModel,
+        semantic_cache: Optional[SemanticCache] = None,
+        query_rewriters: Optional[Dict[str, QueryRewriter]] = None,
+        rewrite_mode: str = "llm",
+        lexical_index: Optional["LexicalIndex"] = None,
+        rrf_k: int = 60,
+        hybrid_candidates: int = 4,
+        ingest_config: Optional[IngestConfig] = None,
     ) -> None:
-        """初始化RAG服务."""
+        """初始化RAG服务.
+
+        query_rewriters按模式名注册查询重写策略, rewrite_mode为默认模式.
+        "none"表示不重写; 未注册"llm"时直接调用llm_model.rewrite_query.
+        提供lexical_index时启用混合检索: 向量和BM25各取limit*hybrid_candidates
+        个候选, 以倒数排名融合(RRF, 常数rrf_k)合并.
+        ingest_config为批量入库流水线配置.
+        """
         self.vector_store = vector_store
         self.text_processor = text_processor
         self.embedding_model = embedding_model
         self.llm_model = llm_model
-
-    async def add_document(self, content: str) -> bool:
+        self.semantic_cache = semantic_cache
+        self.query_rewriters = query_rewriters or {}
+        self.rewrite_mode = rewrite_mode
+        self.lexical_index = lexical_index
+        self.rrf_k = rrf_k
+        self.hybrid_candidates = hybrid_candidates
+        self.ingest_config = ingest_config or IngestConfig()
+        self._ingest_pool: Optional[ProcessPoolExecutor] = None
+
+    async def add_document(
+        self,
+        content: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        priority: Priority = Priority.BACKGROUND,
+    ) -> bool:
         """添加文档."""
-        # 清理文本
-        cleaned_text = await self.text_processor.clean(content)
-
-        # 分块
-        chunks = await self.text_processor.split(cleaned_text)
-
-        # 提取元数据
-        metadata = await self.text_processor.extract_metadata(cleaned_text)
+        results = await self.add_documents(
+            [Document(content=content, metadata=metadata or {})],
+            priority=priority,
+        )
+        return results[0].success
 
-        # 创建文档
-        documents = [
-            Document(content=chunk, metadata=metadata)
-            for chunk in chunks
-        ]
+    async def add_documents(
+        self,
+        documents: List[Document],
+        priority: Priority = Priority.BACKGROUND,
+    ) -> List[IngestResult]:
+        """批量添加文档, 按输入顺序返回每个文档的结果.
+
+        清理分块、生成向量、写入向量库三个阶段并发执行, 阶段之间以有界队列
+        衔接: 清理分块可在进程池中执行; 嵌入请求跨文档合并成批, 多批并发发送;
+        写入按分区合并为大批量. 某个文档失败不影响其他文档. 嵌入请求以
+        priority类别排队, 不挤占交互请求.
+        """
+        results = [IngestResult(success=False) for _ in documents]
+        # 本批次中已认领的分块ID, 避免不同文档的相同分块重复写入
+        claimed: Set[str] = set()
+        config = self.ingest_config
+        prepared: "asyncio.Queue[Optional[_Prepared]]" = asyncio.Queue(
+            config.queue_size
+        )
+        embedded: "asyncio.Queue[Optional[_Embedded]]" = asyncio.Queue(
+            config.queue_size
+        )
+        # 各阶段任务创建时继承优先级
+        with llm_priority(priority):
+            stages = [
+                asyncio.create_task(
+                    self._prepare_stage(documents, prepared, results, claimed)
+                ),
+                asyncio.create_task(
+                    self._embed_stage(prepared, embedded, results, claimed)
+                ),
+                asyncio.create_task(self._insert_stage(embedded, results, claimed)),
+            ]
+        try:
+            await asyncio.gather(*stages)
+        finally:
+            for stage in stages:
+                stage.cancel()
+
+        if self.lexical_index is not None:
+            await self.lexical_index.persist()
+
+        inserted = sum(result.chunks for result in results)
+        skipped = sum(result.skipped for result in results)
+        metrics.rag_ingest_chunks_total.labels(result="inserted").inc(inserted)
+        metrics.rag_ingest_chunks_total.labels(result="skipped").inc(skipped)
+        logger.info(f"入库完成: 文档{len(documents)}个, 新增分块{inserted}个")
+        if skipped:
+            logger.info(f"跳过重复分块{skipped}个")
+        return results
+
+    async def add_document_stream(
+        self,
+        texts: AsyncIterator[str],
+        metadata: Optional[Dict[str, Any]] = None,
+        on_progress: Optional[Callable[[IngestResult], Awaitable[None]]] = None,
+        priority: Priority = Priority.BACKGROUND,
+    ) -> IngestResult:
+        """流式添加单个大文档.
+
+        文本按段到达, 逐段清理、分块, 分块攒满一个嵌入批就送入嵌入和写入
+        阶段, 峰值内存由段大小和批大小决定, 与文档大小无关(另有每个分块
+        32字节的ID用于去重). 文档级元数据取自第一段. 中途失败时已写入的
+        分块保留, 其ID在结果的chunk_ids中. 每批写入或跳过后以当前结果
+        调用on_progress. 嵌入请求以priority类别排队.
+        """
+        config = self.ingest_config
+        results = [IngestResult(success=True)]
+        # 每批最多embed_batch_size个分块, 队列只需容纳在途的批
+        prepared: "asyncio.Queue[Optional[_Prepared]]" = asyncio.Queue(
+            config.embed_concurrency
+        )
+        embedded: "asyncio.Queue[Optional[_Embedded]]" = asyncio.Queue(
+            config.embed_concurrency
+        )
 
-        # 生成向量
-        embeddings = await self.embedding_model.encode(chunks)
+        # 文档内已认领的分块ID, 相同的分块只写入一次
+        claimed: Set[str] = set()
+
+        async def progress() -> None:
+            if on_progress is not None:
+                await on_progress(results[0])
+
+        with llm_priority(priority):
+            stages = [
+                asyncio.create_task(
+                    self._prepare_stream_stage(
+                        texts, metadata or {}, prepared, results, claimed, progress
+                    )
+                ),
+                asyncio.create_task(
+                    self._embed_stage(prepared, embedded, results, claimed)
+                ),
+                asyncio.create_task(
+                    self._insert_stage(embedded, results, claimed, progress)
+                ),
+            ]
+        try:
+            await asyncio.gather(*stages)
+        finally:
+            for stage in stages:
+                stage.cancel()
+
+        if self.lexical_index is not None:
+            await self.lexical_index.persist()
+
+        result = results[0]
+        metrics.rag_ingest_chunks_total.labels(result="inserted").inc(result.chunks)
+        metrics.rag_ingest_chunks_total.labels(result="skipped").inc(result.skipped)
+        logger.info(f"流式入库完成: 新增分块{result.chunks}个, 跳过重复分块{result.skipped}个")
+        return result
+
+    async def delete_chunks(self, ids: List[str]) -> bool:
+        """按分块ID删除, 同时清理词法索引和引用这些分块的语义缓存."""
+        if not ids:
+            return True
+        return await self.delete_documents({"chunk_id": ids})
+
+    async def delete_documents(self, filter: Dict[str, Any]) -> bool:
+        """按元数据过滤条件删除, 同时清理词法索引和语义缓存.
+
+        删除文档都应经过此方法, 直接调用vector_store.delete会在词法索引中
+        留下过期的BM25结果.
+
+        Args:
+            filter: 过滤条件, 语法见filters模块
+        """
+        ids: Optional[List[str]] = None
+        if self.lexical_index is not None:
+            ids = self.lexical_index.match(filter)
+        elif set(filter) == {"chunk_id"} and isinstance(filter["chunk_id"], list):
+            ids = filter["chunk_id"]
+
+        success = await self.vector_store.delete(filter)
+        if self.lexical_index is not None:
+            self.lexical_index.delete(ids)
+            await self.lexical_index.persist()
+        if self.semantic_cache is not None:
+            if ids is None:
+                # 不知道删除了哪些分块, 整体清空
+                self.semantic_cache.clear()
+            else:
+                self.semantic_cache.invalidate(ids)
+        return success
+
+    def _get_ingest_pool(self) -> Optional[ProcessPoolExecutor]:
+        """获取清理分块用的进程池."""
+        if self._ingest_pool is None and self.ingest_config.workers > 0:
+            self._ingest_pool = ProcessPoolExecutor(self.ingest_config.workers)
+        return self._ingest_pool
+
+    def shutdown_ingest_pool(self) -> None:
+        """关闭进程池."""
+        if self._ingest_pool is not None:
+            self._ingest_pool.shutdown(wait=False, cancel_futures=True)
+            self._ingest_pool = None
+
+    async def _prepare_stage(
+        self,
+        documents: List[Document],
+        queue_out: "asyncio.Queue[Optional[_Prepared]]",
+        results: List[IngestResult],
+        claimed: Set[str],
+    ) -> None:
+        """阶段一: 清理、分块, 按内容哈希去重后生成分块文档."""
+        pool = self._get_ingest_pool()
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(max(self.ingest_config.workers, 1) * 2)
+
+        async def prepare(index: int, document: Document) -> None:
+            try:
+                async with semaphore:
+                    if pool is None:
+                        chunks, extracted = await _prepare_document(
+                            self.text_processor,
+                            document.content,
+                        )
+                    else:
+                        chunks, extracted = await loop.run_in_executor(
+                            pool,
+                            _prepare_document_in_worker,
+                            self.text_processor,
+                            document.content,
+                        )
+            except Exception as e:
+                results[index] = IngestResult(success=False, error=f"文本处理失败: {e}")
+                return
+
+            # 文档内相同的分块只保留一个
+            source = document_source(document.metadata)
+            chunk_map = {
+                chunk_id(chunk, source): (chunk, meta) for chunk, meta in chunks
+            }
+            try:
+                existing = await self.vector_store.existing_ids(list(chunk_map))
+            except Exception as e:
+                logger.warning(f"查询已有分块失败, 不做去重: {e}")
+                existing = set()
+            fresh = {
+                key: chunk
+                for key, chunk in chunk_map.items()
+                if key not in existing and key not in claimed
+            }
+            claimed.update(fresh)
+
+            results[index] = IngestResult(
+                success=True,
+                skipped=len(chunks) - len(fresh),
+                chunk_ids=list(chunk_map),
+            )
+            if not fresh:
+                return
+
+            # 调用方提供的元数据优先, 其次是分块自身的元数据
+            await queue_out.put(
+                (
+                    index,
+                    [
+                        Document(
+                            content=chunk,
+                            metadata={
+                                **extracted,
+                                **meta,
+                                **document.metadata,
+                                "chunk_id": key,
+                            },
+                        )
+                        for key, (chunk, meta) in fresh.items()
+                    ],
+                )
+            )
+
+        try:
+            await asyncio.gather(
+                *(prepare(index, document) for index, document in enumerate(documents))
+            )
+        finally:
+            await queue_out.put(None)
+
+    async def _prepare_stream_stage(
+        self,
+        texts: AsyncIterator[str],
+        metadata: Dict[str, Any],
+        queue_out: "asyncio.Queue[Optional[_Prepared]]",
+        results: List[IngestResult],
+        claimed: Set[str],
+        on_progress: Callable[[], Awaitable[None]],
+    ) -> None:
+        """流式阶段一: 分段清理、分块, 按嵌入批大小去重后送出."""
+        processor = self.text_processor
+        batch_size = self.ingest_config.embed_batch_size
+        extracted: Optional[Dict[str, Any]] = None
+        chunk_ids: List[str] = []
+        batch: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        source = document_source(metadata)
+
+        def skip(count: int) -> None:
+            results[0] = results[0].model_copy(
+                update={"skipped": results[0].skipped + count}
+            )
+
+        async def segments() -> AsyncIterator[str]:
+            nonlocal extracted
+            async for segment in iter_segments(
+                texts,
+                processor.segment_boundary,
+                self.ingest_config.stream_segment_size,
+            ):
+                if extracted is None:
+                    extracted = await processor.extract_metadata(
+                        await processor.clean(segment)
+                    )
+                yield segment
+
+        async def flush() -> None:
+            nonlocal batch
+            try:
+                existing = await self.vector_store.existing_ids(list(batch))
+            except Exception as e:
+                logger.warning(f"查询已有分块失败, 不做去重: {e}")
+                existing = set()
+            fresh = {key: item for key, item in batch.items() if key not in existing}
+            skip(len(batch) - len(fresh))
+            batch = {}
+            if not fresh:
+                await on_progress()
+            else:
+                # 调用方提供的元数据优先, 其次是分块自身的元数据
+                await queue_out.put(
+                    (
+                        0,
+                        [
+                            Document(
+                                content=chunk,
+                                metadata={
+                                    **(extracted or {}),
+                                    **meta,
+                                    **metadata,
+                                    "chunk_id": key,
+                                },
+                            )
+                            for key, (chunk, meta) in fresh.items()
+                        ],
+                    )
+                )
+
+        try:
+            async for chunk, meta in processor.split_stream(segments()):
+                key = chunk_id(chunk, source)
+                # 文档内相同的分块只保留一个
+                if key in claimed:
+                    skip(1)
+                    continue
+                claimed.add(key)
+                chunk_ids.append(key)
+                batch[key] = (chunk, meta)
+                if len(batch) >= batch_size:
+                    await flush()
+            if batch:
+                await flush()
+            error = None
+        except Exception as e:
+            error = f"文本处理失败: {e}"
+        finally:
+            await queue_out.put(None)
+
+        result = results[0]
+        results[0] = result.model_copy(
+            update={
+                "success": result.success and error is None,
+                # 写入失败后释放的分块可能再次出现
+                "chunk_ids": list(dict.fromkeys(chunk_ids)),
+                "error": result.error or error,
+            }
+        )
 
-        # 存储向量
-        return await self.vector_store.add(documents, embeddings)
+    async def _embed_stage(
+        self,
+        queue_in: "asyncio.Queue[Optional[_Prepared]]",
+        queue_out: "asyncio.Queue[Optional[_Embedded]]",
+        results: List[IngestResult],
+        claimed: Set[str],
+    ) -> None:
+        """阶段二: 跨文档合并分块, 并发批量生成向量.
+
+        失败的分块释放认领, 之后再出现的相同分块仍可写入.
+        """
+        config = self.ingest_config
+        semaphore = asyncio.Semaphore(config.embed_concurrency)
+        tasks: Set[asyncio.Task] = set()
+
+        async def embed(batch: List[_Prepared]) -> None:
+            try:
+                texts = [chunk.content for _, chunks in batch for chunk in chunks]
+                embeddings = await self.embedding_model.encode(texts)
+                offset = 0
+                for index, chunks in batch:
+                    await queue_out.put(
+                        (index, chunks, embeddings[offset : offset + len(chunks)])
+                    )
+                    offset += len(chunks)
+            except Exception as e:
+                for index, chunks in batch:
+                    claimed.difference_update(
+                        chunk.metadata["chunk_id"] for chunk in chunks
+                    )
+                    results[index] = results[index].model_copy(
+                        update={
+                            "success": False,
+                            "failed": results[index].failed + len(chunks),
+                            "error": f"生成向量失败: {e}",
+                        }
+                    )
+            finally:
+                semaphore.release()
+
+        async def flush(batch: List[_Prepared]) -> None:
+            # 并发批数已满时在此等待, 从而对上游形成背压
+            await semaphore.acquire()
+            task = asyncio.create_task(embed(batch))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        try:
+            batch: List[_Prepared] = []
+            size = 0
+            while (item := await queue_in.get()) is not None:
+                batch.append(item)
+                size += len(item[1])
+                # 批满, 或上游暂时没有数据且还有空闲的并发额度时发送
+                if size >= config.embed_batch_size or (
+                    queue_in.empty() and not semaphore.locked()
+                ):
+                    await flush(batch)
+                    batch, size = [], 0
+            if batch:
+                await flush(batch)
+            await asyncio.gather(*list(tasks))
+        finally:
+            await queue_out.put(None)
+
+    async def _insert_stage(
+        self,
+        queue_in: "asyncio.Queue[Optional[_Embedded]]",
+        results: List[IngestResult],
+        claimed: Set[str],
+        on_insert: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> None:
+        """阶段三: 按分区合并后批量写入向量库, 写入失败的分块释放认领."""
+        # 分区(文档类型) -> 待写入条目
+        groups: Dict[str, List[_Embedded]] = {}
+        sizes: Dict[str, int] = {}
+
+        async def insert(partition: str) -> None:
+            batch = groups.pop(partition)
+            sizes.pop(partition)
+            documents = [chunk for _, chunks, _ in batch for chunk in chunks]
+            embeddings = [vector for _, _, vectors in batch for vector in vectors]
+            try:
+                success = await self.vector_store.add(documents, embeddings)
+                error = None if success else "写入向量库失败"
+            except Exception as e:
+                success, error = False, f"写入向量库失败: {e}"
+            if not success:
+                claimed.difference_update(
+                    document.metadata["chunk_id"] for document in documents
+                )
+
+            # 流式入库时同一文档分多批写入, 结果逐批累加
+            for index, chunks, _ in batch:
+                result = results[index]
+                results[index] = result.model_copy(
+                    update={
+                        "success": result.success and success,
+                        "chunks": result.chunks + (len(chunks) if success else 0),
+                        "failed": result.failed + (0 if success else len(chunks)),
+                        "error": result.error or error,
+                    }
+                )
+
+            # 更新词法索引
+            if success and self.lexical_index is not None:
+                self.lexical_index.add(
+                    [document.metadata["chunk_id"] for document in documents],
+                    documents,
+                )
+            if on_insert is not None:
+                await on_insert()
+
+        while (item := await queue_in.get()) is not None:
+            partition = item[1][0].metadata.get("type", "default")
+            groups.setdefault(partition, []).append(item)
+            sizes[partition] = sizes.get(partition, 0) + len(item[1])
+            if sizes[partition] >= self.ingest_config.insert_batch_size:
+                await insert(partition)
+        for partition in list(groups):
+            await insert(partition)
+
+    async def rewrite_query(
+        self,
+        query: str,
+        mode: Optional[str] = None,
+    ) -> str:
+        """按指定模式(默认使用服务配置)重写查询."""
+        mode = mode or self.rewrite_mode
+        if mode == "none":
+            return query
+        rewriter = self.query_rewriters.get(mode)
+        if rewriter is not None:
+            return await rewriter.rewrite(query)
+        if mode == "llm":
+            return await self.llm_model.rewrite_query(query)
+        raise ValueError(f"未知的查询重写模式: {mode}")
 
     async def search(
         self,
         query: str,
         limit: int = 5,
         filter: Optional[Dict[str, Any]] = None,
+        rewrite: Optional[str] = None,
     ) -> List[SearchResult]:
         """搜索相似文档."""
+        return await self._search(query, limit, filter, rewrite)
+
+    async def _search(
+        self,
+        query: str,
+        limit: int = 5,
+        filter: Optional[Dict[str, Any]] = None,
+        rewrite: Optional[str] = None,
+        embedded: Optional[Tuple[str, List[float]]] = None,
+    ) -> List[SearchResult]:
+        """搜索相似文档.
+
+        Args:
+            embedded: 已生成向量的(文本, 向量), 重写后的查询与该文本相同时
+                复用向量, 不再重复编码
+        """
         # 重写查询
-        rewritten_query = await self.llm_model.rewrite_query(query)
+        rewritten_query = await self.rewrite_query(query, rewrite)
 
         # 生成查询向量
-        query_vector = await self.embedding_model.encode_query(rewritten_query)
-
-        # 搜索相似文档
-        return await self.vector_store.search(
+        if embedded is not None and embedded[0] == rewritten_query:
+            query_vector = embedded[1]
+        else:
+            query_vector = await self.embedding_model.encode_query(rewritten_query)
+
+        if self.lexical_index is None:
+            # 搜索相似文档
+            return await self.vector_store.search(
+                query_vector=query_vector,
+                limit=limit,
+                filter=filter,
+            )
+
+        # 混合检索: 向量和BM25各取候选后融合
+        candidates = limit * self.hybrid_candidates
+        vector_results = await self.vector_store.search(
             query_vector=query_vector,
-            limit=limit,
+            limit=candidates,
+            filter=filter,
+        )
+        lexical_results = self.lexical_index.search(
+            rewritten_query,
+            limit=candidates,
             filter=filter,
         )
+        return self._fuse(vector_results, lexical_results, limit)
+
+    def _fuse(
+        self,
+        vector_results: List[SearchResult],
+        lexical_results: List[Tuple[str, float]],
+        limit: int,
+    ) -> List[SearchResult]:
+        """倒数排名融合(RRF): score = Σ 1 / (k + rank)."""
+        scores: Dict[str, float] = {}
+        documents: Dict[str, SearchResult] = {}
+
+        for rank, result in enumerate(vector_results, start=1):
+            key = result.metadata.get("chunk_id") or chunk_id(result.content)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (self.rrf_k + rank)
+            documents.setdefault(key, result)
+
+        for rank, (key, _) in enumerate(lexical_results, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (self.rrf_k + rank)
+            if key not in documents:
+                document = self.lexical_index.get(key)
+                if document is not None:
+                    documents[key] = SearchResult(
+                        content=document.content,
+                        score=0.0,
+                        metadata=document.metadata,
+                    )
+
+        ranked = sorted(
+            (key for key in scores if key in documents),
+            key=lambda key: scores[key],
+            reverse=True,
+        )
+        return [
+            documents[key].model_copy(update={"score": scores[key]})
+            for key in ranked[:limit]
+        ]
+
+    def _cache_namespace(
+        self,
+        filter: Optional[Dict[str, Any]],
+        kwargs: Dict[str, Any],
+        scope: Optional[str] = None,
+        rewrite: Optional[str] = None,
+    ) -> str:
+        """语义缓存命名空间.
+
+        作用域、过滤条件、查询重写模式和生成参数都相同的查询才能共享回答.
+        """
+        return json.dumps(
+            {
+                "scope": scope,
+                "filter": filter,
+                "rewrite": rewrite or self.rewrite_mode,
+                "kwargs": kwargs,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+
+    async def _lookup_answer(
+        self,
+        query: str,
+        namespace: str,
+    ) -> Tuple[Optional[Tuple[str, List[float]]], Optional[str]]:
+        """查询语义缓存, 返回((查询, 查询向量), 缓存的回答)."""
+        if self.semantic_cache is None:
+            return None, None
+        query_vector = await self.embedding_model.encode_query(query)
+        cached = self.semantic_cache.lookup(namespace, query_vector)
+        return (query, query_vector), cached.answer if cached else None
+
+    def _store_answer(
+        self,
+        namespace: str,
+        embedded: Optional[Tuple[str, List[float]]],
+        results: List[SearchResult],
+        answer: str,
+    ) -> None:
+        """写入语义缓存."""
+        if self.semantic_cache is None or embedded is None or not answer:
+            return
+        self.semantic_cache.store(
+            namespace,
+            embedded[1],
+            [
+                result.metadata.get("chunk_id") or chunk_id(result.content)
+                for result in results
+            ],
+            answer,
+        )
 
     async def generate(
         self,
         query: str,
+        filter: Optional[Dict[str, Any]] = None,
+        rewrite: Optional[str] = None,
+        cache_scope: Optional[str] = None,
+        cache_text: Optional[str] = None,
         **kwargs: Dict[str, Any],
     ) -> str:
-        """生成回答."""
-        # 搜索相关文档
-        results = await self.search(query)
+        """生成回答.
+
+        Args:
+            query: 查询(完整提示词)
+            filter: 元数据过滤条件
+            rewrite: 查询重写模式, 不同模式的回答不共享缓存
+            cache_scope: 语义缓存作用域, 只有同一作用域的查询共享回答
+            cache_text: 用于语义缓存匹配的文本, 默认为query; 提示词由固定模板
+                包裹用户内容时应只传入用户内容, 避免模板主导相似度. 与重写后
+                的查询相同时, 检索复用其向量
+            **kwargs: 生成参数
+        """
+        # 查询语义缓存
+        namespace = self._cache_namespace(filter, kwargs, cache_scope, rewrite)
+        embedded, cached = await self._lookup_answer(cache_text or query, namespace)
+        if cached is not None:
+            return cached
+
+        # 搜索相关文档, 查询与缓存匹配的文本相同时复用其向量
+        results = await self._search(
+            query,
+            filter=filter,
+            rewrite=rewrite,
+            embedded=embedded,
+        )
 
         # 提取上下文
         context = [result.content for result in results]
 
         # 生成回答
-        return await self.llm_model.generate(
+        answer = await self.llm_model.generate(
+            prompt=query,
+            context=context,
+            **kwargs,
+        )
+        self._store_answer(namespace, embedded, results, answer)
+        return answer
+
+    async def generate_stream(
+        self,
+        query: str,
+        filter: Optional[Dict[str, Any]] = None,
+        rewrite: Optional[str] = None,
+        cache_scope: Optional[str] = None,
+        cache_text: Optional[str] = None,
+        **kwargs: Dict[str, Any],
+    ) -> AsyncIterator[str]:
+        """流式生成回答, 参数同generate."""
+        # 查询语义缓存
+        namespace = self._cache_namespace(filter, kwargs, cache_scope, rewrite)
+        embedded, cached = await self._lookup_answer(cache_text or query, namespace)
+        if cached is not None:
+            yield cached
+            return
+
+        # 搜索相关文档, 查询与缓存匹配的文本相同时复用其向量
+        results = await self._search(
+            query,
+            filter=filter,
+            rewrite=rewrite,
+            embedded=embedded,
+        )
+
+        # 提取上下文
+        context = [result.content for result in results]
+
+        # 逐段产出回答
+        parts: List[str] = []
+        async for token in self.llm_model.generate_stream(
             prompt=query,
             context=context,
             **kwargs,
-        ) 
\ No newline at end of file
+        ):
+            parts.append(token)
+            yield token
+        self._store_answer(namespace, embedded, results, "".join(parts))
@@ -0,0 +1,159 @@
+"""RAG语义缓存实现."""
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from scriptai.core import metrics
+
+
+class CachedAnswer(BaseModel):
+    """缓存的回答."""
+
+    answer: str
+    context_ids: List[str]
+    created_at: float
+
+
+class SemanticCache:
+    """语义缓存.
+
+    以(查询向量, 检索上下文ID, 回答)为条目, 新查询与同一命名空间(相同过滤条件和
+    生成参数)下某条目的余弦相似度不低于阈值时直接返回缓存的回答.
+    条目按LRU淘汰, 并在TTL到期后失效.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        max_entries: int = 2048,
+        ttl: int = 3600,
+    ) -> None:
+        """初始化语义缓存."""
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # 条目ID -> (命名空间, 归一化向量, 回答), 顺序即LRU顺序
+        self._entries: "OrderedDict[int, Tuple[str, np.ndarray, CachedAnswer]]" = (
+            OrderedDict()
+        )
+        # 命名空间 -> 条目ID集合
+        self._namespaces: Dict[str, Dict[int, None]] = {}
+        # 命名空间 -> (条目ID列表, 向量矩阵), 条目变化时重建
+        self._matrices: Dict[str, Tuple[List[int], np.ndarray]] = {}
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        """缓存条目数."""
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        """归一化向量."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _matrix(self, namespace: str) -> Tuple[List[int], np.ndarray]:
+        """获取命名空间的向量矩阵."""
+        if namespace not in self._matrices:
+            ids = list(self._namespaces.get(namespace, {}))
+            matrix = (
+                np.vstack([self._entries[entry_id][1] for entry_id in ids])
+                if ids
+                else np.empty((0, 0), dtype=np.float32)
+            )
+            self._matrices[namespace] = (ids, matrix)
+        return self._matrices[namespace]
+
+    def _remove(self, entry_id: int) -> None:
+        """移除条目."""
+        namespace, _, _ = self._entries.pop(entry_id)
+        members = self._namespaces[namespace]
+        members.pop(entry_id, None)
+        if not members:
+            del self._namespaces[namespace]
+        self._matrices.pop(namespace, None)
+
+    def _update_size(self) -> None:
+        """更新缓存大小指标."""
+        metrics.rag_semantic_cache_size.set(len(self._entries))
+
+    def lookup(
+        self,
+        namespace: str,
+        embedding: List[float],
+    ) -> Optional[CachedAnswer]:
+        """查找语义相近的缓存回答."""
+        ids, matrix = self._matrix(namespace)
+        if not ids:
+            metrics.rag_semantic_cache_total.labels(result="miss").inc()
+            return None
+
+        scores = matrix @ self._normalize(embedding)
+        best = int(np.argmax(scores))
+        entry_id = ids[best]
+        answer = self._entries[entry_id][2]
+
+        if time.time() - answer.created_at > self.ttl:
+            self._remove(entry_id)
+            self._update_size()
+            metrics.rag_semantic_cache_total.labels(result="expired").inc()
+            return None
+
+        if scores[best] < self.threshold:
+            metrics.rag_semantic_cache_total.labels(result="miss").inc()
+            return None
+
+        self._entries.move_to_end(entry_id)
+        metrics.rag_semantic_cache_total.labels(result="hit").inc()
+        return answer
+
+    def store(
+        self,
+        namespace: str,
+        embedding: List[float],
+        context_ids: List[str],
+        answer: str,
+    ) -> None:
+        """写入缓存条目."""
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (
+            namespace,
+            self._normalize(embedding),
+            CachedAnswer(
+                answer=answer,
+                context_ids=context_ids,
+                created_at=time.time(),
+            ),
+        )
+        self._namespaces.setdefault(namespace, {})[entry_id] = None
+        self._matrices.pop(namespace, None)
+
+        # LRU淘汰
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        self._update_size()
+
+    def invalidate(self, context_ids: Iterable[str]) -> int:
+        """使引用了指定上下文的条目失效, 返回失效条目数."""
+        targets = set(context_ids)
+        stale = [
+            entry_id
+            for entry_id, (_, _, answer) in self._entries.items()
+            if targets.intersection(answer.context_ids)
+        ]
+        for entry_id in stale:
+            self._remove(entry_id)
+        self._update_size()
+        return len(stale)
+
+    def clear(self) -> None:
+        """清空缓存."""
+        self._entries.clear()
+        self._namespaces.clear()
+        self._matrices.clear()
+        self._update_size()
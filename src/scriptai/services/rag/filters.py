@@ -0,0 +1,198 @@
+"""元数据过滤DSL.
+
+过滤条件为字典, 字段之间为AND:
+
+    {"type": "theory"}                          # 等于
+    {"type": ["theory", "example"]}             # 取其一, 同{"$in": [...]}
+    {"importance": {"$ne": "low"}}              # 比较: $eq $ne $in $nin
+    {"year": {"$gte": 2000, "$lt": 2010}}       # 数值范围: $gt $gte $lt $lte
+    {"$or": [{"type": "theory"}, {"category": "guidelines"}]}
+
+同一份条件可编译为Milvus布尔表达式, 也可在进程内逐条判断或组合为向量化掩码.
+"""
+import re
+from typing import Any, Callable, Collection, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+# 比较运算符 -> Milvus运算符
+COMPARISON_OPERATORS = {
+    "$eq": "==",
+    "$ne": "!=",
+    "$gt": ">",
+    "$gte": ">=",
+    "$lt": "<",
+    "$lte": "<=",
+}
+SET_OPERATORS = {"$in": "in", "$nin": "not in"}
+RANGE_OPERATORS = ("$gt", "$gte", "$lt", "$lte")
+LOGICAL_OPERATORS = ("$and", "$or")
+
+_FIELD_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _is_number(value: Any) -> bool:
+    """是否为数值(不含布尔)."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _sub_filters(operator: str, value: Any) -> List[Dict[str, Any]]:
+    """校验并返回逻辑运算符的子条件."""
+    if not isinstance(value, (list, tuple)) or not value:
+        raise ValueError(f"{operator}需要非空的条件列表")
+    for sub in value:
+        if not isinstance(sub, dict) or not sub:
+            raise ValueError(f"{operator}的子条件必须是非空字典")
+    return list(value)
+
+
+def conditions(field: str, value: Any) -> Iterator[Tuple[str, Any]]:
+    """展开单个字段的条件为(运算符, 操作数)."""
+    if not _FIELD_PATTERN.match(field):
+        raise ValueError(f"非法的过滤字段: {field}")
+
+    if isinstance(value, (list, tuple, set)):
+        yield "$in", list(value)
+        return
+    if not isinstance(value, dict):
+        yield "$eq", value
+        return
+    if not value:
+        raise ValueError(f"字段{field}的条件为空")
+
+    for operator, operand in value.items():
+        if operator in SET_OPERATORS:
+            if not isinstance(operand, (list, tuple, set)):
+                raise ValueError(f"{operator}需要列表")
+            operand = list(operand)
+        elif operator in RANGE_OPERATORS:
+            if not _is_number(operand):
+                raise ValueError(f"{operator}只支持数值")
+        elif operator not in COMPARISON_OPERATORS:
+            raise ValueError(f"不支持的运算符: {operator}")
+        yield operator, operand
+
+
+def literal(value: Any) -> str:
+    """转换为Milvus表达式字面量."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if _is_number(value):
+        return repr(value)
+    if isinstance(value, str):
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+        return f'"{escaped}"'
+    raise ValueError(f"不支持的过滤值类型: {type(value).__name__}")
+
+
+def to_milvus_expr(
+    filter: Dict[str, Any],
+    column: str = "metadata",
+    scalar_fields: Collection[str] = (),
+) -> str:
+    """编译为Milvus布尔表达式.
+
+    Args:
+        filter: 过滤条件
+        column: 元数据所在的JSON字段名, 字段以column["字段"]访问
+        scalar_fields: 已提升为独立标量列(可建标量索引)的字段, 直接按列名访问
+    """
+    clauses = []
+    for key, value in filter.items():
+        if key in LOGICAL_OPERATORS:
+            joiner = " && " if key == "$and" else " || "
+            parts = [
+                to_milvus_expr(sub, column, scalar_fields)
+                for sub in _sub_filters(key, value)
+            ]
+            clauses.append("(" + joiner.join(parts) + ")")
+            continue
+        path = key if key in scalar_fields else f'{column}["{key}"]'
+        for operator, operand in conditions(key, value):
+            if operator in SET_OPERATORS:
+                items = ", ".join(literal(item) for item in operand)
+                clauses.append(f"{path} {SET_OPERATORS[operator]} [{items}]")
+            else:
+                clauses.append(
+                    f"{path} {COMPARISON_OPERATORS[operator]} {literal(operand)}"
+                )
+    return " && ".join(clauses)
+
+
+def _check(operator: str, operand: Any, actual: Any) -> bool:
+    """判断单个值是否满足条件."""
+    if operator == "$eq":
+        return actual == operand
+    if operator == "$ne":
+        return actual != operand
+    if operator == "$in":
+        return actual in operand
+    if operator == "$nin":
+        return actual not in operand
+    if not _is_number(actual):
+        return False
+    if operator == "$gt":
+        return actual > operand
+    if operator == "$gte":
+        return actual >= operand
+    if operator == "$lt":
+        return actual < operand
+    return actual <= operand
+
+
+def matches(filter: Dict[str, Any], metadata: Dict[str, Any]) -> bool:
+    """判断元数据是否满足过滤条件."""
+    for key, value in filter.items():
+        if key == "$and":
+            if not all(matches(sub, metadata) for sub in _sub_filters(key, value)):
+                return False
+        elif key == "$or":
+            if not any(matches(sub, metadata) for sub in _sub_filters(key, value)):
+                return False
+        elif not all(
+            _check(operator, operand, metadata.get(key))
+            for operator, operand in conditions(key, value)
+        ):
+            return False
+    return True
+
+
+def evaluate_mask(
+    filter: Dict[str, Any],
+    size: int,
+    condition_mask: Callable[[str, str, Any], np.ndarray],
+) -> np.ndarray:
+    """以布尔掩码组合过滤条件.
+
+    Args:
+        filter: 过滤条件
+        size: 行数
+        condition_mask: 返回单个(字段, 运算符, 操作数)条件的行掩码
+    """
+    mask = np.ones(size, dtype=bool)
+    for key, value in filter.items():
+        if key == "$and":
+            for sub in _sub_filters(key, value):
+                mask &= evaluate_mask(sub, size, condition_mask)
+        elif key == "$or":
+            any_mask = np.zeros(size, dtype=bool)
+            for sub in _sub_filters(key, value):
+                any_mask |= evaluate_mask(sub, size, condition_mask)
+            mask &= any_mask
+        else:
+            for operator, operand in conditions(key, value):
+                mask &= condition_mask(key, operator, operand)
+    return mask
+
+
+def partition_values(filter: Dict[str, Any], field: str = "type") -> List[Any]:
+    """顶层字段为等于或取其一时返回其取值, 用于分区裁剪; 否则返回空列表."""
+    if field not in filter:
+        return []
+    values: List[Any] = []
+    for operator, operand in conditions(field, filter[field]):
+        if operator == "$eq":
+            values.append(operand)
+        elif operator == "$in":
+            values.extend(operand)
+    return values
@@ -0,0 +1,408 @@
+"""知识库后台入库任务.
+
+上传的内容分段暂存在Redis列表中, 任务记录保存在Redis中, 任务ID写入Redis流.
+各进程的工作协程以消费组读取任务并流式入库, 进度事件经Redis发布订阅转发给
+上传者所在进程的WebSocket连接.
+
+工作进程重启时, 未确认的任务在空闲超过认领时间后由其他消费者(可以在其他
+主机上)接手, 暂存内容在Redis中因此任何消费者都能读取. 重新执行时已写入向量库
+的分块按内容哈希跳过, 不再生成向量, 即从最后一个已提交的批次之后继续.
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from loguru import logger
+from pydantic import BaseModel, Field
+from redis.asyncio.client import Redis
+from redis.exceptions import ResponseError
+
+from scriptai.config import settings
+from scriptai.core import metrics
+from scriptai.core.openai import Priority
+from scriptai.core.redis import redis_client
+from scriptai.services.rag.base import IngestResult, RAGService
+from scriptai.services.rag.service import rag_service
+from scriptai.services.rag.streaming import decode_stream
+from scriptai.services.websocket import ws_manager
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+
+class IngestJob(BaseModel):
+    """后台入库任务."""
+
+    id: str
+    user_id: str
+    filename: Optional[str] = None
+    size: int = 0
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+    status: str = QUEUED
+    attempts: int = 0
+    # 本次执行新写入、跳过(内容重复或此前已提交)和失败的分块数
+    chunks: int = 0
+    skipped: int = 0
+    failed: int = 0
+    # 本次执行已读取的字节数, 用于估算进度
+    processed_bytes: int = 0
+    error: Optional[str] = None
+    created_at: float = Field(default_factory=time.time)
+    started_at: Optional[float] = None
+    updated_at: float = Field(default_factory=time.time)
+
+    def event(self) -> Dict[str, Any]:
+        """生成进度事件."""
+        progress = 1.0 if self.status == SUCCEEDED else 0.0
+        eta: Optional[float] = None
+        if self.status == RUNNING and self.size:
+            progress = min(self.processed_bytes / self.size, 1.0)
+            if self.started_at is not None and 0 < progress < 1:
+                elapsed = time.time() - self.started_at
+                eta = round(elapsed * (1 - progress) / progress, 1)
+        return {
+            "type": "ingest_progress",
+            "job_id": self.id,
+            "user_id": self.user_id,
+            "filename": self.filename,
+            "status": self.status,
+            "chunks": self.chunks,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "progress": round(progress, 4),
+            "eta": eta,
+            "error": self.error,
+        }
+
+
+class IngestJobQueue:
+    """基于Redis流的入库任务队列与工作协程."""
+
+    def __init__(
+        self,
+        service: RAGService,
+        client: Optional[Redis] = None,
+        binary_client: Optional[Redis] = None,
+        stream: str = settings.RAG_INGEST_JOB_STREAM,
+        group: str = settings.RAG_INGEST_JOB_GROUP,
+        channel: str = settings.RAG_INGEST_JOB_CHANNEL,
+        claim_idle_ms: int = settings.RAG_INGEST_JOB_CLAIM_IDLE_MS,
+        max_attempts: int = settings.RAG_INGEST_JOB_MAX_ATTEMPTS,
+        progress_interval: float = settings.RAG_INGEST_JOB_PROGRESS_INTERVAL,
+        block_ms: int = 5000,
+        retry_delay: float = 1.0,
+    ) -> None:
+        """初始化任务队列.
+
+        Args:
+            service: 执行入库的RAG服务
+            client: Redis客户端, 默认使用全局客户端
+            binary_client: 暂存上传内容的二进制安全客户端, 默认使用全局客户端
+            stream: 任务流名称, 任务记录和暂存内容的键以其为前缀
+            group: 消费组名称
+            channel: 进度事件频道
+            claim_idle_ms: 认领失联消费者任务的空闲时间(毫秒)
+            max_attempts: 单个任务的最大尝试次数
+            progress_interval: 进度事件的最小推送间隔(秒)
+            block_ms: 读取任务的阻塞等待时间(毫秒)
+            retry_delay: 消费或订阅出错后重试前的等待时间(秒)
+        """
+        self.service = service
+        self._client = client
+        self._binary_client = binary_client
+        self.stream = stream
+        self.group = group
+        self.channel = channel
+        self.claim_idle_ms = claim_idle_ms
+        self.max_attempts = max_attempts
+        self.progress_interval = progress_interval
+        self.block_ms = block_ms
+        self.retry_delay = retry_delay
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def client(self) -> Redis:
+        """获取Redis客户端."""
+        return self._client or redis_client.client
+
+    @property
+    def binary_client(self) -> Redis:
+        """获取二进制安全的Redis客户端."""
+        return self._binary_client or redis_client.binary_client
+
+    def _key(self, job_id: str) -> str:
+        """任务记录的键."""
+        return f"{self.stream}:{job_id}"
+
+    def _data_key(self, job_id: str) -> str:
+        """暂存上传内容的列表键."""
+        return f"{self.stream}:{job_id}:data"
+
+    async def submit(
+        self,
+        chunks: AsyncIterator[bytes],
+        user_id: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        filename: Optional[str] = None,
+    ) -> IngestJob:
+        """暂存上传内容并提交入库任务, 立即返回任务."""
+        job_id = uuid.uuid4().hex
+        size = await self._spool(chunks, self._data_key(job_id))
+        job = IngestJob(
+            id=job_id,
+            user_id=str(user_id),
+            filename=filename,
+            size=size,
+            metadata=metadata or {},
+        )
+        await self._save(job)
+        await self.client.xadd(self.stream, {"job_id": job_id})
+        metrics.rag_ingest_jobs_total.labels(status=QUEUED).inc()
+        await self._publish(job)
+        logger.info(f"入库任务已提交: {job_id}, 文件{filename}, {size}字节")
+        return job
+
+    async def get(self, job_id: str) -> Optional[IngestJob]:
+        """获取任务."""
+        value = await self.client.get(self._key(job_id))
+        return IngestJob.model_validate_json(value) if value else None
+
+    async def start(self, workers: int) -> None:
+        """启动进度转发和workers个工作协程."""
+        try:
+            await self.client.xgroup_create(
+                self.stream, self.group, id="0", mkstream=True
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+        self._tasks.append(asyncio.create_task(self.forward_events()))
+        prefix = f"{socket.gethostname()}-{os.getpid()}"
+        for index in range(workers):
+            self._tasks.append(asyncio.create_task(self._consume(f"{prefix}-{index}")))
+
+    async def stop(self) -> None:
+        """停止工作协程; 未完成的任务不确认, 由其他消费者认领后继续."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def forward_events(self) -> None:
+        """转发进度事件; 订阅断开或出错时记录日志并重新订阅."""
+        while True:
+            try:
+                await self._listen()
+                logger.warning("入库进度订阅已结束, 重新订阅")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"入库进度订阅失败: {e}, 重新订阅")
+            await asyncio.sleep(self.retry_delay)
+
+    async def _listen(self) -> None:
+        """订阅进度频道, 把事件推送给本进程中上传者的WebSocket连接."""
+        pubsub = self.client.pubsub()
+        try:
+            await pubsub.subscribe(self.channel)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    await self._deliver(message["data"])
+        finally:
+            try:
+                await pubsub.unsubscribe(self.channel)
+                await pubsub.aclose()
+            except Exception as e:
+                logger.warning(f"关闭入库进度订阅失败: {e}")
+
+    async def _deliver(self, data: str) -> None:
+        """推送单个进度事件."""
+        try:
+            event = json.loads(data)
+            await ws_manager.send_personal_message(event, event["user_id"])
+        except Exception as e:
+            logger.warning(f"推送入库进度失败: {e}")
+
+    async def _spool(self, chunks: AsyncIterator[bytes], key: str) -> int:
+        """把上传内容按读取大小分段追加到Redis列表, 返回字节数."""
+        size = 0
+        buffer = bytearray()
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                size += len(chunk)
+                if len(buffer) >= settings.RAG_UPLOAD_READ_SIZE:
+                    await self.binary_client.rpush(key, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await self.binary_client.rpush(key, bytes(buffer))
+            await self.binary_client.expire(key, settings.RAG_INGEST_JOB_TTL)
+        except BaseException:
+            await self.binary_client.delete(key)
+            raise
+        return size
+
+    async def _read(self, job: IngestJob) -> AsyncIterator[bytes]:
+        """逐段读取暂存内容, 同时记录已读取的字节数."""
+        key = self._data_key(job.id)
+        index = 0
+        while chunks := await self.binary_client.lrange(key, index, index):
+            index += 1
+            job.processed_bytes += len(chunks[0])
+            yield chunks[0]
+
+    async def _save(self, job: IngestJob) -> None:
+        """保存任务记录."""
+        job.updated_at = time.time()
+        await self.client.set(
+            self._key(job.id),
+            job.model_dump_json(),
+            ex=settings.RAG_INGEST_JOB_TTL,
+        )
+
+    async def _publish(self, job: IngestJob) -> None:
+        """发布进度事件."""
+        try:
+            await self.client.publish(
+                self.channel,
+                json.dumps(job.event(), ensure_ascii=False),
+            )
+        except Exception as e:
+            logger.warning(f"发布入库进度失败: {e}")
+
+    async def _next(self, consumer: str) -> Optional[Tuple[str, Dict[str, str]]]:
+        """取下一个任务消息: 优先认领失联消费者长时间未确认的任务."""
+        response = await self.client.xautoclaim(
+            self.stream,
+            self.group,
+            consumer,
+            min_idle_time=self.claim_idle_ms,
+            start_id="0-0",
+            count=1,
+        )
+        if response[1]:
+            return response[1][0]
+
+        response = await self.client.xreadgroup(
+            self.group,
+            consumer,
+            {self.stream: ">"},
+            count=1,
+            block=self.block_ms,
+        )
+        if response and response[0][1]:
+            return response[0][1][0]
+        return None
+
+    async def _consume(self, consumer: str) -> None:
+        """工作协程: 逐个执行任务, 完成后确认消息."""
+        while True:
+            try:
+                entry = await self._next(consumer)
+                if entry is None:
+                    continue
+                message_id, fields = entry
+                await self._process(consumer, message_id, (fields or {}).get("job_id"))
+                await self.client.xack(self.stream, self.group, message_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"入库任务消费失败: {e}")
+                await asyncio.sleep(self.retry_delay)
+
+    async def _heartbeat(self, consumer: str, message_id: str) -> None:
+        """执行期间定期重新认领消息, 重置空闲时间, 避免被其他消费者接手."""
+        while True:
+            await asyncio.sleep(self.claim_idle_ms / 3000)
+            await self.client.xclaim(
+                self.stream,
+                self.group,
+                consumer,
+                min_idle_time=0,
+                message_ids=[message_id],
+                justid=True,
+            )
+
+    async def _process(
+        self,
+        consumer: str,
+        message_id: str,
+        job_id: Optional[str],
+    ) -> None:
+        """执行一个任务."""
+        job = await self.get(job_id) if job_id else None
+        if job is None or job.status in FINISHED:
+            return
+
+        job.attempts += 1
+        if job.attempts > self.max_attempts:
+            await self._finish(job, FAILED, f"超过最大尝试次数({self.max_attempts})")
+            return
+
+        job.status, job.started_at, job.error = RUNNING, time.time(), None
+        job.chunks = job.skipped = job.failed = job.processed_bytes = 0
+        await self._save(job)
+        await self._publish(job)
+        if job.attempts > 1:
+            logger.info(f"入库任务{job.id}第{job.attempts}次执行, 跳过已提交的分块")
+
+        last_publish = time.monotonic()
+
+        async def progress(result: IngestResult) -> None:
+            nonlocal last_publish
+            self._apply(job, result)
+            if time.monotonic() - last_publish >= self.progress_interval:
+                last_publish = time.monotonic()
+                await self._save(job)
+                await self._publish(job)
+
+        heartbeat = asyncio.create_task(self._heartbeat(consumer, message_id))
+        try:
+            result = await self.service.add_document_stream(
+                decode_stream(self._read(job)),
+                metadata=job.metadata,
+                on_progress=progress,
+                priority=Priority.BATCH,
+            )
+        except Exception as e:
+            result = IngestResult(success=False, error=str(e))
+        finally:
+            heartbeat.cancel()
+
+        self._apply(job, result)
+        await self._finish(job, SUCCEEDED if result.success else FAILED, result.error)
+
+    def _apply(self, job: IngestJob, result: IngestResult) -> None:
+        """以入库结果更新任务计数."""
+        job.chunks = result.chunks
+        job.skipped = result.skipped
+        job.failed = result.failed
+
+    async def _finish(self, job: IngestJob, status: str, error: Optional[str]) -> None:
+        """结束任务并删除暂存内容."""
+        job.status, job.error = status, error
+        await self._save(job)
+        await self._publish(job)
+        await self.binary_client.delete(self._data_key(job.id))
+
+        metrics.rag_ingest_jobs_total.labels(status=status).inc()
+        if job.started_at is not None:
+            metrics.rag_ingest_job_duration_seconds.labels(status=status).observe(
+                time.time() - job.started_at
+            )
+        logger.info(
+            f"入库任务结束: {job.id}, 状态{status}, 新增分块{job.chunks}个, "
+            f"跳过{job.skipped}个, 失败{job.failed}个"
+        )
+
+
+ingest_jobs = IngestJobQueue(rag_service)
@@ -0,0 +1,95 @@
+"""嵌入请求微批处理."""
+import asyncio
+import contextvars
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from scriptai.core import metrics
+from scriptai.core.openai import Priority, current_priority, llm_priority
+
+# 优先级从高到低
+_PRIORITY_ORDER = list(Priority)
+
+
+class EmbeddingBatcher:
+    """跨请求的嵌入微批处理器.
+
+    在一个很短的时间窗口内收集并发的单条编码请求, 窗口到期或达到批大小上限时
+    合并为一次批量请求, 再把各自的向量分发给对应的调用方. 批量请求以批内
+    最高的优先级排队, 交互查询不会因为批次由后台调用方发起而被降级; 批量
+    请求不属于任何用户, 不会把其他用户的用量计入发起批次的用户的额度.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[List[str]], Awaitable[List[List[float]]]],
+        window_ms: float,
+        max_batch_size: int,
+        backend: str = "openai",
+    ) -> None:
+        """初始化微批处理器."""
+        self._encode = encode
+        self.window = window_ms / 1000
+        self.max_batch_size = max(1, max_batch_size)
+        self.backend = backend
+        # (文本, 结果future, 提交者的优先级)
+        self._pending: List[Tuple[str, asyncio.Future, Priority]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, text: str) -> List[float]:
+        """提交一条文本, 等待其所在批次完成后返回向量."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, current_priority()))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """发出当前批次."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        priority = min((item[2] for item in batch), key=_PRIORITY_ORDER.index)
+        # 在空白上下文中创建任务, 不继承发起者的用户和优先级
+        task = contextvars.Context().run(self._start, batch, priority)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _start(
+        self,
+        batch: List[Tuple[str, asyncio.Future, Priority]],
+        priority: Priority,
+    ) -> asyncio.Task:
+        """以指定优先级创建批次任务."""
+        with llm_priority(priority):
+            return asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future, Priority]]) -> None:
+        """执行一次批量编码并分发结果."""
+        metrics.ai_embedding_microbatch_fill_ratio.labels(
+            backend=self.backend,
+        ).observe(len(batch) / self.max_batch_size)
+
+        # 相同文本只编码一次
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            embeddings = await self._encode(texts)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        vectors = dict(zip(texts, embeddings))
+        for text, future, _ in batch:
+            if not future.done():
+                future.set_result(vectors[text])
@@ -0,0 +1,105 @@
+"""本地嵌入模型实现."""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+
+from loguru import logger
+
+from scriptai.config import settings
+from scriptai.services.rag.base import EmbeddingModel
+from scriptai.services.rag.models.batching import EmbeddingBatcher
+
+
+class LocalEmbedding(EmbeddingModel):
+    """基于sentence-transformers的本地CPU嵌入模型.
+
+    推理在专用线程池中执行, 不阻塞事件循环; 并发的查询编码先经微批合并,
+    再以一次前向计算完成.
+    """
+
+    def __init__(
+        self,
+        model_name: str = settings.RAG_LOCAL_EMBEDDING_MODEL,
+        device: str = settings.RAG_LOCAL_EMBEDDING_DEVICE,
+        batch_size: int = settings.RAG_LOCAL_EMBEDDING_BATCH_SIZE,
+        window_ms: float = settings.RAG_QUERY_BATCH_WINDOW_MS,
+        max_batch_size: int = settings.RAG_QUERY_BATCH_MAX_SIZE,
+    ) -> None:
+        """初始化本地嵌入模型.
+
+        模型在首次编码时加载; window_ms小于等于0时关闭查询微批.
+        """
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self._model: Optional[Any] = None
+        self._model_lock = threading.Lock()
+        # 单线程执行推理: 底层算子自身已多线程并行, 多个前向计算并发只会争抢CPU
+        self._executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="local-embedding",
+        )
+        self._batcher: Optional[EmbeddingBatcher] = None
+        if window_ms > 0:
+            self._batcher = EmbeddingBatcher(
+                self.encode,
+                window_ms=window_ms,
+                max_batch_size=max_batch_size,
+                backend="local",
+            )
+
+    def _load_model(self) -> Any:
+        """加载模型."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    try:
+                        from sentence_transformers import SentenceTransformer
+                    except ImportError as e:
+                        raise RuntimeError("本地嵌入需要安装sentence-transformers") from e
+                    logger.info(f"加载本地嵌入模型: {self.model_name} ({self.device})")
+                    self._model = SentenceTransformer(
+                        self.model_name,
+                        device=self.device,
+                    )
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        """向量维度."""
+        return self._load_model().get_sentence_embedding_dimension()
+
+    def _encode_sync(self, texts: List[str]) -> List[List[float]]:
+        """同步编码(在线程池中执行)."""
+        vectors = self._load_model().encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return vectors.tolist()
+
+    async def warmup(self) -> None:
+        """预加载模型, 避免首个请求承担加载耗时."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._load_model)
+
+    async def encode(self, texts: List[str]) -> List[List[float]]:
+        """编码文本."""
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._encode_sync, texts)
+
+    async def encode_query(self, text: str) -> List[float]:
+        """编码查询."""
+        if self._batcher is not None:
+            return await self._batcher.submit(text)
+        embeddings = await self.encode([text])
+        return embeddings[0]
+
+    def close(self) -> None:
+        """释放推理线程池."""
+        self._executor.shutdown(wait=False)
@@ -1,19 +1,41 @@
 """OpenAI模型实现."""
-from typing import Any, Dict, List
+from typing import Any, AsyncIterator, Dict, List, Optional
 
+from scriptai.config import settings
 from scriptai.core.openai import openai_client
 from scriptai.services.rag.base import EmbeddingModel, LLMModel
+from scriptai.services.rag.models.batching import EmbeddingBatcher
+from scriptai.services.rag.tokens import pack_context
 
 
 class OpenAIEmbedding(EmbeddingModel):
     """OpenAI嵌入模型实现."""
 
+    def __init__(
+        self,
+        window_ms: float = settings.RAG_QUERY_BATCH_WINDOW_MS,
+        max_batch_size: int = settings.RAG_QUERY_BATCH_MAX_SIZE,
+    ) -> None:
+        """初始化OpenAI嵌入模型.
+
+        window_ms小于等于0时关闭查询微批.
+        """
+        self._batcher: Optional[EmbeddingBatcher] = None
+        if window_ms > 0:
+            self._batcher = EmbeddingBatcher(
+                self.encode,
+                window_ms=window_ms,
+                max_batch_size=max_batch_size,
+            )
+
     async def encode(self, texts: List[str]) -> List[List[float]]:
         """文本编码."""
         return await openai_client.create_embeddings(texts)
 
     async def encode_query(self, text: str) -> List[float]:
         """查询编码."""
+        if self._batcher:
+            return await self._batcher.submit(text)
         embeddings = await openai_client.create_embeddings([text])
         return embeddings[0]
 
@@ -21,15 +43,7 @@ class OpenAIEmbedding(EmbeddingModel):
 class OpenAILLM(LLMModel):
     """OpenAI大语言模型实现."""
 
-    async def generate(
-        self,
-        prompt: str,
-        context: List[str],
-        **kwargs: Dict[str, Any],
-    ) -> str:
-        """生成文本."""
-        # 构建提示词
-        system_prompt = """你是一个专业的剧本创作助手。
+    SYSTEM_PROMPT = """你是一个专业的剧本创作助手。
 你的任务是根据用户的问题和提供的参考资料，给出专业、有见地的建议。
 你的回答应该：
 1. 准确理解用户的问题
@@ -47,20 +61,52 @@ class OpenAILLM(LLMModel):
 - 注意建议的可行性
 - 尊重创作者的创意"""
 
-        # 格式化提示词
-        formatted_system_prompt = system_prompt.format(
-            context="\n\n".join(context),
-        )
+    def __init__(
+        self,
+        context_token_budget: int = settings.RAG_CONTEXT_TOKEN_BUDGET,
+    ) -> None:
+        """初始化OpenAI大语言模型.
+
+        context_token_budget为参考资料的token预算, 检索结果按分数顺序
+        装入, 超出预算的部分不进入提示词.
+        """
+        self.context_token_budget = context_token_budget
+
+    def _build_system_prompt(self, context: List[str]) -> str:
+        """格式化系统提示词."""
+        packed = pack_context(context, self.context_token_budget, separator="\n\n")
+        return self.SYSTEM_PROMPT.format(context="\n\n".join(packed))
 
+    async def generate(
+        self,
+        prompt: str,
+        context: List[str],
+        **kwargs: Dict[str, Any],
+    ) -> str:
+        """生成文本."""
         # 调用API
         response = await openai_client.create_completion(
             prompt=prompt,
-            system_prompt=formatted_system_prompt,
+            system_prompt=self._build_system_prompt(context),
             **kwargs,
         )
 
         return response
 
+    async def generate_stream(
+        self,
+        prompt: str,
+        context: List[str],
+        **kwargs: Dict[str, Any],
+    ) -> AsyncIterator[str]:
+        """流式生成文本."""
+        async for token in openai_client.create_completion_stream(
+            prompt=prompt,
+            system_prompt=self._build_system_prompt(context),
+            **kwargs,
+        ):
+            yield token
+
     async def rewrite_query(self, query: str) -> str:
         """重写查询."""
         system_prompt = """你是一个专业的剧本创作助手。
@@ -0,0 +1,359 @@
+"""剧本结构感知的文本处理器.
+
+按场景标题、角色提示和对白块切分剧本: 分块与场景对齐, 对白块不被切断,
+每个分块附带所属场景和出场角色元数据.
+"""
+import re
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from scriptai.services.rag.base import TextProcessor
+from scriptai.services.rag.processors.text import (
+    DefaultTextProcessor,
+    TextProcessingConfig,
+)
+
+# 场景标题: "### 场景1：办公室 - 日 - 内景"、"第一场 内景 咖啡馆 - 日"、
+# "内景 咖啡馆 - 日"、"INT. COFFEE SHOP - DAY"
+_SCENE_HEADING = re.compile(
+    r"^(?:#{1,6}\s*)?"
+    r"(?:场景\s*[\d一二三四五六七八九十百]+"
+    r"|第\s*[\d一二三四五六七八九十百]+\s*场"
+    r"|(?:内景|外景|内外景)(?=[\s：:，,.-]|$)"
+    r"|(?:INT|EXT|INT\./EXT|I/E)[.\s])"
+)
+# 多行文本中的场景标题行, 用于确定流式分段的切分位置
+_SCENE_LINE = re.compile(_SCENE_HEADING.pattern, re.MULTILINE)
+# Markdown章节标题(幕、人物表等)
+_SECTION_HEADING = re.compile(r"^#{1,6}\s+")
+# 中文角色提示: "林晓：（回过神来）"或"林晓：台词"
+_CUE = re.compile(r"^([^\s：:（()）#\-*+>|，。！？、；“”\"']{1,12})[：:]")
+# 英文角色提示: 独占一行的大写人名, 可带括号提示
+_CUE_EN = re.compile(r"^([A-Z][A-Z0-9 .'\-]{0,30}[A-Z0-9.])\s*(?:\([^)]*\))?$")
+
+_BLANK_LINES = re.compile(r"\n(?:[ \t]*\n)+")
+
+# 分块中各块之间的分隔符
+_SEPARATOR = "\n\n"
+
+# 行/块的类型
+_SCENE = "scene"
+_SECTION = "section"
+_BODY = "body"
+
+
+def _heading_text(line: str) -> str:
+    """去掉Markdown标记后的标题文本."""
+    return line.lstrip("#").strip()
+
+
+def _cue_name(line: str) -> Optional[str]:
+    """角色提示行中的角色名, 不是角色提示时返回None."""
+    match = _CUE.match(line)
+    if match:
+        return match.group(1)
+    match = _CUE_EN.match(line)
+    if match:
+        return match.group(1).strip()
+    return None
+
+
+class _Chunk:
+    """装配中的分块: 文本片段、长度和场景/角色元数据."""
+
+    __slots__ = ("parts", "size", "scenes", "scene_index", "section", "characters")
+
+    def __init__(self) -> None:
+        """初始化空分块."""
+        self.parts: List[str] = []
+        self.size = 0
+        self.scenes: List[str] = []
+        self.scene_index: Optional[int] = None
+        self.section: Optional[str] = None
+        self.characters: List[str] = []
+
+    def add_character(self, name: Optional[str]) -> None:
+        """记录出场角色."""
+        if name is not None and name not in self.characters:
+            self.characters.append(name)
+
+    def merge(self, other: "_Chunk", separator_size: int) -> None:
+        """把另一个分块接在后面."""
+        self.parts.extend(other.parts)
+        self.size += other.size + (separator_size if self.size else 0)
+        self.scenes.extend(other.scenes)
+        if self.scene_index is None:
+            self.scene_index = other.scene_index
+        if self.section is None:
+            self.section = other.section
+        for name in other.characters:
+            self.add_character(name)
+
+    def emit(self) -> Tuple[str, Dict[str, Any]]:
+        """生成(分块文本, 分块元数据)."""
+        metadata: Dict[str, Any] = {}
+        if self.scenes:
+            metadata["scene"] = self.scenes[0]
+            metadata["scene_index"] = self.scene_index
+            metadata["scenes"] = list(self.scenes)
+        if self.section is not None:
+            metadata["section"] = self.section
+        if self.characters:
+            metadata["characters"] = list(self.characters)
+        return _SEPARATOR.join(self.parts), metadata
+
+
+class _ScanState:
+    """流式分块时跨文本段保留的扫描状态."""
+
+    __slots__ = (
+        "section",
+        "scene_index",
+        "unit",
+        "header",
+        "header_size",
+        "continued",
+    )
+
+    def __init__(self) -> None:
+        """初始化扫描状态."""
+        self.section: Optional[str] = None
+        self.scene_index = -1
+        # 上一段末尾场景的标题与元数据, 下一段开头的正文接在其后
+        self.unit = _Chunk()
+        self.header: List[str] = []
+        self.header_size = 0
+        self.continued = False
+
+
+class ScreenplayTextProcessor(TextProcessor):
+    """剧本文本处理器实现.
+
+    单次线性扫描识别场景标题、章节标题、角色提示和对白块. 分块只在场景
+    边界处断开, 相邻的完整场景在chunk_size内合并为一块; 场景过长时在块
+    边界续分, 续块以场景标题开头; 单个块超过chunk_size时才按句子切分.
+    """
+
+    def __init__(self, config: Optional[TextProcessingConfig] = None) -> None:
+        """初始化文本处理器."""
+        self.config = config or TextProcessingConfig()
+        self._fallback = DefaultTextProcessor(self.config)
+
+    def _blocks(self, text: str) -> Iterator[Tuple[str, str, Optional[str]]]:
+        """逐行扫描, 生成(类型, 文本, 角色名).
+
+        对白块为角色提示行及其后直到空行、标题或下一个角色提示的各行;
+        其余连续非空行构成动作/描写段落.
+        """
+        lines: List[str] = []
+        character: Optional[str] = None
+
+        for line in text.split("\n"):
+            line = line.strip()
+            if not line:
+                if lines:
+                    yield _BODY, "\n".join(lines), character
+                    lines, character = [], None
+                continue
+
+            kind = (
+                _SCENE
+                if _SCENE_HEADING.match(line)
+                else _SECTION
+                if _SECTION_HEADING.match(line)
+                else None
+            )
+            if kind is not None:
+                if lines:
+                    yield _BODY, "\n".join(lines), character
+                    lines, character = [], None
+                yield kind, line, None
+                continue
+
+            name = _cue_name(line)
+            if name is not None:
+                if lines:
+                    yield _BODY, "\n".join(lines), character
+                lines, character = [line], name
+                continue
+
+            lines.append(line)
+
+        if lines:
+            yield _BODY, "\n".join(lines), character
+
+    def _pieces(self, block: str, budget: int) -> Iterator[str]:
+        """把超长的块按句子切成不超过budget的片段."""
+        config = self.config.model_copy(
+            update={
+                "chunk_size": max(budget, 1),
+                "chunk_overlap": 0,
+                "min_chunk_size": 0,
+            }
+        )
+        return DefaultTextProcessor(config).iter_split(block)
+
+    def iter_split_with_metadata(
+        self,
+        text: str,
+        state: Optional[_ScanState] = None,
+        final: bool = True,
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """单次扫描文本, 惰性生成(分块, 分块元数据).
+
+        分块元数据包含scene(首个场景标题)、scene_index(首个场景序号,
+        从0开始)、scenes(块内全部场景标题)、section(所在章节标题)和
+        characters(按出场顺序的角色名). 额外内存只与chunk_size相关.
+
+        流式分块时按顺序对每段文本调用, 共用同一个state; 除最后一段外
+        final为False, 段末只有标题的场景留待下一段.
+        """
+        size = self.config.chunk_size
+        measure = self._fallback._measure
+        separator_size = measure(_SEPARATOR)
+
+        state = state or _ScanState()
+        section = state.section
+        scene_index = state.scene_index
+        # 已装入完整场景、等待继续合并的分块
+        done = _Chunk()
+        # 当前场景: 标题行与已读到的正文块
+        unit = state.unit
+        header = list(state.header)
+        header_size = state.header_size
+        # 当前场景是否有尚未输出的正文、是否已输出过续块
+        has_body, continued = False, state.continued
+
+        def start_unit() -> _Chunk:
+            """以当前场景的标题开始新的分块."""
+            chunk = _Chunk()
+            chunk.parts = list(header)
+            chunk.size = header_size
+            chunk.scenes = unit.scenes[-1:]
+            chunk.scene_index = unit.scene_index
+            chunk.section = unit.section
+            return chunk
+
+        for kind, block, character in self._blocks(text):
+            length = measure(block)
+
+            if kind != _BODY:
+                if has_body:
+                    # 当前场景结束: 放得下则并入已有分块, 否则先输出已有分块
+                    if done.parts and done.size + separator_size + unit.size > size:
+                        yield done.emit()
+                        done = _Chunk()
+                    done.merge(unit, separator_size)
+                if has_body or continued:
+                    unit, header, header_size = _Chunk(), [], 0
+                    has_body = continued = False
+                if kind == _SCENE:
+                    scene_index += 1
+                    unit.scenes = [_heading_text(block)]
+                    unit.scene_index = scene_index
+                else:
+                    section = _heading_text(block)
+                    unit.scenes, unit.scene_index = [], None
+                if unit.section is None or not unit.parts:
+                    unit.section = section
+                header.append(block)
+                header_size += length + (separator_size if header_size else 0)
+                unit.parts.append(block)
+                unit.size = header_size
+                continue
+
+            if unit.size + separator_size + length > size:
+                # 当前场景单独一块也放不下: 输出已有内容, 续块以场景标题开头
+                if done.parts:
+                    yield done.emit()
+                    done = _Chunk()
+                if has_body:
+                    yield unit.emit()
+                # 标题过长时不再作为续块前缀
+                if header_size + separator_size >= size:
+                    header, header_size = [], 0
+                unit = start_unit()
+                has_body, continued = False, True
+
+                if unit.size + separator_size + length > size:
+                    # 单个块放不下: 按句子切分, 每片都以场景标题开头
+                    budget = size - unit.size - separator_size
+                    for piece in self._pieces(block, budget):
+                        chunk = start_unit()
+                        chunk.parts.append(piece)
+                        chunk.add_character(character)
+                        yield chunk.emit()
+                    continue
+
+            unit.parts.append(block)
+            unit.size += length + (separator_size if unit.size else 0)
+            unit.add_character(character)
+            has_body = True
+
+        # 保存状态供下一段使用: 已输出正文的场景在下一段以续块继续
+        state.section, state.scene_index = section, scene_index
+        state.header, state.header_size = header, header_size
+        state.unit = start_unit() if has_body or continued else unit
+        state.continued = has_body or continued
+
+        if unit.parts and (has_body or not continued) and (has_body or final):
+            if done.parts and done.size + separator_size + unit.size > size:
+                yield done.emit()
+                done = _Chunk()
+            done.merge(unit, separator_size)
+        if done.parts:
+            yield done.emit()
+
+    def segment_boundary(self, text: str) -> int:
+        """流式入库时文本段的切分位置: 优先在最后一个场景标题之前."""
+        position = 0
+        for match in _SCENE_LINE.finditer(text):
+            position = match.start()
+        return position or super().segment_boundary(text)
+
+    async def split_stream(
+        self,
+        segments: AsyncIterator[str],
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """对按段到达的文本逐段分块, 场景序号、章节和未结束的场景跨段延续."""
+        state = _ScanState()
+        previous: Optional[str] = None
+        async for segment in segments:
+            if previous is not None:
+                cleaned = await self.clean(previous)
+                for item in self.iter_split_with_metadata(cleaned, state, final=False):
+                    yield item
+            previous = segment
+        if previous is not None:
+            for item in self.iter_split_with_metadata(
+                await self.clean(previous), state
+            ):
+                yield item
+
+    async def split(self, text: str) -> List[str]:
+        """文本分块."""
+        return [chunk for chunk, _ in await self.split_with_metadata(text)]
+
+    async def split_with_metadata(self, text: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """文本分块, 同时返回每个分块的场景和角色元数据."""
+        if not text:
+            return []
+        return list(self.iter_split_with_metadata(text))
+
+    async def clean(self, text: str) -> str:
+        """文本清理.
+
+        剧本的行结构即格式, 只规整每行内的空白并把连续空行合并为一个空行,
+        保留换行.
+        """
+        if not text:
+            return ""
+        lines = (" ".join(line.split()) for line in text.splitlines())
+        return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+    async def extract_metadata(self, text: str) -> Dict[str, Any]:
+        """提取元数据."""
+        metadata = await self._fallback.extract_metadata(text)
+        metadata["scene_count"] = sum(
+            1 for line in text.split("\n") if _SCENE_HEADING.match(line.strip())
+        )
+        return metadata
@@ -1,16 +1,69 @@
 """文本处理器实现."""
 import re
-from typing import Any, Dict, List, Optional
+from collections import deque
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
 
 from pydantic import BaseModel, Field
 
+from scriptai.core.tokens import token_counter
 from scriptai.services.rag.base import TextProcessor
 
+# 句子: 到句末标点(含)为止; 末尾没有标点的部分单独成句
+_SENTENCE_PATTERN = re.compile(r"[^。！？.!?]*[。！？.!?]|[^。！？.!?]+")
+
+_URL = re.compile(
+    r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+"
+)
+_EMAIL = re.compile(r"[\w\.-]+@[\w\.-]+\.\w+")
+# 等价于把每段\s+替换为一个空格, 但跳过已经是单个空格的位置, 替换次数更少
+_EXTRA_SPACES = re.compile(r"[^\S ]\s*| \s+")
+
+
+@lru_cache(maxsize=None)
+def _clean_steps(
+    preserve_line_breaks: bool,
+    remove_extra_spaces: bool,
+    remove_urls: bool,
+    remove_email: bool,
+    normalize_whitespace: bool,
+) -> Tuple[Callable[[str], str], ...]:
+    """按清理配置生成处理步骤, 每种配置只生成一次."""
+    steps: List[Callable[[str], str]] = []
+
+    # 保存原始换行符
+    if preserve_line_breaks:
+        steps.append(lambda text: text.replace("\n", " <br> "))
+
+    # 移除多余空格. 随后还要标准化空白时这一步不影响结果: URL和邮箱都不含
+    # 空白, 是否先折叠空白不改变它们的匹配, 标准化又会重新折叠所有空白
+    if remove_extra_spaces and not normalize_whitespace:
+        steps.append(lambda text: _EXTRA_SPACES.sub(" ", text))
+
+    # 移除URL
+    if remove_urls:
+        steps.append(lambda text: _URL.sub("", text))
+
+    # 移除邮箱
+    if remove_email:
+        steps.append(lambda text: _EMAIL.sub("", text))
+
+    # 标准化空白字符
+    if normalize_whitespace:
+        steps.append(lambda text: " ".join(text.split()))
+
+    # 恢复换行符
+    if preserve_line_breaks:
+        steps.append(lambda text: text.replace(" <br> ", "\n"))
+
+    return tuple(steps)
+
 
 class TextProcessingConfig(BaseModel):
     """文本处理配置."""
 
-    # 分块配置
+    # 分块配置, 长度单位为字符(char)或token
+    chunk_unit: str = Field(default="char", pattern="^(char|token)$")
     chunk_size: int = Field(default=500, ge=100, le=2000)
     chunk_overlap: int = Field(default=50, ge=0, le=200)
     min_chunk_size: int = Field(default=100, ge=50, le=500)
@@ -37,69 +90,110 @@ class DefaultTextProcessor(TextProcessor):
         """文本分块."""
         if not text:
             return []
-
-        chunks = []
-        current_chunk = []
-        current_size = 0
-
-        # 按句子分割
-        sentences = re.split(r"([。！？.!?])", text)
-
-        for i in range(0, len(sentences), 2):
-            sentence = sentences[i]
-            if i + 1 < len(sentences):
-                sentence += sentences[i + 1]
-
-            sentence_size = len(sentence)
-
-            if current_size + sentence_size > self.config.chunk_size:
-                if current_chunk:
-                    chunks.append("".join(current_chunk))
-                current_chunk = [sentence]
-                current_size = sentence_size
-            else:
-                current_chunk.append(sentence)
-                current_size += sentence_size
-
-        if current_chunk:
-            chunks.append("".join(current_chunk))
-
-        # 后处理
-        return await self._post_process_chunks(chunks)
+        return list(self.iter_split(text))
+
+    def _measure(self, text: str) -> int:
+        """按分块单位计算长度."""
+        if self.config.chunk_unit == "token":
+            return token_counter.count(text)
+        return len(text)
+
+    def _cut(self, text: str, limit: int, keep: str = "head") -> str:
+        """截取长度不超过limit的前缀或后缀."""
+        if self.config.chunk_unit == "token":
+            return token_counter.truncate(text, limit, keep=keep)
+        if limit <= 0:
+            return ""
+        return text[:limit] if keep == "head" else text[-limit:]
+
+    def _sentences(self, text: str) -> Iterator[Tuple[str, int]]:
+        """逐句扫描文本, 生成(句子, 长度); 超过chunk_size的句子硬切."""
+        size = self.config.chunk_size
+        for match in _SENTENCE_PATTERN.finditer(text):
+            sentence = match.group()
+            length = self._measure(sentence)
+            while length > size:
+                piece = self._cut(sentence, size) or sentence[:1]
+                yield piece, self._measure(piece)
+                sentence = sentence[len(piece) :]
+                length = self._measure(sentence)
+            if sentence:
+                yield sentence, length
+
+    def _overlap_tail(
+        self,
+        window: Deque[Tuple[str, int]],
+    ) -> Tuple[Deque[Tuple[str, int]], int]:
+        """取窗口末尾不超过chunk_overlap的整句作为下一块的开头.
+
+        最后一句就超过重叠长度时, 退化为截取其末尾部分.
+        """
+        overlap = self.config.chunk_overlap
+        tail: Deque[Tuple[str, int]] = deque()
+        tail_size = 0
+        for sentence, length in reversed(window):
+            if tail_size + length > overlap:
+                break
+            tail.appendleft((sentence, length))
+            tail_size += length
+        if not tail and overlap > 0 and window:
+            piece = self._cut(window[-1][0], overlap, keep="tail")
+            if piece:
+                tail_size = self._measure(piece)
+                tail.append((piece, tail_size))
+        return tail, tail_size
+
+    def iter_split(self, text: str) -> Iterator[str]:
+        """单次扫描文本, 按句子边界惰性生成分块.
+
+        长度按chunk_unit计量, 相邻分块重叠约chunk_overlap; 额外内存只与
+        chunk_size相关, 与文档长度无关. 末块新增内容不足min_chunk_size时
+        并入上一块, 不丢弃内容.
+        """
+        size = self.config.chunk_size
+        window: Deque[Tuple[str, int]] = deque()
+        window_size = 0
+        # 窗口中尚未输出过的长度与字符数(不含重叠部分)
+        fresh = fresh_chars = 0
+        # 已完成但暂缓输出的上一块, 以便合并过小的末块
+        pending: Optional[str] = None
+
+        for sentence, length in self._sentences(text):
+            if fresh and window_size + length > size:
+                if pending is not None and pending.strip():
+                    yield pending.strip()
+                pending = "".join(item for item, _ in window)
+                window, window_size = self._overlap_tail(window)
+                # 重叠部分放不下时不保留
+                if window_size + length > size:
+                    window, window_size = deque(), 0
+                fresh = fresh_chars = 0
+            window.append((sentence, length))
+            window_size += length
+            fresh += length
+            fresh_chars += len(sentence)
+
+        last = "".join(item for item, _ in window) if fresh_chars else ""
+        if pending is not None and fresh < self.config.min_chunk_size:
+            pending, last = pending + last[len(last) - fresh_chars :], ""
+        for chunk in (pending, last):
+            if chunk and chunk.strip():
+                yield chunk.strip()
 
     async def clean(self, text: str) -> str:
         """文本清理."""
         if not text:
             return ""
 
-        # 保存原始换行符
-        if self.config.preserve_line_breaks:
-            text = text.replace("\n", " <br> ")
-
-        # 移除多余空格
-        if self.config.remove_extra_spaces:
-            text = re.sub(r"\s+", " ", text)
-
-        # 移除URL
-        if self.config.remove_urls:
-            text = re.sub(
-                r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+",
-                "",
-                text,
-            )
-
-        # 移除邮箱
-        if self.config.remove_email:
-            text = re.sub(r"[\w\.-]+@[\w\.-]+\.\w+", "", text)
-
-        # 标准化空白字符
-        if self.config.normalize_whitespace:
-            text = " ".join(text.split())
-
-        # 恢复换行符
-        if self.config.preserve_line_breaks:
-            text = text.replace(" <br> ", "\n")
-
+        config = self.config
+        for step in _clean_steps(
+            config.preserve_line_breaks,
+            config.remove_extra_spaces,
+            config.remove_urls,
+            config.remove_email,
+            config.normalize_whitespace,
+        ):
+            text = step(text)
         return text.strip()
 
     async def extract_metadata(self, text: str) -> Dict[str, Any]:
@@ -127,21 +221,4 @@ class DefaultTextProcessor(TextProcessor):
         if date_match:
             metadata["date"] = date_match.group()
 
-        return metadata
-
-    async def _post_process_chunks(self, chunks: List[str]) -> List[str]:
-        """后处理分块."""
-        processed_chunks = []
-
-        for chunk in chunks:
-            # 跳过过小的块
-            if len(chunk) < self.config.min_chunk_size:
-                continue
-
-            # 清理块
-            chunk = chunk.strip()
-
-            # 添加到结果
-            processed_chunks.append(chunk)
-
-        return processed_chunks 
\ No newline at end of file
+        return metadata
\ No newline at end of file
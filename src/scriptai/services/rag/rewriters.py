@@ -0,0 +1,176 @@
+"""查询重写策略实现."""
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from scriptai.core.redis import redis_client
+from scriptai.services.rag.base import LLMModel, QueryRewriter
+
+
+class NoopRewriter(QueryRewriter):
+    """不做重写, 直接使用原始查询."""
+
+    async def rewrite(self, query: str) -> str:
+        """重写查询."""
+        return query
+
+
+class CachedLLMRewriter(QueryRewriter):
+    """带两级缓存的LLM查询重写.
+
+    一级为进程内LRU, 二级为Redis(跨进程共享), 都未命中时才调用LLM.
+    """
+
+    def __init__(
+        self,
+        llm_model: LLMModel,
+        max_entries: int = 1024,
+        ttl: int = 86400,
+        use_redis: bool = True,
+    ) -> None:
+        """初始化重写器."""
+        self.llm_model = llm_model
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.use_redis = use_redis
+        # 查询 -> (重写结果, 写入时间)
+        self._local: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    @staticmethod
+    def _cache_key(query: str) -> str:
+        """生成Redis缓存键."""
+        return f"rewrite:{hashlib.sha256(query.encode('utf-8')).hexdigest()}"
+
+    def _get_local(self, query: str) -> Optional[str]:
+        """读取进程内缓存."""
+        entry = self._local.get(query)
+        if entry is None:
+            return None
+        rewritten, created_at = entry
+        if time.time() - created_at > self.ttl:
+            del self._local[query]
+            return None
+        self._local.move_to_end(query)
+        return rewritten
+
+    def _set_local(self, query: str, rewritten: str) -> None:
+        """写入进程内缓存."""
+        self._local[query] = (rewritten, time.time())
+        self._local.move_to_end(query)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def rewrite(self, query: str) -> str:
+        """重写查询."""
+        if (rewritten := self._get_local(query)) is not None:
+            return rewritten
+
+        if self.use_redis:
+            try:
+                rewritten = await redis_client.get(self._cache_key(query))
+            except Exception as e:
+                logger.warning(f"读取查询重写缓存失败: {e}")
+            if rewritten:
+                self._set_local(query, rewritten)
+                return rewritten
+
+        rewritten = await self.llm_model.rewrite_query(query)
+        self._set_local(query, rewritten)
+
+        if self.use_redis:
+            try:
+                await redis_client.set(
+                    self._cache_key(query),
+                    rewritten,
+                    expire=self.ttl,
+                )
+            except Exception as e:
+                logger.warning(f"写入查询重写缓存失败: {e}")
+        return rewritten
+
+
+# 剧本术语扩展表: 触发词 -> 追加的相关术语
+SCREENPLAY_TERMS: Dict[str, List[str]] = {
+    "三幕": ["三幕结构", "建置", "对抗", "结局"],
+    "第一幕": ["建置", "激励事件", "情节点一"],
+    "第二幕": ["对抗", "中点", "情节点二"],
+    "第三幕": ["结局", "高潮", "解决"],
+    "高潮": ["高潮", "危机", "转折点"],
+    "转折": ["转折点", "情节点"],
+    "中点": ["中点", "反转"],
+    "开场": ["开场", "激励事件", "建置"],
+    "结尾": ["结局", "收尾", "余韵"],
+    "结局": ["结局", "解决", "收尾"],
+    "冲突": ["戏剧冲突", "对抗", "障碍"],
+    "伏笔": ["伏笔", "铺垫", "呼应"],
+    "节奏": ["节奏", "情节推进", "场景长度"],
+    "主题": ["主题", "立意", "核心思想"],
+    "人物": ["人物塑造", "人物动机", "人物关系"],
+    "角色": ["人物塑造", "人物动机", "人物弧光"],
+    "弧光": ["人物弧光", "角色成长", "内在转变"],
+    "动机": ["人物动机", "目标", "欲望"],
+    "对白": ["对话", "台词", "潜台词"],
+    "对话": ["对白", "台词", "潜台词"],
+    "台词": ["对白", "对话", "潜台词"],
+    "潜台词": ["潜台词", "言外之意"],
+    "场景": ["场景", "场景标题", "内景", "外景"],
+    "内景": ["内景", "INT."],
+    "外景": ["外景", "EXT."],
+    "旁白": ["旁白", "V.O."],
+    "画外音": ["画外音", "O.S."],
+    "格式": ["剧本格式", "场景标题", "动作描写", "人物提示"],
+    "INT.": ["内景", "场景标题"],
+    "EXT.": ["外景", "场景标题"],
+    "O.S.": ["画外音", "off-screen"],
+    "V.O.": ["旁白", "voice-over"],
+    "act": ["幕", "三幕结构"],
+    "climax": ["高潮", "climax"],
+    "plot point": ["情节点", "转折点"],
+    "subtext": ["潜台词"],
+    "dialogue": ["对白", "台词"],
+    "character arc": ["人物弧光"],
+    "scene heading": ["场景标题", "INT.", "EXT."],
+}
+
+
+class TemplateRewriter(QueryRewriter):
+    """基于剧本术语表的本地查询扩展.
+
+    不调用LLM, 按触发词为查询追加相关的专业术语, 以提升召回.
+    """
+
+    def __init__(self, terms: Optional[Dict[str, List[str]]] = None) -> None:
+        """初始化重写器."""
+        self.terms = terms or SCREENPLAY_TERMS
+        # 按长度降序匹配, 保证"第一幕"优先于"幕"类的短词
+        triggers = sorted(self.terms, key=len, reverse=True)
+        self._pattern = re.compile(
+            "|".join(self._trigger_pattern(trigger) for trigger in triggers),
+            re.IGNORECASE,
+        )
+        self._lookup = {trigger.lower(): trigger for trigger in self.terms}
+
+    @staticmethod
+    def _trigger_pattern(trigger: str) -> str:
+        """触发词的正则; 拉丁字母触发词须独立成词, 避免act匹配characters."""
+        pattern = re.escape(trigger)
+        if trigger.isascii():
+            pattern = f"(?<![A-Za-z]){pattern}(?![A-Za-z])"
+        return pattern
+
+    async def rewrite(self, query: str) -> str:
+        """重写查询."""
+        expansions: Dict[str, None] = {}
+        for match in self._pattern.finditer(query):
+            trigger = self._lookup[match.group().lower()]
+            for term in self.terms[trigger]:
+                if term.lower() not in query.lower():
+                    expansions[term] = None
+
+        if not expansions:
+            return query
+        return f"{query} {' '.join(expansions)}"
@@ -1,41 +1,161 @@
 """RAG服务实现."""
-from typing import Any, Dict, List, Optional
-
-from scriptai.services.rag.base import RAGService
+import asyncio
+from typing import Any, AsyncIterator, Dict
+
+from scriptai.config import settings
+from scriptai.core.openai import current_user_id
+from scriptai.services.rag.base import (
+    EmbeddingModel,
+    IngestConfig,
+    RAGService,
+    TextProcessor,
+    VectorStore,
+)
+from scriptai.services.rag.cache import SemanticCache
+from scriptai.services.rag.models.local import LocalEmbedding
 from scriptai.services.rag.models.openai import OpenAIEmbedding, OpenAILLM
-from scriptai.services.rag.processors.text import DefaultTextProcessor
+from scriptai.services.rag.processors.screenplay import ScreenplayTextProcessor
+from scriptai.services.rag.processors.text import (
+    DefaultTextProcessor,
+    TextProcessingConfig,
+)
+from scriptai.services.rag.rewriters import (
+    CachedLLMRewriter,
+    NoopRewriter,
+    TemplateRewriter,
+)
+from scriptai.services.rag.stores.hnsw import HNSWVectorStore
+from scriptai.services.rag.stores.lexical import LexicalIndex
+from scriptai.services.rag.stores.memory import InMemoryVectorStore
 from scriptai.services.rag.stores.milvus import MilvusVectorStore
 
 
+def create_embedding_model(backend: str) -> EmbeddingModel:
+    """按配置创建嵌入模型."""
+    if backend == "openai":
+        return OpenAIEmbedding()
+    if backend == "local":
+        return LocalEmbedding()
+    raise ValueError(f"不支持的嵌入后端: {backend}")
+
+
+def create_text_processor(name: str) -> TextProcessor:
+    """按配置创建文本处理器."""
+    config = TextProcessingConfig(chunk_unit=settings.RAG_CHUNK_UNIT)
+    if name == "screenplay":
+        return ScreenplayTextProcessor(config)
+    if name == "default":
+        return DefaultTextProcessor(config)
+    raise ValueError(f"不支持的文本处理器: {name}")
+
+
+def create_vector_store(backend: str) -> VectorStore:
+    """按配置创建向量存储."""
+    if backend == "milvus":
+        return MilvusVectorStore()
+    if backend == "memory":
+        return InMemoryVectorStore(
+            path=settings.RAG_MEMORY_STORE_PATH,
+            metric=settings.RAG_MEMORY_STORE_METRIC,
+            persist_rows=settings.RAG_MEMORY_STORE_PERSIST_ROWS,
+            persist_interval=settings.RAG_MEMORY_STORE_PERSIST_INTERVAL,
+        )
+    if backend == "hnsw":
+        return HNSWVectorStore(
+            path=settings.RAG_MEMORY_STORE_PATH,
+            metric=settings.RAG_MEMORY_STORE_METRIC,
+            persist_rows=settings.RAG_MEMORY_STORE_PERSIST_ROWS,
+            persist_interval=settings.RAG_MEMORY_STORE_PERSIST_INTERVAL,
+            m=settings.RAG_HNSW_M,
+            ef_construction=settings.RAG_HNSW_EF_CONSTRUCTION,
+            ef_search=settings.RAG_HNSW_EF_SEARCH,
+        )
+    raise ValueError(f"不支持的向量存储: {backend}")
+
+
 class ScriptRAGService(RAGService):
     """剧本RAG服务实现."""
 
     def __init__(self) -> None:
         """初始化剧本RAG服务."""
+        llm_model = OpenAILLM()
         super().__init__(
-            vector_store=MilvusVectorStore(),
-            text_processor=DefaultTextProcessor(),
-            embedding_model=OpenAIEmbedding(),
-            llm_model=OpenAILLM(),
+            vector_store=create_vector_store(settings.RAG_VECTOR_STORE),
+            text_processor=create_text_processor(settings.RAG_TEXT_PROCESSOR),
+            embedding_model=create_embedding_model(settings.RAG_EMBEDDING_BACKEND),
+            llm_model=llm_model,
+            semantic_cache=(
+                SemanticCache(
+                    threshold=settings.RAG_SEMANTIC_CACHE_THRESHOLD,
+                    max_entries=settings.RAG_SEMANTIC_CACHE_MAX_ENTRIES,
+                    ttl=settings.RAG_SEMANTIC_CACHE_TTL,
+                )
+                if settings.RAG_SEMANTIC_CACHE_ENABLED
+                else None
+            ),
+            query_rewriters={
+                "none": NoopRewriter(),
+                "llm": CachedLLMRewriter(
+                    llm_model,
+                    max_entries=settings.RAG_QUERY_REWRITE_CACHE_SIZE,
+                    ttl=settings.RAG_QUERY_REWRITE_CACHE_TTL,
+                ),
+                "template": TemplateRewriter(),
+            },
+            rewrite_mode=settings.RAG_QUERY_REWRITE_MODE,
+            lexical_index=(
+                LexicalIndex(settings.RAG_LEXICAL_INDEX_PATH)
+                if settings.RAG_HYBRID_SEARCH_ENABLED
+                else None
+            ),
+            rrf_k=settings.RAG_RRF_K,
+            hybrid_candidates=settings.RAG_HYBRID_CANDIDATES,
+            ingest_config=IngestConfig(
+                workers=settings.RAG_INGEST_WORKERS,
+                queue_size=settings.RAG_INGEST_QUEUE_SIZE,
+                embed_batch_size=settings.RAG_INGEST_EMBED_BATCH_SIZE,
+                embed_concurrency=settings.RAG_INGEST_EMBED_CONCURRENCY,
+                insert_batch_size=settings.RAG_INGEST_INSERT_BATCH_SIZE,
+                stream_segment_size=settings.RAG_INGEST_STREAM_SEGMENT_SIZE,
+            ),
         )
 
     async def initialize(self) -> None:
         """初始化服务."""
         await self.vector_store.connect()
+        if isinstance(self.embedding_model, LocalEmbedding):
+            await self.embedding_model.warmup()
+        if self.lexical_index is not None:
+            await asyncio.to_thread(self.lexical_index.load)
 
     async def close(self) -> None:
         """关闭服务."""
+        self.shutdown_ingest_pool()
+        if self.lexical_index is not None:
+            await self.lexical_index.persist(compact=True)
         await self.vector_store.close()
-
-    async def get_writing_suggestions(
+        if isinstance(self.embedding_model, LocalEmbedding):
+            self.embedding_model.close()
+
+    @staticmethod
+    def _cache_options(endpoint: str, *texts: str) -> Dict[str, Any]:
+        """模板类接口的语义缓存选项.
+
+        按接口和当前用户隔离, 并只用用户提交的内容做相似度匹配, 避免不同
+        用户的剧本因共用提示词模板而命中彼此的回答.
+        """
+        return {
+            "cache_scope": f"{endpoint}:{current_user_id()}",
+            "cache_text": "\n".join(texts),
+        }
+
+    def _build_writing_suggestions_prompt(
         self,
         context: str,
         query: str,
-        **kwargs: Dict[str, Any],
     ) -> str:
-        """获取写作建议."""
-        # 构建提示词
-        prompt = f"""基于以下剧本内容：
+        """构建写作建议提示词."""
+        return f"""基于以下剧本内容：
 
 {context}
 
@@ -44,17 +164,37 @@ class ScriptRAGService(RAGService):
 
 请给出专业的写作建议。"""
 
+    async def get_writing_suggestions(
+        self,
+        context: str,
+        query: str,
+        **kwargs: Dict[str, Any],
+    ) -> str:
+        """获取写作建议."""
+        prompt = self._build_writing_suggestions_prompt(context, query)
+        options = self._cache_options("writing_suggestions", context, query)
+
         # 生成建议
-        return await self.generate(prompt, **kwargs)
+        return await self.generate(prompt, **options, **kwargs)
 
-    async def get_character_suggestions(
+    async def stream_writing_suggestions(
         self,
-        character_description: str,
+        context: str,
+        query: str,
         **kwargs: Dict[str, Any],
+    ) -> AsyncIterator[str]:
+        """流式获取写作建议."""
+        prompt = self._build_writing_suggestions_prompt(context, query)
+        options = self._cache_options("writing_suggestions", context, query)
+        async for token in self.generate_stream(prompt, **options, **kwargs):
+            yield token
+
+    def _build_character_suggestions_prompt(
+        self,
+        character_description: str,
     ) -> str:
-        """获取角色设计建议."""
-        # 构建提示词
-        prompt = f"""基于以下角色描述：
+        """构建角色设计建议提示词."""
+        return f"""基于以下角色描述：
 
 {character_description}
 
@@ -65,17 +205,35 @@ class ScriptRAGService(RAGService):
 4. 角色发展的可能性和冲突点
 5. 角色对话和行为特征的设计"""
 
+    async def get_character_suggestions(
+        self,
+        character_description: str,
+        **kwargs: Dict[str, Any],
+    ) -> str:
+        """获取角色设计建议."""
+        prompt = self._build_character_suggestions_prompt(character_description)
+        options = self._cache_options("character_suggestions", character_description)
+
         # 生成建议
-        return await self.generate(prompt, **kwargs)
+        return await self.generate(prompt, **options, **kwargs)
 
-    async def get_plot_suggestions(
+    async def stream_character_suggestions(
         self,
-        plot_description: str,
+        character_description: str,
         **kwargs: Dict[str, Any],
+    ) -> AsyncIterator[str]:
+        """流式获取角色设计建议."""
+        prompt = self._build_character_suggestions_prompt(character_description)
+        options = self._cache_options("character_suggestions", character_description)
+        async for token in self.generate_stream(prompt, **options, **kwargs):
+            yield token
+
+    def _build_plot_suggestions_prompt(
+        self,
+        plot_description: str,
     ) -> str:
-        """获取情节设计建议."""
-        # 构建提示词
-        prompt = f"""基于以下情节描述：
+        """构建情节设计建议提示词."""
+        return f"""基于以下情节描述：
 
 {plot_description}
 
@@ -86,17 +244,35 @@ class ScriptRAGService(RAGService):
 4. 人物关系的发展和互动
 5. 主题表达的深度和方式"""
 
+    async def get_plot_suggestions(
+        self,
+        plot_description: str,
+        **kwargs: Dict[str, Any],
+    ) -> str:
+        """获取情节设计建议."""
+        prompt = self._build_plot_suggestions_prompt(plot_description)
+        options = self._cache_options("plot_suggestions", plot_description)
+
         # 生成建议
-        return await self.generate(prompt, **kwargs)
+        return await self.generate(prompt, **options, **kwargs)
 
-    async def get_dialogue_suggestions(
+    async def stream_plot_suggestions(
         self,
-        dialogue: str,
+        plot_description: str,
         **kwargs: Dict[str, Any],
+    ) -> AsyncIterator[str]:
+        """流式获取情节设计建议."""
+        prompt = self._build_plot_suggestions_prompt(plot_description)
+        options = self._cache_options("plot_suggestions", plot_description)
+        async for token in self.generate_stream(prompt, **options, **kwargs):
+            yield token
+
+    def _build_dialogue_suggestions_prompt(
+        self,
+        dialogue: str,
     ) -> str:
-        """获取对话优化建议."""
-        # 构建提示词
-        prompt = f"""基于以下对话内容：
+        """构建对话优化建议提示词."""
+        return f"""基于以下对话内容：
 
 {dialogue}
 
@@ -107,17 +283,35 @@ class ScriptRAGService(RAGService):
 4. 节奏和韵律感
 5. 情感表达的效果"""
 
+    async def get_dialogue_suggestions(
+        self,
+        dialogue: str,
+        **kwargs: Dict[str, Any],
+    ) -> str:
+        """获取对话优化建议."""
+        prompt = self._build_dialogue_suggestions_prompt(dialogue)
+        options = self._cache_options("dialogue_suggestions", dialogue)
+
         # 生成建议
-        return await self.generate(prompt, **kwargs)
+        return await self.generate(prompt, **options, **kwargs)
 
-    async def get_scene_suggestions(
+    async def stream_dialogue_suggestions(
         self,
-        scene_description: str,
+        dialogue: str,
         **kwargs: Dict[str, Any],
+    ) -> AsyncIterator[str]:
+        """流式获取对话优化建议."""
+        prompt = self._build_dialogue_suggestions_prompt(dialogue)
+        options = self._cache_options("dialogue_suggestions", dialogue)
+        async for token in self.generate_stream(prompt, **options, **kwargs):
+            yield token
+
+    def _build_scene_suggestions_prompt(
+        self,
+        scene_description: str,
     ) -> str:
-        """获取场景设计建议."""
-        # 构建提示词
-        prompt = f"""基于以下场景描述：
+        """构建场景设计建议提示词."""
+        return f"""基于以下场景描述：
 
 {scene_description}
 
@@ -128,17 +322,35 @@ class ScriptRAGService(RAGService):
 4. 场景转换的处理
 5. 戏剧冲突的设置"""
 
+    async def get_scene_suggestions(
+        self,
+        scene_description: str,
+        **kwargs: Dict[str, Any],
+    ) -> str:
+        """获取场景设计建议."""
+        prompt = self._build_scene_suggestions_prompt(scene_description)
+        options = self._cache_options("scene_suggestions", scene_description)
+
         # 生成建议
-        return await self.generate(prompt, **kwargs)
+        return await self.generate(prompt, **options, **kwargs)
 
-    async def get_structure_analysis(
+    async def stream_scene_suggestions(
         self,
-        script_content: str,
+        scene_description: str,
         **kwargs: Dict[str, Any],
+    ) -> AsyncIterator[str]:
+        """流式获取场景设计建议."""
+        prompt = self._build_scene_suggestions_prompt(scene_description)
+        options = self._cache_options("scene_suggestions", scene_description)
+        async for token in self.generate_stream(prompt, **options, **kwargs):
+            yield token
+
+    def _build_structure_analysis_prompt(
+        self,
+        script_content: str,
     ) -> str:
-        """获取结构分析."""
-        # 构建提示词
-        prompt = f"""基于以下剧本内容：
+        """构建结构分析提示词."""
+        return f"""基于以下剧本内容：
 
 {script_content}
 
@@ -149,9 +361,29 @@ class ScriptRAGService(RAGService):
 4. 故事节奏的控制
 5. 主线和支线的编排"""
 
+    async def get_structure_analysis(
+        self,
+        script_content: str,
+        **kwargs: Dict[str, Any],
+    ) -> str:
+        """获取结构分析."""
+        prompt = self._build_structure_analysis_prompt(script_content)
+        options = self._cache_options("structure_analysis", script_content)
+
         # 生成分析
-        return await self.generate(prompt, **kwargs)
+        return await self.generate(prompt, **options, **kwargs)
+
+    async def stream_structure_analysis(
+        self,
+        script_content: str,
+        **kwargs: Dict[str, Any],
+    ) -> AsyncIterator[str]:
+        """流式获取结构分析."""
+        prompt = self._build_structure_analysis_prompt(script_content)
+        options = self._cache_options("structure_analysis", script_content)
+        async for token in self.generate_stream(prompt, **options, **kwargs):
+            yield token
 
 
 # 创建全局RAG服务实例
-rag_service = ScriptRAGService() 
\ No newline at end of file
+rag_service = ScriptRAGService()
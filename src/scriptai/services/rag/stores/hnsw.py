@@ -0,0 +1,453 @@
+"""基于HNSW图的近似最近邻向量存储实现."""
+import asyncio
+import heapq
+import math
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from scriptai.services.rag.base import Document, SearchResult
+from scriptai.services.rag.stores.memory import (
+    DEFAULT_INDEXED_FIELDS,
+    InMemoryVectorStore,
+)
+
+# 重建时整体替换的状态属性
+_STATE_ATTRS = (
+    "_vectors",
+    "_sq_norms",
+    "_alive",
+    "_size",
+    "_contents",
+    "_metadata",
+    "_masks",
+    "_ids",
+    "_columns",
+    "_levels",
+    "_links0",
+    "_upper_rows",
+    "_upper_links",
+    "_entry",
+    "_max_level",
+)
+
+
+class HNSWVectorStore(InMemoryVectorStore):
+    """HNSW近似检索向量存储.
+
+    向量、元数据、过滤掩码和持久化沿用InMemoryVectorStore; 在此之上维护一张
+    分层可导航小世界图, 邻接表全部存放在定长int32数组中:
+    第0层每个节点一行(2M列), 上层只为出现在该层的节点分配行.
+    删除为标记删除, 已删除节点仍参与图遍历但不出现在结果中,
+    删除比例过高时在持久化前重建图. 图插入和重建是纯Python循环, 持有写锁
+    在线程中执行, 不阻塞事件循环.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        metric: str = "cosine",
+        indexed_fields: Iterable[str] = DEFAULT_INDEXED_FIELDS,
+        initial_capacity: int = 1024,
+        persist_rows: int = 1000,
+        persist_interval: float = 60.0,
+        m: int = 16,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        exact_threshold: int = 1024,
+        seed: Optional[int] = None,
+    ) -> None:
+        """初始化HNSW向量存储.
+
+        Args:
+            path: 持久化路径前缀, 为空时不落盘
+            metric: 相似度度量, cosine或l2
+            indexed_fields: 预建过滤掩码的元数据字段
+            initial_capacity: 初始矩阵容量
+            persist_rows: 累计变更多少行后自动落盘, 0表示只在关闭时落盘
+            persist_interval: 有未保存的变更且距上次落盘超过该秒数时自动落盘
+            m: 上层每个节点的最大邻居数(第0层为2m)
+            ef_construction: 构建时的候选集大小
+            ef_search: 检索时的候选集大小
+            exact_threshold: 满足过滤条件的文档数不超过该值时改用精确检索
+            seed: 层级随机数种子
+        """
+        super().__init__(
+            path=path,
+            metric=metric,
+            indexed_fields=indexed_fields,
+            initial_capacity=initial_capacity,
+            persist_rows=persist_rows,
+            persist_interval=persist_interval,
+        )
+        self.m = m
+        self.m0 = 2 * m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.exact_threshold = exact_threshold
+        self._level_mult = 1 / math.log(m)
+        self._rng = np.random.default_rng(seed)
+        self._reset_graph()
+
+    def _reset_graph(self) -> None:
+        """清空图结构."""
+        self._levels = np.zeros(0, dtype=np.int8)
+        self._links0 = np.full((0, self.m0), -1, dtype=np.int32)
+        # 第l层(l>=1): 节点 -> 行号, 以及该层的邻接数组
+        self._upper_rows: List[Dict[int, int]] = []
+        self._upper_links: List[np.ndarray] = []
+        self._entry = -1
+        self._max_level = -1
+
+    @property
+    def _graph_path(self) -> Path:
+        """图文件路径."""
+        return self.path.with_suffix(".graph.npz")
+
+    def _reserve(self, count: int, dimension: int) -> None:
+        """扩容时同步扩展第0层邻接数组."""
+        super()._reserve(count, dimension)
+        self._reserve_graph(self._vectors.shape[0])
+
+    def _reserve_graph(self, capacity: int) -> None:
+        """确保第0层邻接数组至少有capacity行."""
+        if len(self._levels) < capacity:
+            levels = np.zeros(capacity, dtype=np.int8)
+            levels[: len(self._levels)] = self._levels
+            links0 = np.full((capacity, self.m0), -1, dtype=np.int32)
+            links0[: len(self._links0)] = self._links0
+            self._levels, self._links0 = levels, links0
+
+    def _links(self, node: int, level: int) -> np.ndarray:
+        """节点在某层的邻接行(视图)."""
+        if level == 0:
+            return self._links0[node]
+        return self._upper_links[level - 1][self._upper_rows[level - 1][node]]
+
+    def _neighbors(self, node: int, level: int) -> np.ndarray:
+        """节点在某层的邻居."""
+        links = self._links(node, level)
+        return links[links >= 0]
+
+    def _set_neighbors(self, node: int, level: int, neighbors: List[int]) -> None:
+        """覆盖节点在某层的邻居."""
+        links = self._links(node, level)
+        links.fill(-1)
+        links[: len(neighbors)] = neighbors
+
+    def _allocate_upper(self, node: int, level: int) -> None:
+        """为节点分配第1至level层的邻接行."""
+        for lc in range(1, level + 1):
+            if len(self._upper_rows) < lc:
+                self._upper_rows.append({})
+                self._upper_links.append(np.full((16, self.m), -1, dtype=np.int32))
+            rows, links = self._upper_rows[lc - 1], self._upper_links[lc - 1]
+            if len(rows) == len(links):
+                grown = np.full((len(links) * 2, self.m), -1, dtype=np.int32)
+                grown[: len(links)] = links
+                self._upper_links[lc - 1] = grown
+            rows[node] = len(rows)
+
+    def _scores(self, query: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+        """相似度分数, 越大越相似(L2为负的平方距离)."""
+        dots = self._vectors[nodes] @ query
+        if self.metric == "cosine":
+            return dots
+        return 2 * dots - self._sq_norms[nodes] - query @ query
+
+    def _search_layer(
+        self,
+        query: np.ndarray,
+        entry_points: List[int],
+        ef: int,
+        level: int,
+    ) -> List[Tuple[float, int]]:
+        """在单层上做贪心束搜索, 返回按分数降序的(分数, 节点)列表."""
+        visited = set(entry_points)
+        scores = self._scores(query, np.asarray(entry_points)).tolist()
+        # candidates为最大堆(取负), results为最小堆(堆顶为当前最差结果)
+        candidates = [(-score, node) for score, node in zip(scores, entry_points)]
+        results = [(score, node) for score, node in zip(scores, entry_points)]
+        heapq.heapify(candidates)
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            neg_score, node = heapq.heappop(candidates)
+            if -neg_score < results[0][0] and len(results) >= ef:
+                break
+            neighbors = [
+                neighbor
+                for neighbor in self._neighbors(node, level).tolist()
+                if neighbor not in visited
+            ]
+            if not neighbors:
+                continue
+            visited.update(neighbors)
+            scores = self._scores(query, np.asarray(neighbors)).tolist()
+            for score, neighbor in zip(scores, neighbors):
+                if len(results) < ef or score > results[0][0]:
+                    heapq.heappush(candidates, (-score, neighbor))
+                    heapq.heappush(results, (score, neighbor))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return sorted(results, reverse=True)
+
+    def _select_neighbors(
+        self,
+        candidates: List[Tuple[float, int]],
+        limit: int,
+    ) -> List[int]:
+        """启发式选择邻居: 只保留比已选邻居更接近目标的候选, 使连接方向分散."""
+        if len(candidates) <= 1:
+            return [node for _, node in candidates]
+        nodes = np.asarray([node for _, node in candidates])
+        vectors = self._vectors[nodes]
+        # 候选两两之间的分数, 一次矩阵乘法算出
+        pairwise = vectors @ vectors.T
+        if self.metric == "l2":
+            sq_norms = self._sq_norms[nodes]
+            pairwise = 2 * pairwise - sq_norms[:, None] - sq_norms[None, :]
+
+        selected: List[int] = []
+        for i, (score, _) in enumerate(candidates):
+            if len(selected) >= limit:
+                break
+            if selected and (pairwise[i, selected] > score).any():
+                continue
+            selected.append(i)
+        return nodes[selected].tolist()
+
+    def _insert(self, node: int) -> None:
+        """将已写入矩阵的节点插入图中."""
+        query = np.asarray(self._vectors[node])
+        level = int(-math.log(1.0 - self._rng.random()) * self._level_mult)
+        self._levels[node] = level
+        self._allocate_upper(node, level)
+
+        if self._entry < 0:
+            self._entry, self._max_level = node, level
+            return
+
+        entry_points = [self._entry]
+        for lc in range(self._max_level, level, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, lc)[0][1]]
+
+        for lc in range(min(level, self._max_level), -1, -1):
+            candidates = self._search_layer(
+                query,
+                entry_points,
+                self.ef_construction,
+                lc,
+            )
+            neighbors = self._select_neighbors(candidates, self.m)
+            self._set_neighbors(node, lc, neighbors)
+
+            # 建立反向连接, 邻居已满时重新挑选
+            max_links = self.m0 if lc == 0 else self.m
+            for neighbor in neighbors:
+                links = self._links(neighbor, lc)
+                count = int((links >= 0).sum())
+                if count < max_links:
+                    links[count] = node
+                    continue
+                pool = np.append(links, node)
+                scores = self._scores(np.asarray(self._vectors[neighbor]), pool)
+                order = np.argsort(-scores)
+                self._set_neighbors(
+                    neighbor,
+                    lc,
+                    self._select_neighbors(
+                        [(float(scores[i]), int(pool[i])) for i in order],
+                        max_links,
+                    ),
+                )
+            entry_points = [node for _, node in candidates]
+
+        if level > self._max_level:
+            self._entry, self._max_level = node, level
+
+    def _insert_range(self, begin: int, end: int) -> None:
+        """依次插入[begin, end)的节点."""
+        for node in range(begin, end):
+            self._insert(node)
+
+    async def add(
+        self,
+        documents: List[Document],
+        embeddings: List[List[float]],
+    ) -> bool:
+        """添加文档并插入图中.
+
+        新节点在插入图之前已可被精确检索到, 插入期间的检索不受影响.
+        """
+        async with self._lock:
+            begin = self._size
+            if not self._add(documents, embeddings):
+                return False
+            await asyncio.to_thread(self._insert_range, begin, self._size)
+        await self._maybe_persist()
+        return True
+
+    async def delete(
+        self,
+        filter: Dict[str, Any],
+    ) -> bool:
+        """删除文档(标记删除), 等待进行中的插入或重建完成."""
+        async with self._lock:
+            if not self._delete(filter):
+                return False
+        await self._maybe_persist()
+        return True
+
+    async def search(
+        self,
+        query_vector: List[float],
+        limit: int = 5,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[SearchResult]:
+        """近似检索相似文档."""
+        if self._size == 0 or limit <= 0:
+            return []
+        mask = self._filter_mask(filter)
+        allowed = int(mask.sum())
+        if allowed == 0:
+            return []
+        if allowed <= self.exact_threshold or self._entry < 0:
+            return await super().search(query_vector, limit, filter)
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        if self.metric == "cosine":
+            norm = np.linalg.norm(query)
+            query = query / norm if norm else query
+
+        # 过滤越严格, 第0层需要越大的候选集才能凑满结果
+        ef = max(self.ef_search, limit) * min(math.ceil(self._size / allowed), 8)
+        entry_points = [self._entry]
+        for lc in range(self._max_level, 0, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, lc)[0][1]]
+        candidates = self._search_layer(query, entry_points, ef, 0)
+
+        return [
+            SearchResult(
+                content=self._contents[node],
+                score=score if self.metric == "cosine" else 1.0 + score,
+                metadata=self._metadata[node],
+            )
+            for score, node in candidates
+            if mask[node]
+        ][:limit]
+
+    def _rebuilt(self) -> "HNSWVectorStore":
+        """丢弃已删除的行, 在新实例上重建图; 不修改当前实例, 可在线程中执行."""
+        rows = np.flatnonzero(self._alive[: self._size])
+        store = HNSWVectorStore(
+            metric=self.metric,
+            indexed_fields=self.indexed_fields,
+            initial_capacity=self.initial_capacity,
+            m=self.m,
+            ef_construction=self.ef_construction,
+            ef_search=self.ef_search,
+            exact_threshold=self.exact_threshold,
+        )
+        store._rng = self._rng
+
+        capacity = max(self.initial_capacity, len(rows))
+        store._vectors = np.zeros((capacity, self._vectors.shape[1]), dtype=np.float32)
+        store._vectors[: len(rows)] = self._vectors[rows]
+        store._sq_norms = np.zeros(capacity, dtype=np.float32)
+        store._sq_norms[: len(rows)] = self._sq_norms[rows]
+        store._alive = np.zeros(capacity, dtype=bool)
+        store._alive[: len(rows)] = True
+        store._size = len(rows)
+        store._contents = [self._contents[row] for row in rows]
+        store._metadata = [self._metadata[row] for row in rows]
+        store._reserve_graph(capacity)
+        for node, item in enumerate(store._metadata):
+            store._index_metadata(node, item)
+            store._insert(node)
+        return store
+
+    async def _rebuild(self) -> None:
+        """在线程中重建图, 完成后一次性替换状态, 检索始终看到完整的图."""
+        store = await asyncio.to_thread(self._rebuilt)
+        for attr in _STATE_ATTRS:
+            setattr(self, attr, getattr(store, attr))
+
+    def load(self) -> None:
+        """加载向量和图结构, 图文件缺失或不一致时重建.
+
+        由connect在线程中调用, 重建不阻塞事件循环; 已删除的行由向量存储
+        的元数据文件记录, 重建时不会恢复.
+        """
+        super().load()
+        if self._vectors is None:
+            return
+        # 只扩展图数组, 向量矩阵保持内存映射
+        self._reset_graph()
+        self._reserve_graph(self._size)
+        try:
+            with np.load(self._graph_path) as graph:
+                if len(graph["levels"]) != self._size:
+                    raise ValueError("图文件与向量文件不一致")
+                self._levels = graph["levels"].copy()
+                self._links0 = graph["links0"].copy()
+                self._entry = int(graph["entry"])
+                self._max_level = int(graph["max_level"])
+                for lc in range(1, self._max_level + 1):
+                    nodes = graph[f"nodes{lc}"]
+                    self._upper_rows.append(
+                        {int(node): row for row, node in enumerate(nodes)}
+                    )
+                    self._upper_links.append(graph[f"links{lc}"].copy())
+        except (FileNotFoundError, KeyError, ValueError) as e:
+            logger.warning(f"加载HNSW图失败, 重新构建: {e}")
+            self._reset_graph()
+            self._reserve_graph(self._size)
+            self._insert_range(0, self._size)
+
+    def _save_graph(self, graph: Dict[str, np.ndarray]) -> None:
+        """写入图文件."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._graph_path.with_suffix(".tmp.npz")
+        np.savez(tmp_path, **graph)
+        tmp_path.replace(self._graph_path)
+
+    async def persist(self) -> None:
+        """持久化向量与图结构.
+
+        行号即图节点编号, 因此不压缩删除的行, 删除标记随向量一起写入;
+        删除超过四分之一时先重建.
+        """
+        if not self.path or not self._dirty or self._vectors is None:
+            return
+        async with self._lock:
+            if len(self) < self._size * 3 / 4:
+                await self._rebuild()
+            size = self._size
+            graph: Dict[str, np.ndarray] = {
+                "levels": self._levels[:size].copy(),
+                "links0": self._links0[:size].copy(),
+                "entry": np.asarray(self._entry),
+                "max_level": np.asarray(self._max_level),
+            }
+            for lc, (rows, links) in enumerate(
+                zip(self._upper_rows, self._upper_links),
+                start=1,
+            ):
+                graph[f"nodes{lc}"] = np.asarray(list(rows), dtype=np.int32)
+                graph[f"links{lc}"] = links[: len(rows)].copy()
+            vectors = np.array(self._vectors[:size])
+            contents = list(self._contents)
+            metadata = list(self._metadata)
+            deleted = np.flatnonzero(~self._alive[:size]).tolist()
+
+            def save() -> None:
+                self._save_graph(graph)
+                self._save(vectors, contents, metadata, deleted)
+
+            await self._write(save)
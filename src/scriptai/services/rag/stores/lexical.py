@@ -0,0 +1,259 @@
+"""进程内BM25倒排索引实现."""
+import asyncio
+import json
+import math
+import os
+import re
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from scriptai.services.rag.base import Document
+from scriptai.services.rag.filters import matches
+
+# 中文按连续汉字切分后取字符二元组, 英文/数字按词切分并保留"O.S."这类带点缩写
+_TOKEN_PATTERN = re.compile(
+    r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[a-z0-9]+(?:[.'][a-z0-9]+)*\.?"
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """将文本切分为检索词."""
+    tokens: List[str] = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        if token[0].isascii():
+            tokens.append(token)
+        elif len(token) == 1:
+            tokens.append(token)
+        else:
+            tokens.extend(token[i : i + 2] for i in range(len(token) - 1))
+    return tokens
+
+
+class LexicalIndex:
+    """BM25倒排索引.
+
+    支持增量添加和删除, 并以追加写日志(JSON Lines)持久化到磁盘:
+    每次变更只追加记录, 日志明显大于有效文档数时整体压缩重写.
+    API进程和导入脚本可以共用同一个日志: 追加和压缩都持有文件锁, 压缩时
+    以磁盘上的完整日志(含其他进程追加的记录)为准重写, 而不是本进程的内存状态.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ) -> None:
+        """初始化倒排索引."""
+        self.path = Path(path) if path else None
+        self.k1 = k1
+        self.b = b
+        # 文档ID -> (内容, 元数据, 长度)
+        self._docs: Dict[str, Tuple[str, Dict[str, Any], int]] = {}
+        # 词 -> {文档ID: 词频}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        # 尚未写入磁盘的变更记录
+        self._pending: List[Dict[str, Any]] = []
+        self._journal_size = 0
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        """文档数."""
+        return len(self._docs)
+
+    def __contains__(self, doc_id: str) -> bool:
+        """是否包含文档."""
+        return doc_id in self._docs
+
+    def _index(
+        self,
+        doc_id: str,
+        content: str,
+        metadata: Dict[str, Any],
+    ) -> None:
+        """写入倒排表."""
+        if doc_id in self._docs:
+            self._unindex(doc_id)
+        tokens = tokenize(content)
+        for term, freq in Counter(tokens).items():
+            self._postings.setdefault(term, {})[doc_id] = freq
+        self._docs[doc_id] = (content, metadata, len(tokens))
+        self._total_length += len(tokens)
+
+    def _unindex(self, doc_id: str) -> bool:
+        """从倒排表中移除."""
+        entry = self._docs.pop(doc_id, None)
+        if entry is None:
+            return False
+        content, _, length = entry
+        for term in set(tokenize(content)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= length
+        return True
+
+    def add(self, ids: List[str], documents: List[Document]) -> None:
+        """添加文档, 已存在的ID会被覆盖."""
+        for doc_id, document in zip(ids, documents):
+            self._index(doc_id, document.content, document.metadata)
+            self._pending.append(
+                {
+                    "op": "add",
+                    "id": doc_id,
+                    "content": document.content,
+                    "metadata": document.metadata,
+                }
+            )
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """按ID删除文档, 返回删除数量."""
+        deleted = 0
+        for doc_id in ids:
+            if self._unindex(doc_id):
+                self._pending.append({"op": "delete", "id": doc_id})
+                deleted += 1
+        return deleted
+
+    def match(self, filter: Optional[Dict[str, Any]]) -> List[str]:
+        """返回元数据满足过滤条件的文档ID, 条件语法见filters模块."""
+        if not filter:
+            return list(self._docs)
+        return [
+            doc_id
+            for doc_id, (_, metadata, _) in self._docs.items()
+            if matches(filter, metadata)
+        ]
+
+    def get(self, doc_id: str) -> Optional[Document]:
+        """获取文档."""
+        entry = self._docs.get(doc_id)
+        if entry is None:
+            return None
+        return Document(content=entry[0], metadata=entry[1])
+
+    def search(
+        self,
+        query: str,
+        limit: int = 5,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Tuple[str, float]]:
+        """BM25检索, 返回(文档ID, 分数)列表."""
+        if not self._docs:
+            return []
+        allowed = set(self.match(filter)) if filter else None
+        n_docs = len(self._docs)
+        avg_length = self._total_length / n_docs or 1.0
+
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, freq in postings.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                length = self._docs[doc_id][2]
+                norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (
+                    self.k1 + 1
+                ) / (freq + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def _records(self) -> Iterator[Dict[str, Any]]:
+        """逐条读取磁盘日志."""
+        if not self.path.exists():
+            return
+        with self.path.open("r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def load(self) -> None:
+        """从磁盘日志恢复索引."""
+        if not self.path:
+            return
+        records = 0
+        with self._file_lock():
+            for record in self._records():
+                records += 1
+                if record["op"] == "add":
+                    self._index(record["id"], record["content"], record["metadata"])
+                elif record["op"] == "delete":
+                    self._unindex(record["id"])
+        self._journal_size = records
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """跨进程独占日志文件(不支持fcntl的平台上不加锁)."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self.path.with_suffix(self.path.suffix + ".lock")
+        with lock_path.open("a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append(self, records: List[Dict[str, Any]]) -> None:
+        """追加写入日志."""
+        with self._file_lock():
+            self._write(self.path, records, "a")
+
+    @staticmethod
+    def _write(path: Path, records: Iterable[Dict[str, Any]], mode: str) -> None:
+        """写入日志记录, 调用方须持有文件锁."""
+        with path.open(mode, encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _compact(self, records: List[Dict[str, Any]]) -> int:
+        """追加本进程的变更后, 以磁盘日志重放出的有效文档重写日志.
+
+        Returns:
+            重写后的记录数
+        """
+        with self._file_lock():
+            self._write(self.path, records, "a")
+            docs: Dict[str, Dict[str, Any]] = {}
+            for record in self._records():
+                if record["op"] == "add":
+                    docs[record["id"]] = record
+                else:
+                    docs.pop(record["id"], None)
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            self._write(tmp_path, docs.values(), "w")
+            os.replace(tmp_path, self.path)
+        return len(docs)
+
+    async def persist(self, compact: bool = False) -> None:
+        """将变更写入磁盘.
+
+        日志记录数超过有效文档数两倍或显式要求时压缩重写.
+        """
+        if not self.path:
+            self._pending.clear()
+            return
+        async with self._lock:
+            records, self._pending = self._pending, []
+            self._journal_size += len(records)
+            if compact or self._journal_size > 2 * max(len(self._docs), 1024):
+                self._journal_size = await asyncio.to_thread(self._compact, records)
+            elif records:
+                await asyncio.to_thread(self._append, records)
@@ -0,0 +1,448 @@
+"""进程内NumPy向量存储实现."""
+import asyncio
+import json
+import os
+import time
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from loguru import logger
+
+from scriptai.services.rag.base import Document, SearchResult, VectorStore
+from scriptai.services.rag.filters import evaluate_mask
+
+# 默认预建过滤掩码的元数据字段
+DEFAULT_INDEXED_FIELDS = ("type", "category", "source", "title", "importance")
+
+# 范围条件 -> 比较函数
+_RANGE_COMPARATORS = {
+    "$gt": np.greater,
+    "$gte": np.greater_equal,
+    "$lt": np.less,
+    "$lte": np.less_equal,
+}
+
+
+class InMemoryVectorStore(VectorStore):
+    """基于连续float32矩阵的向量存储.
+
+    检索为向量化的暴力top-k; 常用元数据字段预先维护布尔掩码, 过滤直接在
+    掩码上完成. 持久化为.npy矩阵和JSON元数据两个文件, 启动时以内存映射
+    方式只读加载, 首次写入时才复制到内存. 变更累计到一定行数或距上次保存
+    超过一定时间后整体快照落盘, 关闭时再保存一次.
+
+    只支持单个worker进程: 每个进程各自持有一份数据并整体覆盖同一组文件,
+    多进程部署时彼此的写入会互相覆盖, 应使用Milvus.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        metric: str = "cosine",
+        indexed_fields: Iterable[str] = DEFAULT_INDEXED_FIELDS,
+        initial_capacity: int = 1024,
+        persist_rows: int = 1000,
+        persist_interval: float = 60.0,
+    ) -> None:
+        """初始化向量存储.
+
+        Args:
+            path: 持久化路径前缀, 为空时不落盘
+            metric: 相似度度量, cosine或l2
+            indexed_fields: 预建过滤掩码的元数据字段
+            initial_capacity: 初始矩阵容量
+            persist_rows: 累计变更多少行后自动落盘, 0表示只在关闭时落盘
+            persist_interval: 有未保存的变更且距上次落盘超过该秒数时自动落盘
+        """
+        if metric not in ("cosine", "l2"):
+            raise ValueError(f"不支持的度量类型: {metric}")
+        self.path = Path(path) if path else None
+        self.metric = metric
+        self.indexed_fields = set(indexed_fields)
+        self.initial_capacity = initial_capacity
+        self.persist_rows = persist_rows
+        self.persist_interval = persist_interval
+
+        self._vectors: Optional[np.ndarray] = None
+        # L2度量下缓存每行的平方范数
+        self._sq_norms: Optional[np.ndarray] = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._size = 0
+        self._contents: List[str] = []
+        self._metadata: List[Dict[str, Any]] = []
+        # (字段, 值) -> 布尔掩码
+        self._masks: Dict[Tuple[str, Any], np.ndarray] = {}
+        # 分块ID -> 行号(仅有效行)
+        self._ids: Dict[str, int] = {}
+        # 字段 -> 数值列(非数值为NaN), 供范围条件使用
+        self._columns: Dict[str, np.ndarray] = {}
+        self._dirty = False
+        # 上次落盘后变更的行数和落盘时间
+        self._changes = 0
+        self._saved_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        """有效文档数."""
+        return int(self._alive[: self._size].sum())
+
+    @property
+    def dimension(self) -> Optional[int]:
+        """向量维度."""
+        return None if self._vectors is None else self._vectors.shape[1]
+
+    @property
+    def _npy_path(self) -> Path:
+        """矩阵文件路径."""
+        return self.path.with_suffix(".npy")
+
+    @property
+    def _meta_path(self) -> Path:
+        """元数据文件路径."""
+        return self.path.with_suffix(".json")
+
+    def _reserve(self, count: int, dimension: int) -> None:
+        """确保矩阵还能容纳count行, 不足时按倍数扩容."""
+        if self._vectors is None:
+            capacity = max(self.initial_capacity, count)
+            self._vectors = np.zeros((capacity, dimension), dtype=np.float32)
+            self._sq_norms = np.zeros(capacity, dtype=np.float32)
+            self._alive = np.zeros(capacity, dtype=bool)
+            return
+
+        capacity = self._vectors.shape[0]
+        # 内存映射的只读矩阵也在这里复制为可写数组
+        if self._size + count <= capacity and self._vectors.flags.writeable:
+            return
+        while capacity < self._size + count:
+            capacity = max(capacity * 2, self.initial_capacity)
+
+        def grow(array: np.ndarray) -> np.ndarray:
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[: self._size] = array[: self._size]
+            return grown
+
+        self._vectors = grow(self._vectors)
+        self._sq_norms = grow(self._sq_norms)
+        self._alive = grow(self._alive)
+        self._masks = {key: grow(mask) for key, mask in self._masks.items()}
+
+    def _index_metadata(self, row: int, metadata: Dict[str, Any]) -> None:
+        """更新预建掩码和分块ID索引."""
+        if "chunk_id" in metadata:
+            self._ids[metadata["chunk_id"]] = row
+        capacity = self._vectors.shape[0]
+        for field in self.indexed_fields:
+            value = metadata.get(field)
+            if value is None or isinstance(value, (list, dict)):
+                continue
+            mask = self._masks.get((field, value))
+            if mask is None:
+                mask = self._masks[(field, value)] = np.zeros(capacity, dtype=bool)
+            mask[row] = True
+
+    def _field_mask(self, field: str, value: Any) -> np.ndarray:
+        """单个字段条件的掩码, 值为列表时表示取其一."""
+        if field == "chunk_id":
+            # 分块ID直接查行号
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            mask = np.zeros(self._size, dtype=bool)
+            rows = [self._ids[key] for key in values if key in self._ids]
+            mask[rows] = True
+            return mask
+
+        if isinstance(value, (list, tuple, set)):
+            mask = np.zeros(self._size, dtype=bool)
+            for item in value:
+                mask |= self._field_mask(field, item)
+            return mask
+
+        if field in self.indexed_fields:
+            mask = self._masks.get((field, value))
+            if mask is None:
+                return np.zeros(self._size, dtype=bool)
+            return mask[: self._size]
+
+        # 未建掩码的字段逐行比较
+        return np.fromiter(
+            (metadata.get(field) == value for metadata in self._metadata),
+            dtype=bool,
+            count=self._size,
+        )
+
+    def _numeric_column(self, field: str) -> np.ndarray:
+        """字段的数值列, 按需构建, 新增的行增量追加."""
+        column = self._columns.get(field)
+        begin = 0 if column is None else len(column)
+        if begin < self._size:
+            values = (
+                metadata.get(field) for metadata in self._metadata[begin : self._size]
+            )
+            tail = np.fromiter(
+                (
+                    value
+                    if isinstance(value, (int, float)) and not isinstance(value, bool)
+                    else np.nan
+                    for value in values
+                ),
+                dtype=np.float64,
+                count=self._size - begin,
+            )
+            column = tail if column is None else np.concatenate([column, tail])
+            self._columns[field] = column
+        return column[: self._size]
+
+    def _condition_mask(self, field: str, operator: str, operand: Any) -> np.ndarray:
+        """单个过滤条件的掩码."""
+        if operator in ("$eq", "$in"):
+            return self._field_mask(field, operand)
+        if operator in ("$ne", "$nin"):
+            return ~self._field_mask(field, operand)
+        # 非数值(NaN)与任何值比较均为False
+        return _RANGE_COMPARATORS[operator](self._numeric_column(field), operand)
+
+    def _filter_mask(self, filter: Optional[Dict[str, Any]]) -> np.ndarray:
+        """过滤条件对应的行掩码(已排除删除的行)."""
+        mask = self._alive[: self._size].copy()
+        if filter:
+            mask &= evaluate_mask(filter, self._size, self._condition_mask)
+        return mask
+
+    async def add(
+        self,
+        documents: List[Document],
+        embeddings: List[List[float]],
+    ) -> bool:
+        """添加文档."""
+        if not self._add(documents, embeddings):
+            return False
+        await self._maybe_persist()
+        return True
+
+    def _add(
+        self,
+        documents: List[Document],
+        embeddings: List[List[float]],
+    ) -> bool:
+        """写入矩阵和元数据索引."""
+        if not documents:
+            return True
+        try:
+            vectors = np.asarray(embeddings, dtype=np.float32)
+            if vectors.ndim != 2 or len(vectors) != len(documents):
+                raise ValueError("嵌入与文档数量不匹配")
+            if self.dimension is not None and vectors.shape[1] != self.dimension:
+                raise ValueError(f"向量维度不匹配: {vectors.shape[1]} != {self.dimension}")
+            if self.metric == "cosine":
+                norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+                vectors = vectors / np.where(norms == 0, 1.0, norms)
+
+            self._reserve(len(vectors), vectors.shape[1])
+            begin, end = self._size, self._size + len(vectors)
+            self._vectors[begin:end] = vectors
+            self._sq_norms[begin:end] = np.einsum("ij,ij->i", vectors, vectors)
+            self._alive[begin:end] = True
+            self._size = end
+            for row, document in enumerate(documents, start=begin):
+                self._contents.append(document.content)
+                self._metadata.append(document.metadata)
+                self._index_metadata(row, document.metadata)
+            self._dirty = True
+            self._changes += len(documents)
+            return True
+        except Exception as e:
+            logger.error(f"添加文档失败: {e}")
+            return False
+
+    async def search(
+        self,
+        query_vector: List[float],
+        limit: int = 5,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[SearchResult]:
+        """搜索相似文档."""
+        if self._size == 0 or limit <= 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        if self.metric == "cosine":
+            norm = np.linalg.norm(query)
+            query = query / norm if norm else query
+
+        rows = np.flatnonzero(self._filter_mask(filter))
+        if len(rows) == 0:
+            return []
+
+        # 过滤后剩余较少时只计算候选行
+        if len(rows) < self._size // 4:
+            vectors = self._vectors[rows]
+            sq_norms = self._sq_norms[rows]
+        else:
+            vectors = self._vectors[: self._size]
+            sq_norms = self._sq_norms[: self._size]
+
+        scores = vectors @ query
+        if self.metric == "l2":
+            # 平方欧氏距离, 取负数使分数越大越相似
+            scores = -(sq_norms - 2 * scores + query @ query)
+
+        if len(scores) != len(rows):
+            scores = scores[rows]
+
+        k = min(limit, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [
+            SearchResult(
+                content=self._contents[rows[i]],
+                score=float(scores[i] if self.metric == "cosine" else 1.0 + scores[i]),
+                metadata=self._metadata[rows[i]],
+            )
+            for i in top
+        ]
+
+    async def delete(
+        self,
+        filter: Dict[str, Any],
+    ) -> bool:
+        """删除文档(标记删除, 持久化时压缩)."""
+        if not self._delete(filter):
+            return False
+        await self._maybe_persist()
+        return True
+
+    def _delete(self, filter: Dict[str, Any]) -> bool:
+        """标记删除满足条件的行."""
+        if not filter:
+            return False
+        mask = self._filter_mask(filter)
+        if not mask.any():
+            return False
+        self._alive[: self._size] &= ~mask
+        for row in np.flatnonzero(mask):
+            self._ids.pop(self._metadata[row].get("chunk_id"), None)
+        self._dirty = True
+        self._changes += int(mask.sum())
+        return True
+
+    async def existing_ids(self, ids: List[str]) -> Set[str]:
+        """返回已存储的分块ID."""
+        return {key for key in ids if key in self._ids}
+
+    def load(self) -> None:
+        """以内存映射方式加载持久化数据."""
+        if not self.path or not self._npy_path.exists():
+            return
+        with self._meta_path.open("r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("metric", self.metric) != self.metric:
+            raise ValueError(f"持久化数据的度量类型为{meta['metric']}")
+
+        vectors = np.load(self._npy_path, mmap_mode="r")
+        if len(vectors) != len(meta["contents"]):
+            raise ValueError("向量文件与元数据文件不一致")
+
+        self._vectors = vectors
+        self._size = len(vectors)
+        self._sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+        self._alive = np.ones(self._size, dtype=bool)
+        self._contents = meta["contents"]
+        self._metadata = meta["metadata"]
+        self._masks = {}
+        self._ids = {}
+        self._columns = {}
+        for row, metadata in enumerate(self._metadata):
+            self._index_metadata(row, metadata)
+        # 未压缩保存时记录的已删除行
+        for row in meta.get("deleted", []):
+            self._alive[row] = False
+            self._ids.pop(self._metadata[row].get("chunk_id"), None)
+        self._dirty = False
+        self._changes = 0
+        logger.info(f"加载向量存储: {self._size}条, 维度{vectors.shape[1]}")
+
+    def _save(
+        self,
+        vectors: np.ndarray,
+        contents: List[str],
+        metadata: List[Dict[str, Any]],
+        deleted: Optional[List[int]] = None,
+    ) -> None:
+        """写入磁盘(先写临时文件再原子替换).
+
+        Args:
+            vectors: 向量矩阵
+            contents: 文档内容
+            metadata: 文档元数据
+            deleted: 未压缩保存时已删除的行号
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        npy_tmp = self._npy_path.with_suffix(".npy.tmp")
+        meta_tmp = self._meta_path.with_suffix(".json.tmp")
+        with npy_tmp.open("wb") as f:
+            np.save(f, vectors)
+        with meta_tmp.open("w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "metric": self.metric,
+                    "contents": contents,
+                    "metadata": metadata,
+                    "deleted": deleted or [],
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(npy_tmp, self._npy_path)
+        os.replace(meta_tmp, self._meta_path)
+
+    async def _write(self, save: Callable[[], None]) -> None:
+        """在线程中执行写盘; 失败时保留未保存标记, 下次继续重试.
+
+        写盘期间的新变更会重新标记, 不会因本次保存成功而丢失.
+        """
+        changes = self._changes
+        self._dirty = False
+        self._changes = 0
+        try:
+            await asyncio.to_thread(save)
+        except BaseException:
+            self._dirty = True
+            self._changes += changes
+            raise
+        self._saved_at = time.monotonic()
+
+    async def _maybe_persist(self) -> None:
+        """变更行数或未保存时长达到阈值时落盘, 失败只记日志."""
+        if not self.path or not self._dirty:
+            return
+        if not (
+            (self.persist_rows and self._changes >= self.persist_rows)
+            or time.monotonic() - self._saved_at >= self.persist_interval
+        ):
+            return
+        try:
+            await self.persist()
+        except Exception as e:
+            logger.error(f"向量存储落盘失败: {e}")
+
+    async def persist(self) -> None:
+        """持久化有效文档, 同时压缩掉已删除的行."""
+        if not self.path or not self._dirty or self._vectors is None:
+            return
+        async with self._lock:
+            rows = np.flatnonzero(self._alive[: self._size])
+            vectors = np.ascontiguousarray(self._vectors[rows])
+            contents = [self._contents[row] for row in rows]
+            metadata = [self._metadata[row] for row in rows]
+            await self._write(partial(self._save, vectors, contents, metadata))
+
+    async def connect(self) -> None:
+        """加载持久化数据."""
+        await asyncio.to_thread(self.load)
+
+    async def close(self) -> None:
+        """持久化数据."""
+        await self.persist()
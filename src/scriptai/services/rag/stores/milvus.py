@@ -1,8 +1,33 @@
 """Milvus向量存储实现."""
-from typing import Any, Dict, List, Optional
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
+from loguru import logger
+
+from scriptai.config import settings
+from scriptai.core import metrics
 from scriptai.core.milvus import MilvusManager
+from scriptai.core.redis import redis_client
 from scriptai.services.rag.base import Document, SearchResult, VectorStore
+from scriptai.services.rag.filters import (
+    LOGICAL_OPERATORS,
+    literal,
+    partition_values,
+    to_milvus_expr,
+)
+
+# 允许作为删除条件的元数据字段
+DELETE_FILTER_FIELDS = ("type", "filename", "category", "document_id", "chunk_id")
+
+
+def _check_delete_fields(filter: Dict[str, Any]) -> None:
+    """删除条件只允许使用DELETE_FILTER_FIELDS中的字段."""
+    for key, value in filter.items():
+        if key in LOGICAL_OPERATORS:
+            for sub in value:
+                _check_delete_fields(sub)
+        elif key not in DELETE_FILTER_FIELDS:
+            raise ValueError(f"不支持的删除条件字段: {key}")
 
 
 class MilvusVectorStore(VectorStore):
@@ -11,10 +36,37 @@ class MilvusVectorStore(VectorStore):
     def __init__(self, manager: Optional[MilvusManager] = None) -> None:
         """初始化Milvus向量存储."""
         self.manager = manager or MilvusManager()
+        # 已写入分块ID的Redis集合, 用于入库前去重
+        self.ids_key = f"rag:chunks:{settings.MILVUS_COLLECTION}"
 
     async def connect(self) -> None:
-        """连接到Milvus."""
+        """连接到Milvus, 并以Milvus中的分块重建去重用的分块ID集合."""
         await self.manager.connect()
+        try:
+            count = await self.rebuild_ids()
+            logger.info(f"已重建分块ID集合: {count}个")
+        except Exception as e:
+            logger.warning(f"重建分块ID集合失败, 沿用现有集合: {e}")
+
+    async def rebuild_ids(self) -> int:
+        """以Milvus中实际存在的分块重建Redis分块ID集合, 返回分块数.
+
+        集合只在本类的写入和删除中维护, 手动删除集合或分区后会与Milvus不一致,
+        启动时重建. 先写入临时键再改名, 重建期间去重查询仍读取旧集合.
+        """
+        rows = await self._query_rows(to_milvus_expr({"chunk_id": {"$ne": ""}}), None)
+        ids = [metadata["chunk_id"] for _, metadata in rows if "chunk_id" in metadata]
+
+        tmp_key = f"{self.ids_key}:rebuild"
+        await redis_client.delete(tmp_key)
+        batch_size = settings.MILVUS_DELETE_BATCH_SIZE
+        for i in range(0, len(ids), batch_size):
+            await redis_client.sadd(tmp_key, ids[i : i + batch_size])
+        if ids:
+            await redis_client.client.rename(tmp_key, self.ids_key)
+        else:
+            await redis_client.delete(self.ids_key)
+        return len(set(ids))
 
     async def close(self) -> None:
         """关闭连接."""
@@ -39,7 +91,7 @@ class MilvusVectorStore(VectorStore):
             )
 
             # 插入数据
-            return await self.manager.insert(
+            success = await self.manager.insert(
                 contents=contents,
                 embeddings=embeddings,
                 metadata_list=metadata_list,
@@ -49,6 +101,26 @@ class MilvusVectorStore(VectorStore):
             print(f"添加文档失败: {e}")
             return False
 
+        # 记录分块ID
+        if success:
+            try:
+                await redis_client.sadd(
+                    self.ids_key,
+                    [
+                        metadata["chunk_id"]
+                        for metadata in metadata_list
+                        if "chunk_id" in metadata
+                    ],
+                )
+            except Exception as e:
+                logger.warning(f"记录分块ID失败: {e}")
+        return success
+
+    async def existing_ids(self, ids: List[str]) -> Set[str]:
+        """返回已存储的分块ID(单次SMISMEMBER往返)."""
+        flags = await redis_client.smismember(self.ids_key, ids)
+        return {key for key, flag in zip(ids, flags) if flag}
+
     async def search(
         self,
         query_vector: List[float],
@@ -57,16 +129,22 @@ class MilvusVectorStore(VectorStore):
     ) -> List[SearchResult]:
         """搜索相似文档."""
         try:
-            # 确定分区
-            partition_names = None
-            if filter and "type" in filter:
-                partition_names = [filter["type"]]
+            # 分区裁剪, 其余条件下推为布尔表达式
+            partition_names = partition_values(filter or {}) or None
+            expr = (
+                to_milvus_expr(
+                    filter, scalar_fields=settings.MILVUS_SCALAR_INDEX_FIELDS
+                )
+                if filter
+                else None
+            )
 
             # 执行搜索
             results = await self.manager.search(
                 vector=query_vector,
                 limit=limit,
                 partition_names=partition_names,
+                expr=expr,
             )
 
             # 转换结果
@@ -82,10 +160,107 @@ class MilvusVectorStore(VectorStore):
             print(f"搜索文档失败: {e}")
             return []
 
+    def _split_filter(self, filter: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """按批大小切分值最多的列表条件, 避免生成过长的表达式."""
+        batch_size = settings.MILVUS_DELETE_BATCH_SIZE
+        lists = [
+            field
+            for field, value in filter.items()
+            if isinstance(value, (list, tuple, set))
+        ]
+        if not lists:
+            yield filter
+            return
+        field = max(lists, key=lambda name: len(filter[name]))
+        values = list(filter[field])
+        for i in range(0, len(values), batch_size):
+            yield {**filter, field: values[i : i + batch_size]}
+
+    async def _query_rows(
+        self,
+        expr: str,
+        partition_names: Optional[List[str]],
+    ) -> List[Tuple[Any, Dict[str, Any]]]:
+        """分页查询匹配行的主键和元数据."""
+        batch_size = settings.MILVUS_DELETE_BATCH_SIZE
+        rows: List[Tuple[Any, Dict[str, Any]]] = []
+        offset = 0
+        while True:
+            page = await self.manager.query(
+                expr=expr,
+                output_fields=["id", "metadata"],
+                partition_names=partition_names,
+                limit=batch_size,
+                offset=offset,
+            )
+            rows.extend((row["id"], row.get("metadata") or {}) for row in page)
+            if len(page) < batch_size:
+                return rows
+            offset += batch_size
+
     async def delete(
         self,
         filter: Dict[str, Any],
     ) -> bool:
-        """删除文档."""
-        # TODO: 实现删除功能
-        return False 
\ No newline at end of file
+        """按过滤条件删除文档.
+
+        先按条件查询主键, 再按分区分批删除; 条件含type时只在对应分区中查询.
+        返回是否删除了文档, 空条件视为误用, 不执行全量删除.
+        """
+        if not filter:
+            return False
+        if any(
+            isinstance(value, (list, tuple, set)) and not value
+            for value in filter.values()
+        ):
+            return False
+
+        begin_time = time.perf_counter()
+        result = "error"
+        try:
+            _check_delete_fields(filter)
+            partition_names = partition_values(filter) or None
+
+            # 分区 -> 主键
+            groups: Dict[str, List[Any]] = {}
+            chunk_ids: List[str] = []
+            for part in self._split_filter(filter):
+                for pk, metadata in await self._query_rows(
+                    to_milvus_expr(
+                        part, scalar_fields=settings.MILVUS_SCALAR_INDEX_FIELDS
+                    ),
+                    partition_names,
+                ):
+                    groups.setdefault(metadata.get("type", "default"), []).append(pk)
+                    if "chunk_id" in metadata:
+                        chunk_ids.append(metadata["chunk_id"])
+
+            batch_size = settings.MILVUS_DELETE_BATCH_SIZE
+            for partition, pks in groups.items():
+                for i in range(0, len(pks), batch_size):
+                    batch = pks[i : i + batch_size]
+                    await self.manager.delete(
+                        expr=f"id in [{', '.join(literal(pk) for pk in batch)}]",
+                        partition_name=partition,
+                    )
+                    metrics.rag_vector_delete_total.labels(
+                        partition=partition
+                    ).inc(len(batch))
+            result = "success"
+        except Exception as e:
+            logger.error(f"删除文档失败: {e}")
+            return False
+        finally:
+            metrics.rag_vector_delete_duration_seconds.labels(result=result).observe(
+                time.perf_counter() - begin_time
+            )
+
+        # 同步去重用的分块ID集合
+        try:
+            await redis_client.srem(self.ids_key, chunk_ids)
+        except Exception as e:
+            logger.warning(f"移除分块ID失败: {e}")
+
+        deleted = sum(len(pks) for pks in groups.values())
+        logger.info(f"删除文档: {deleted} 条, 条件: {filter}")
+        return deleted > 0
@@ -0,0 +1,56 @@
+"""流式入库的文本解码与分段."""
+import codecs
+import io
+from typing import AsyncIterator, Callable, List
+
+
+async def decode_stream(
+    chunks: AsyncIterator[bytes],
+    encoding: str = "utf-8",
+) -> AsyncIterator[str]:
+    """增量解码字节流.
+
+    跨读取边界的多字节字符和"\\r\\n"都能正确处理, 换行统一为"\\n";
+    编码错误时抛出UnicodeDecodeError.
+    """
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder(encoding)(), translate=True
+    )
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+async def iter_segments(
+    texts: AsyncIterator[str],
+    boundary: Callable[[str], int],
+    segment_size: int,
+) -> AsyncIterator[str]:
+    """把文本流切成不超过segment_size个字符的段.
+
+    在每段前segment_size个字符中由boundary给出切分位置; 没有合适位置时
+    在最后一个换行处切分, 没有换行时按segment_size硬切. 切分只取决于
+    文本内容, 与读取时的分片方式无关, 同一文件重复入库得到相同的分块.
+    """
+    parts: List[str] = []
+    size = 0
+    async for text in texts:
+        parts.append(text)
+        size += len(text)
+        if size < segment_size:
+            continue
+        buffer = "".join(parts)
+        while len(buffer) >= segment_size:
+            window = buffer[:segment_size]
+            cut = boundary(window)
+            if cut <= 0:
+                cut = window.rfind("\n") + 1 or segment_size
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+        parts, size = ([buffer], len(buffer)) if buffer else ([], 0)
+    if parts:
+        yield "".join(parts)
@@ -0,0 +1,32 @@
+"""上下文打包."""
+from typing import List, Optional
+
+from scriptai.core.tokens import TokenCounter, token_counter
+
+
+def pack_context(
+    contexts: List[str],
+    budget: int,
+    separator: str = "\n\n",
+    counter: Optional[TokenCounter] = None,
+) -> List[str]:
+    """按顺序(检索分数从高到低)选取上下文, 总token数不超过budget.
+
+    放不下的条目跳过, 继续尝试后面更短的条目; 排名第一的条目超出预算时
+    截断后保留, 保证至少有一条参考资料.
+    """
+    counter = counter or token_counter
+    separator_tokens = counter.count(separator)
+    packed: List[str] = []
+    used = 0
+    for context in contexts:
+        tokens = counter.count(context) + (separator_tokens if packed else 0)
+        if used + tokens <= budget:
+            packed.append(context)
+            used += tokens
+        elif not packed:
+            truncated = counter.truncate(context, budget)
+            if truncated:
+                packed.append(truncated)
+                used = counter.count(truncated)
+    return packed
@@ -535,8 +535,8 @@ async def test_upload_document(
     )
     assert response.status_code == status.HTTP_200_OK
     data = response.json()
-    assert data["status"] == "success"
-    assert "id" in data
+    assert data["status"] == "queued"
+    assert "job_id" in data
 
 
 @pytest.mark.asyncio
@@ -0,0 +1,51 @@
+"""嵌入缓存编解码测试."""
+import pytest
+
+from scriptai.core.codec import decode_embedding, embedding_cache_key, encode_embedding
+
+
+def test_float32_round_trip() -> None:
+    """测试float32无损往返."""
+    embedding = [0.5, -0.25, 1.0, 0.0]
+    data = encode_embedding(embedding)
+    assert len(data) == 6 + 4 * len(embedding)
+    assert decode_embedding(data) == embedding
+
+
+@pytest.mark.parametrize("dtype,tolerance", [("float16", 1e-3), ("int8", 1e-2)])
+def test_quantized_round_trip(dtype: str, tolerance: float) -> None:
+    """测试量化编码的误差范围."""
+    embedding = [0.123, -0.987, 0.5, 0.0001, -0.3]
+    decoded = decode_embedding(encode_embedding(embedding, dtype))
+    assert decoded is not None
+    assert len(decoded) == len(embedding)
+    assert all(abs(a - b) < tolerance for a, b in zip(decoded, embedding))
+
+
+def test_compact_size() -> None:
+    """测试3072维向量的编码体积."""
+    embedding = [0.01 * i for i in range(3072)]
+    assert len(encode_embedding(embedding)) < 3072 * 4 + 16
+    assert len(encode_embedding(embedding, "int8")) < 3072 + 16
+
+
+def test_decode_invalid() -> None:
+    """测试旧格式或损坏数据视为未命中."""
+    assert decode_embedding(b"") is None
+    assert decode_embedding(str([0.1, 0.2]).encode()) is None
+    assert decode_embedding(encode_embedding([1.0, 2.0])[:-1]) is None
+
+
+def test_unsupported_dtype() -> None:
+    """测试不支持的类型."""
+    with pytest.raises(ValueError):
+        encode_embedding([1.0], "float64")
+
+
+def test_cache_key() -> None:
+    """测试缓存键由模型和文本共同决定且不含原文."""
+    key = embedding_cache_key("model-a", "剧本")
+    assert key.startswith("embedding:v1:")
+    assert "剧本" not in key
+    assert key != embedding_cache_key("model-b", "剧本")
+    assert key == embedding_cache_key("model-a", "剧本")
@@ -1,8 +1,17 @@
 """OpenAI服务测试."""
+import asyncio
+from types import SimpleNamespace
+
+import httpx
 import pytest
 from openai import AsyncOpenAI
 
-from scriptai.core.openai import OpenAIClient
+from scriptai.config import settings
+from scriptai.core import metrics
+from scriptai.core import openai as openai_module
+from scriptai.core.codec import embedding_cache_key, encode_embedding
+from scriptai.core.openai import OpenAIClient, current_user_id, llm_user
+from scriptai.core.redis import redis_client
 
 
 @pytest.fixture
@@ -18,7 +27,9 @@ async def test_create_embeddings(openai_client: OpenAIClient) -> None:
     embeddings = await openai_client.create_embeddings(texts)
     assert len(embeddings) == len(texts)
     assert all(isinstance(embedding, list) for embedding in embeddings)
-    assert all(isinstance(value, float) for embedding in embeddings for value in embedding)
+    assert all(
+        isinstance(value, float) for embedding in embeddings for value in embedding
+    )
 
 
 @pytest.mark.asyncio
@@ -63,4 +74,251 @@ async def test_client_close(openai_client: OpenAIClient) -> None:
     client = openai_client.client
     assert openai_client._client is client
     await openai_client.close()
-    assert openai_client._client is None 
\ No newline at end of file
+    assert openai_client._client is None
+
+
+class _FakeEmbeddingsAPI:
+    """记录调用的假嵌入接口."""
+
+    def __init__(self, delay: float = 0) -> None:
+        self.calls: list = []
+        self.delay = delay
+
+    async def create(self, model: str, input: list) -> SimpleNamespace:
+        self.calls.append(list(input))
+        await asyncio.sleep(self.delay)
+        # 故意打乱返回顺序, 验证按index重排
+        data = [
+            SimpleNamespace(index=index, embedding=[float(len(text))])
+            for index, text in enumerate(input)
+        ]
+        return SimpleNamespace(data=list(reversed(data)))
+
+
+@pytest.mark.asyncio
+async def test_create_embeddings_batched(
+    openai_client: OpenAIClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """测试嵌入按批合并请求, 且只请求未命中缓存的文本."""
+    store = {
+        embedding_cache_key("test-model", "cached"): encode_embedding([42.0]),
+    }
+
+    async def fake_mget(keys: list, binary: bool = False) -> list:
+        return [store.get(key) for key in keys]
+
+    async def fake_mset(
+        mapping: dict,
+        expire: int = None,
+        binary: bool = False,
+    ) -> None:
+        store.update(mapping)
+
+    monkeypatch.setattr(settings, "OPENAI_ENABLE_CACHE", True)
+    monkeypatch.setattr(settings, "OPENAI_BATCH_SIZE", 3)
+    monkeypatch.setattr(redis_client, "mget", fake_mget)
+    monkeypatch.setattr(redis_client, "mset", fake_mset)
+    api = _FakeEmbeddingsAPI()
+    openai_client._client = SimpleNamespace(embeddings=api)
+
+    texts = ["a", "cached", "ccc", "dddd", "eeeee"]
+    embeddings = await openai_client.create_embeddings(texts, model="test-model")
+
+    assert embeddings == [[1.0], [42.0], [3.0], [4.0], [5.0]]
+    assert api.calls == [["a", "ccc"], ["dddd", "eeeee"]]
+    assert embedding_cache_key("test-model", "eeeee") in store
+
+
+class _FakeStream:
+    """模拟流式补全响应."""
+
+    def __init__(self, tokens: list) -> None:
+        self._chunks = [
+            SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=token))]
+            )
+            for token in tokens
+        ]
+
+    def __aiter__(self) -> "_FakeStream":
+        return self
+
+    async def __anext__(self) -> SimpleNamespace:
+        if not self._chunks:
+            raise StopAsyncIteration
+        return self._chunks.pop(0)
+
+
+@pytest.mark.asyncio
+async def test_create_completion_stream(
+    openai_client: OpenAIClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """测试流式补全逐段产出并写入缓存."""
+    store: dict = {}
+    requests: list = []
+
+    async def fake_get_cache(key: str) -> None:
+        return store.get(key)
+
+    async def fake_set_cache(key: str, value: str) -> None:
+        store[key] = value
+
+    async def fake_create(**kwargs: dict) -> _FakeStream:
+        requests.append(kwargs)
+        return _FakeStream(["三幕", None, "结构"])
+
+    monkeypatch.setattr(openai_client, "_get_cache", fake_get_cache)
+    monkeypatch.setattr(openai_client, "_set_cache", fake_set_cache)
+    openai_client._client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=fake_create))
+    )
+
+    tokens = [
+        token
+        async for token in openai_client.create_completion_stream(
+            "问题",
+            system_prompt="系统",
+        )
+    ]
+    assert tokens == ["三幕", "结构"]
+    assert requests[0]["stream"] is True
+    assert requests[0]["messages"][0] == {"role": "system", "content": "系统"}
+
+    # 第二次直接命中缓存
+    cached = [
+        token
+        async for token in openai_client.create_completion_stream(
+            "问题",
+            system_prompt="系统",
+        )
+    ]
+    assert cached == ["三幕结构"]
+    assert len(requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_headers_observed(openai_client: OpenAIClient) -> None:
+    """测试响应钩子按路径更新对应的限流器, 429只收缩该类请求的并发."""
+    hooks = openai_client.client._client.event_hooks["response"]
+    assert openai_client._observe_response in hooks
+
+    def response(status: int, path: str, headers: dict) -> httpx.Response:
+        request = httpx.Request("POST", f"https://api.openai.com/v1{path}")
+        return httpx.Response(status, headers=headers, request=request)
+
+    await openai_client._observe_response(
+        response(200, "/chat/completions", {"x-ratelimit-limit-tokens": "90000"})
+    )
+    assert openai_client._completion_limiter._tokens.capacity == 90000
+
+    limit = openai_client._embedding_limiter.limit
+    await openai_client._observe_response(
+        response(429, "/embeddings", {"retry-after-ms": "0"})
+    )
+    assert openai_client._embedding_limiter.limit < limit
+    assert openai_client._completion_limiter.limit == limit
+
+
+@pytest.mark.asyncio
+async def test_token_usage_recorded_per_user(
+    openai_client: OpenAIClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """测试补全用量计入指标和当前用户的额度."""
+    recorded: list = []
+
+    async def fake_get_cache(key: str) -> None:
+        return None
+
+    async def fake_set_cache(key: str, value: str) -> None:
+        return None
+
+    async def fake_record(user_id: str, tokens: int) -> None:
+        recorded.append((user_id, tokens))
+
+    async def fake_create(**kwargs: dict) -> SimpleNamespace:
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="三幕"))],
+            usage=SimpleNamespace(total_tokens=42),
+        )
+
+    monkeypatch.setattr(openai_client, "_get_cache", fake_get_cache)
+    monkeypatch.setattr(openai_client, "_set_cache", fake_set_cache)
+    monkeypatch.setattr(openai_module.token_quota, "record", fake_record)
+    openai_client._client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=fake_create))
+    )
+    counter = metrics.ai_tokens_total.labels(operation="completion", model="m")
+    before = counter._value.get()
+
+    with llm_user(7):
+        assert current_user_id() == "7"
+        await openai_client.create_completion("问题", model="m")
+    # 系统调用不计入任何用户
+    await openai_client.create_completion("问题", model="m")
+
+    assert recorded == [("7", 42)]
+    assert counter._value.get() - before == 84
+    assert current_user_id() is None
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_coalesced(
+    openai_client: OpenAIClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """测试并发的相同补全和重叠的嵌入请求只调用一次API."""
+    completions: list = []
+
+    async def fake_get_cache(key: str) -> None:
+        return None
+
+    async def fake_set_cache(key: str, value: str) -> None:
+        return None
+
+    async def fake_mget(keys: list, binary: bool = False) -> list:
+        return [None] * len(keys)
+
+    async def fake_mset(
+        mapping: dict,
+        expire: int = None,
+        binary: bool = False,
+    ) -> None:
+        return None
+
+    async def fake_create(**kwargs: dict) -> SimpleNamespace:
+        completions.append(kwargs)
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="三幕"))],
+            usage=SimpleNamespace(total_tokens=42),
+        )
+
+    # Redis不可用时仍在进程内合并
+    monkeypatch.setattr(redis_client, "_client", None)
+    monkeypatch.setattr(redis_client, "_pool", None)
+    monkeypatch.setattr(openai_client, "_get_cache", fake_get_cache)
+    monkeypatch.setattr(openai_client, "_set_cache", fake_set_cache)
+    monkeypatch.setattr(redis_client, "mget", fake_mget)
+    monkeypatch.setattr(redis_client, "mset", fake_mset)
+    api = _FakeEmbeddingsAPI(delay=0.01)
+    openai_client._client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=fake_create)),
+        embeddings=api,
+    )
+
+    results = await asyncio.gather(
+        *(openai_client.create_completion("结构分析", model="m") for _ in range(4))
+    )
+    assert results == ["三幕"] * 4
+    assert len(completions) == 1
+
+    first, second = await asyncio.gather(
+        openai_client.create_embeddings(["aa", "bbb", "aa"], model="m"),
+        openai_client.create_embeddings(["bbb", "c"], model="m"),
+    )
+    assert first == [[2.0], [3.0], [2.0]]
+    assert second == [[3.0], [1.0]]
+    assert sorted(text for call in api.calls for text in call) == ["aa", "bbb", "c"]
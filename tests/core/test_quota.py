@@ -0,0 +1,103 @@
+"""token额度测试."""
+from typing import Dict, List, Optional
+
+import pytest
+
+from scriptai.core.quota import QuotaExceededError, TokenQuota
+from scriptai.core.redis import redis_client
+
+
+class _FakePipeline:
+    """记录命令的管道."""
+
+    def __init__(self, store: Dict[str, int]) -> None:
+        self.store = store
+        self.commands: List[tuple] = []
+
+    async def __aenter__(self) -> "_FakePipeline":
+        return self
+
+    async def __aexit__(self, *args: object) -> None:
+        return None
+
+    def incrby(self, key: str, amount: int) -> None:
+        self.commands.append(("incrby", key, amount))
+
+    def expire(self, key: str, seconds: int) -> None:
+        self.commands.append(("expire", key, seconds))
+
+    async def execute(self) -> None:
+        for command, key, value in self.commands:
+            if command == "incrby":
+                self.store[key] = self.store.get(key, 0) + value
+
+
+class _FakeRedis:
+    """模拟计数器读写, 统计往返次数."""
+
+    def __init__(self) -> None:
+        self.store: Dict[str, int] = {}
+        self.round_trips = 0
+
+    async def mget(self, keys: List[str]) -> List[Optional[str]]:
+        self.round_trips += 1
+        return [str(self.store[key]) if key in self.store else None for key in keys]
+
+    def pipeline(self, transaction: bool = True) -> _FakePipeline:
+        self.round_trips += 1
+        return _FakePipeline(self.store)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch: pytest.MonkeyPatch) -> _FakeRedis:
+    """以假Redis替换全局客户端."""
+    client = _FakeRedis()
+    monkeypatch.setattr(redis_client, "_client", client)
+    return client
+
+
+@pytest.mark.asyncio
+async def test_rolling_quota(fake_redis: _FakeRedis) -> None:
+    """测试滑动窗口用量与超额后的等待时间."""
+    quota = TokenQuota(limit=100, window=60)
+
+    await quota.check("7", now=600)
+    await quota.record("7", 120, now=600)
+    assert await quota.usage("7", now=600) == 120
+
+    with pytest.raises(QuotaExceededError) as exc_info:
+        await quota.check("7", now=630)
+    assert exc_info.value.retry_after == pytest.approx(40)
+
+    # 进入下一窗口后, 上一窗口的计数按比例退出
+    with pytest.raises(QuotaExceededError) as exc_info:
+        await quota.check("7", now=669)
+    assert exc_info.value.retry_after == pytest.approx(1)
+    await quota.check("7", now=671)
+    assert await quota.usage("7", now=671) == 98
+
+    # 其他用户不受影响
+    await quota.check("8", now=630)
+
+
+@pytest.mark.asyncio
+async def test_one_round_trip(fake_redis: _FakeRedis) -> None:
+    """测试检查和记录各只需一次往返."""
+    quota = TokenQuota(limit=100, window=60)
+
+    await quota.check("7")
+    assert fake_redis.round_trips == 1
+    await quota.record("7", 10)
+    assert fake_redis.round_trips == 2
+
+
+@pytest.mark.asyncio
+async def test_disabled_and_unavailable(monkeypatch: pytest.MonkeyPatch) -> None:
+    """测试额度为0时不访问Redis, Redis不可用时放行."""
+    monkeypatch.setattr(redis_client, "_client", None)
+    monkeypatch.setattr(redis_client, "_pool", None)
+
+    await TokenQuota(limit=0).check("7")
+    quota = TokenQuota(limit=100, window=60)
+    await quota.check("7")
+    await quota.record("7", 10)
@@ -0,0 +1,245 @@
+"""自适应限流测试."""
+import asyncio
+import time
+
+import pytest
+
+from scriptai.core.ratelimit import (
+    AdaptiveRateLimiter,
+    WeightedFairQueue,
+    parse_duration,
+)
+
+
+def test_parse_duration() -> None:
+    """测试解析限流响应头中的时长."""
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("1.5s") == pytest.approx(1.5)
+    assert parse_duration("6m0s") == pytest.approx(360)
+    assert parse_duration("2") == pytest.approx(2)
+    assert parse_duration("") is None
+    assert parse_duration("soon") is None
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit() -> None:
+    """测试并发数不超过上限, 等待的请求计入排队数."""
+    limiter = AdaptiveRateLimiter("test", max_concurrency=2)
+    peak = 0
+    queued = 0
+
+    async def call() -> None:
+        nonlocal peak, queued
+        async with limiter.acquire():
+            peak = max(peak, limiter.in_flight)
+            queued = max(queued, limiter.waiting)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(call() for _ in range(6)))
+
+    assert peak == 2
+    assert queued > 0
+    assert limiter.in_flight == 0
+    assert limiter.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_aimd() -> None:
+    """测试429时乘性减(同一波只减一次), 成功后加性增."""
+    limiter = AdaptiveRateLimiter("test", max_concurrency=8, cooldown=60)
+    limiter.on_rate_limited({"retry-after": "0"})
+    limiter.on_rate_limited({"retry-after": "0"})
+    assert limiter.limit == 4
+
+    # 约每轮满并发的成功请求加1
+    for _ in range(5):
+        async with limiter.acquire():
+            pass
+    assert limiter.limit == 5
+
+    # 失败的请求不增加上限
+    concurrency = limiter.concurrency
+    with pytest.raises(RuntimeError):
+        async with limiter.acquire():
+            raise RuntimeError("boom")
+    assert limiter.concurrency == concurrency
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_min_concurrency() -> None:
+    """测试并发上限不低于最小值."""
+    limiter = AdaptiveRateLimiter("test", max_concurrency=4, min_concurrency=2)
+    for _ in range(5):
+        limiter._last_decrease = float("-inf")
+        limiter.on_rate_limited({"retry-after": "0"})
+    assert limiter.limit == 2
+
+
+@pytest.mark.asyncio
+async def test_token_budget() -> None:
+    """测试token额度用尽后按补充速度等待."""
+    # 每秒补充100个token
+    limiter = AdaptiveRateLimiter("test", tokens_per_minute=6000)
+    async with limiter.acquire(6000):
+        pass
+
+    begin_time = time.perf_counter()
+    async with limiter.acquire(10):
+        pass
+    assert time.perf_counter() - begin_time >= 0.08
+
+
+@pytest.mark.asyncio
+async def test_refund_actual_usage() -> None:
+    """测试按实际用量退回多扣的token."""
+    limiter = AdaptiveRateLimiter("test", tokens_per_minute=6000)
+    async with limiter.acquire(6000) as permit:
+        permit.used = 100
+
+    begin_time = time.perf_counter()
+    async with limiter.acquire(1000):
+        pass
+    assert time.perf_counter() - begin_time < 0.05
+
+
+@pytest.mark.asyncio
+async def test_headers_update_budget() -> None:
+    """测试响应头中的限额和剩余额度校正令牌桶, 配置值更低时以配置为准."""
+    limiter = AdaptiveRateLimiter("test")
+    limiter.update(
+        {
+            "x-ratelimit-limit-requests": "500",
+            "x-ratelimit-limit-tokens": "60000",
+            "x-ratelimit-remaining-tokens": "0",
+        }
+    )
+    assert limiter._requests.capacity == 500
+    assert limiter._tokens.capacity == 60000
+
+    # 剩余额度为0, 每秒补充1000个token
+    begin_time = time.perf_counter()
+    async with limiter.acquire(100):
+        pass
+    assert time.perf_counter() - begin_time >= 0.08
+
+    limiter = AdaptiveRateLimiter("test", tokens_per_minute=1000)
+    limiter.update({"x-ratelimit-limit-tokens": "60000"})
+    assert limiter._tokens.capacity == 1000
+
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_admission() -> None:
+    """测试429后在建议的等待时间内暂停准入."""
+    limiter = AdaptiveRateLimiter("test")
+    limiter.on_rate_limited({"retry-after-ms": "100"})
+
+    begin_time = time.perf_counter()
+    async with limiter.acquire():
+        pass
+    assert time.perf_counter() - begin_time >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_weighted_fair_queue_shares() -> None:
+    """测试各类别都在排队时, 准入次数与权重成正比."""
+    queue = WeightedFairQueue({"interactive": 8, "background": 2, "batch": 1})
+    order = []
+
+    async def call(key: str) -> None:
+        async with queue.turn(key):
+            order.append(key)
+            await asyncio.sleep(0)
+
+    tasks = [
+        asyncio.create_task(call(key))
+        for key in ("batch", "background", "interactive")
+        for _ in range(30)
+    ]
+    await asyncio.gather(*tasks)
+
+    # 第一个到达的请求直接准入, 之后三轮按权重8:2:1分配
+    rounds = order[1:34]
+    assert abs(rounds.count("interactive") - 24) <= 1
+    assert abs(rounds.count("background") - 6) <= 1
+    assert abs(rounds.count("batch") - 3) <= 1
+    assert len(order) == 90
+
+
+@pytest.mark.asyncio
+async def test_weighted_fair_queue_cancel() -> None:
+    """测试排队中被取消的请求不阻塞后续请求."""
+    queue = WeightedFairQueue({"a": 1, "b": 1})
+    release = asyncio.Event()
+    order = []
+
+    async def call(key: str) -> None:
+        async with queue.turn(key):
+            order.append(key)
+            await release.wait()
+
+    holder = asyncio.create_task(call("a"))
+    await asyncio.sleep(0)
+    cancelled = asyncio.create_task(call("a"))
+    waiter = asyncio.create_task(call("b"))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    release.set()
+    await asyncio.gather(holder, waiter)
+
+    assert order == ["a", "b"]
+    assert queue.depth("a") == queue.depth("b") == 0
+
+    with pytest.raises(ValueError):
+        queue.resolve("unknown")
+    assert queue.resolve(None) == "a"
+
+
+@pytest.mark.asyncio
+async def test_interactive_admitted_before_batch_backlog() -> None:
+    """测试并发名额被批量请求占满时, 交互请求优先获得下一个名额."""
+    limiter = AdaptiveRateLimiter(
+        "test",
+        max_concurrency=1,
+        weights={"interactive": 8, "batch": 1},
+    )
+    order = []
+
+    async def call(priority: str, name: str) -> None:
+        async with limiter.acquire(priority=priority):
+            order.append(name)
+            await asyncio.sleep(0.005)
+
+    batch = [asyncio.create_task(call("batch", f"batch-{index}")) for index in range(6)]
+    await asyncio.sleep(0.001)
+    await asyncio.gather(call("interactive", "interactive"), *batch)
+
+    assert order.index("interactive") <= 2
+    assert limiter.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_fair_queue_rotates_users() -> None:
+    """测试同一类别内按用户轮转, 排队多的用户不挤占其他用户."""
+    queue = WeightedFairQueue({"interactive": 1})
+    release = asyncio.Event()
+    order = []
+
+    async def call(user: str) -> None:
+        async with queue.turn("interactive", user):
+            order.append(user)
+            await release.wait()
+            release.clear()
+
+    heavy = [asyncio.create_task(call("heavy")) for _ in range(6)]
+    await asyncio.sleep(0)
+    light = [asyncio.create_task(call("light")) for _ in range(2)]
+    await asyncio.sleep(0)
+    while len(order) < 8:
+        release.set()
+        await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(*heavy, *light)
+
+    assert order[:5] == ["heavy", "heavy", "light", "heavy", "light"]
+    assert queue.depth("interactive") == 0
@@ -0,0 +1,210 @@
+"""请求合并测试."""
+import asyncio
+from typing import Dict, List, Optional
+
+import pytest
+
+from scriptai.core.redis import redis_client
+from scriptai.core.singleflight import SingleFlight
+
+
+class _FakePipeline:
+    """批量执行SET NX的管道."""
+
+    def __init__(self, redis: "_FakeRedis") -> None:
+        self.redis = redis
+        self.commands: List[tuple] = []
+
+    async def __aenter__(self) -> "_FakePipeline":
+        return self
+
+    async def __aexit__(self, *args: object) -> None:
+        return None
+
+    def set(self, key: str, value: str, nx: bool = False, px: int = 0) -> None:
+        self.commands.append((key, value, nx))
+
+    async def execute(self) -> List[Optional[bool]]:
+        results: List[Optional[bool]] = []
+        for key, value, nx in self.commands:
+            if nx and key in self.redis.locks:
+                results.append(None)
+            else:
+                self.redis.locks[key] = value
+                results.append(True)
+        return results
+
+
+class _FakeRedis:
+    """模拟多个副本共享的锁."""
+
+    def __init__(self) -> None:
+        self.locks: Dict[str, str] = {}
+
+    def pipeline(self, transaction: bool = True) -> _FakePipeline:
+        return _FakePipeline(self)
+
+    async def eval(self, script: str, numkeys: int, *args: str) -> int:
+        keys, token = args[:numkeys], args[numkeys]
+        released = [key for key in keys if self.locks.get(key) == token]
+        for key in released:
+            del self.locks[key]
+        return len(released)
+
+    async def mget(self, keys: List[str]) -> List[Optional[str]]:
+        return [self.locks.get(key) for key in keys]
+
+
+@pytest.fixture
+def fake_redis(monkeypatch: pytest.MonkeyPatch) -> _FakeRedis:
+    """以假Redis替换全局客户端."""
+    client = _FakeRedis()
+    monkeypatch.setattr(redis_client, "_client", client)
+    return client
+
+
+@pytest.mark.asyncio
+async def test_local_callers_share_one_call() -> None:
+    """测试进程内并发的相同调用只计算一次."""
+    flight = SingleFlight("test")
+    calls = 0
+
+    async def compute() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "结果"
+
+    results = await asyncio.gather(*(flight.do("key", compute) for _ in range(5)))
+
+    assert results == ["结果"] * 5
+    assert calls == 1
+    assert not flight._calls
+
+    # 完成后不再合并
+    await flight.do("key", compute)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_error_shared_and_cancel_retried() -> None:
+    """测试计算失败时等待者收到同一异常, 计算者被取消时等待者自行重试."""
+    flight = SingleFlight("test")
+
+    async def fail() -> str:
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    results = await asyncio.gather(
+        *(flight.do("key", fail) for _ in range(3)),
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    async def slow() -> str:
+        await asyncio.sleep(0.01)
+        return "结果"
+
+    leader = asyncio.create_task(flight.do("key", slow))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flight.do("key", slow))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await follower == "结果"
+    assert leader.cancelled()
+    assert not flight._calls
+
+
+@pytest.mark.asyncio
+async def test_do_many_merges_overlapping_batches() -> None:
+    """测试批量调用中重复和其他调用正在计算的键只计算一次."""
+    flight = SingleFlight("test")
+    computed: List[List[str]] = []
+
+    async def compute(keys: List[str]) -> List[str]:
+        computed.append(keys)
+        await asyncio.sleep(0.01)
+        return [key.upper() for key in keys]
+
+    first, second = await asyncio.gather(
+        flight.do_many(["a", "b", "a"], compute),
+        flight.do_many(["b", "c"], compute),
+    )
+
+    assert first == ["A", "B", "A"]
+    assert second == ["B", "C"]
+    assert computed == [["a", "b"], ["c"]]
+
+
+@pytest.mark.asyncio
+async def test_replicas_coordinate_through_lock(fake_redis: _FakeRedis) -> None:
+    """测试多个副本只有抢到锁的计算, 其余读取其写入的缓存."""
+    cache: Dict[str, str] = {}
+    calls = 0
+
+    async def compute() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        cache["key"] = "结果"
+        return "结果"
+
+    async def load(key: str) -> Optional[str]:
+        return cache.get(key)
+
+    replicas = [SingleFlight("test", poll_interval=0.005) for _ in range(3)]
+    results = await asyncio.gather(
+        *(replica.do("key", compute, load) for replica in replicas)
+    )
+
+    assert results == ["结果"] * 3
+    assert calls == 1
+    assert not fake_redis.locks
+
+
+@pytest.mark.asyncio
+async def test_replica_failure_falls_back(fake_redis: _FakeRedis) -> None:
+    """测试持锁副本失败或超时后, 等待的副本自行计算."""
+    cache: Dict[str, str] = {}
+
+    async def load(key: str) -> Optional[str]:
+        return cache.get(key)
+
+    async def fail() -> str:
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def compute() -> str:
+        return "结果"
+
+    failing = SingleFlight("test", poll_interval=0.005)
+    waiting = SingleFlight("test", poll_interval=0.005)
+    results = await asyncio.gather(
+        failing.do("key", fail, load),
+        waiting.do("key", compute, load),
+        return_exceptions=True,
+    )
+    assert isinstance(results[0], RuntimeError)
+    assert results[1] == "结果"
+
+    # 锁一直未释放时等待到超时
+    fake_redis.locks["singleflight:test:stuck"] = "other"
+    impatient = SingleFlight("test", wait_timeout=0.02, poll_interval=0.005)
+    assert await impatient.do("stuck", compute, load) == "结果"
+
+
+@pytest.mark.asyncio
+async def test_redis_unavailable(monkeypatch: pytest.MonkeyPatch) -> None:
+    """测试Redis不可用时退回进程内合并."""
+    monkeypatch.setattr(redis_client, "_client", None)
+    monkeypatch.setattr(redis_client, "_pool", None)
+    flight = SingleFlight("test")
+
+    async def compute() -> str:
+        return "结果"
+
+    async def load(key: str) -> Optional[str]:
+        return None
+
+    assert await flight.do("key", compute, load) == "结果"
@@ -0,0 +1,32 @@
+"""Token计数测试."""
+from scriptai.core.tokens import TokenCounter
+
+
+def _estimator() -> TokenCounter:
+    """不依赖tiktoken的估算计数器."""
+    counter = TokenCounter(cache_size=16)
+    counter._loaded = True
+    counter._encoding = None
+    return counter
+
+
+def test_count_estimate_and_cache() -> None:
+    """测试估算计数与缓存."""
+    counter = _estimator()
+    assert counter.count("") == 0
+    assert counter.count("剧本创作") == 4
+    assert counter.count("abcdefgh") == 2
+    assert counter.count("三幕 act") == 2 + 1
+
+    counter.count("剧本创作")
+    assert counter._count.cache_info().hits == 1
+
+
+def test_truncate() -> None:
+    """测试按token截取前缀和后缀."""
+    counter = _estimator()
+    text = "一二三四五六七八九十"
+    assert counter.truncate(text, 3) == "一二三"
+    assert counter.truncate(text, 3, keep="tail") == "八九十"
+    assert counter.truncate(text, 20) == text
+    assert counter.truncate(text, 0) == ""
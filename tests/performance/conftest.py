@@ -0,0 +1,21 @@
+"""性能测试公共夹具."""
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+# 内置知识库语料
+KNOWLEDGE_BASE_DIR = (
+    Path(__file__).resolve().parents[2] / "src" / "scriptai" / "knowledge_base"
+)
+
+
+@pytest.fixture(scope="session")
+def knowledge_base_texts() -> Dict[str, str]:
+    """读取内置知识库语料, 返回相对路径到文本的映射."""
+    texts = {
+        str(path.relative_to(KNOWLEDGE_BASE_DIR)): path.read_text(encoding="utf-8")
+        for path in sorted(KNOWLEDGE_BASE_DIR.rglob("*"))
+        if path.suffix in (".md", ".txt")
+    }
+    return {name: text for name, text in texts.items() if text.strip()}
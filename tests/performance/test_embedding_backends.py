@@ -0,0 +1,99 @@
+"""嵌入后端基准测试.
+
+在内置知识库语料上比较本地CPU嵌入与OpenAI嵌入的批量编码吞吐量,
+以及单条查询编码的延迟(顺序与并发两种负载).
+未安装sentence-transformers或未配置OPENAI_API_KEY时跳过对应后端.
+"""
+import asyncio
+import importlib.util
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+import pytest
+
+from scriptai.config import settings
+from scriptai.services.rag.base import EmbeddingModel
+from scriptai.services.rag.models.local import LocalEmbedding
+from scriptai.services.rag.models.openai import OpenAIEmbedding
+from scriptai.services.rag.processors.text import DefaultTextProcessor
+
+QUERIES = [
+    "如何写好三幕结构的高潮",
+    "人物弧光怎么设计",
+    "对白如何体现潜台词",
+    "场景标题的格式规范",
+    "如何设置伏笔和呼应",
+    "怎样控制剧本节奏",
+    "角色动机不清晰怎么办",
+    "第一幕的激励事件应该放在哪里",
+]
+CONCURRENCY = 32
+
+
+def _backends() -> Dict[str, EmbeddingModel]:
+    """可用的嵌入后端."""
+    backends: Dict[str, EmbeddingModel] = {}
+    if importlib.util.find_spec("sentence_transformers") is not None:
+        backends["local"] = LocalEmbedding()
+    if os.environ.get("OPENAI_API_KEY"):
+        backends["openai"] = OpenAIEmbedding()
+    return backends
+
+
+def _ms(values: List[float], q: float) -> float:
+    """分位数(毫秒)."""
+    return float(np.percentile(np.asarray(values), q)) * 1000
+
+
+async def _timed(embedding: EmbeddingModel, query: str) -> float:
+    """测量单条查询编码耗时."""
+    begin_time = time.perf_counter()
+    await embedding.encode_query(query)
+    return time.perf_counter() - begin_time
+
+
+@pytest.mark.performance
+@pytest.mark.asyncio
+async def test_embedding_backends(
+    knowledge_base_texts: Dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """测试各嵌入后端的吞吐量和查询延迟."""
+    backends = _backends()
+    if not backends:
+        pytest.skip("没有可用的嵌入后端")
+    # 关闭嵌入缓存, 测量真实的编码开销
+    monkeypatch.setattr(settings, "OPENAI_ENABLE_CACHE", False)
+
+    processor = DefaultTextProcessor()
+    chunks: List[str] = []
+    for text in knowledge_base_texts.values():
+        chunks.extend(await processor.split(await processor.clean(text)))
+
+    print(
+        f"\n{'backend':<10}{'chunks/s':>10}"
+        f"{'p50(ms)':>10}{'p95(ms)':>10}{'conc p95(ms)':>14}"
+    )
+    for name, embedding in backends.items():
+        # 预热(加载模型/建立连接)
+        await embedding.encode_query(QUERIES[0])
+
+        begin_time = time.perf_counter()
+        vectors = await embedding.encode(chunks)
+        throughput = len(chunks) / (time.perf_counter() - begin_time)
+        assert len(vectors) == len(chunks)
+
+        sequential = [await _timed(embedding, query) for query in QUERIES]
+        concurrent = await asyncio.gather(
+            *(_timed(embedding, QUERIES[i % len(QUERIES)]) for i in range(CONCURRENCY))
+        )
+        print(
+            f"{name:<10}{throughput:>10.1f}"
+            f"{_ms(sequential, 50):>10.1f}{_ms(sequential, 95):>10.1f}"
+            f"{_ms(concurrent, 95):>14.1f}"
+        )
+
+        if isinstance(embedding, LocalEmbedding):
+            embedding.close()
@@ -0,0 +1,114 @@
+"""HNSW召回率与延迟基准测试.
+
+与精确检索(InMemoryVectorStore)比较不同efSearch下的recall@k和查询延迟,
+用于判断数据规模多大时才需要Milvus. 纯Python构建较慢, 默认只测10k;
+通过环境变量RAG_HNSW_BENCH_SIZES指定规模, 例如"10000,100000,1000000".
+"""
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+import pytest
+
+from scriptai.services.rag.base import Document
+from scriptai.services.rag.stores.hnsw import HNSWVectorStore
+from scriptai.services.rag.stores.memory import InMemoryVectorStore
+
+DIM = 128
+TOP_K = 10
+N_QUERIES = 100
+N_CLUSTERS = 64
+EF_SEARCH = [16, 64, 128]
+ADD_BATCH = 10_000
+
+
+def _sizes() -> List[int]:
+    """基准规模."""
+    value = os.environ.get("RAG_HNSW_BENCH_SIZES", "10000")
+    return [int(size) for size in value.split(",") if size.strip()]
+
+
+def _clustered(n: int, rng: np.random.Generator) -> np.ndarray:
+    """带聚类结构的单位向量, 比均匀随机数据更接近真实嵌入分布."""
+    centers = rng.normal(size=(N_CLUSTERS, DIM))
+    vectors = centers[rng.integers(N_CLUSTERS, size=n)] + 0.5 * rng.normal(
+        size=(n, DIM)
+    )
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+async def _fill(store: InMemoryVectorStore, vectors: np.ndarray) -> float:
+    """分批写入向量, 返回耗时."""
+    begin_time = time.perf_counter()
+    for i in range(0, len(vectors), ADD_BATCH):
+        batch = vectors[i : i + ADD_BATCH]
+        documents = [
+            Document(content=str(i + j), metadata={}) for j in range(len(batch))
+        ]
+        assert await store.add(documents, batch.tolist())
+    return time.perf_counter() - begin_time
+
+
+async def _run_queries(
+    store: InMemoryVectorStore,
+    queries: np.ndarray,
+) -> Dict[str, object]:
+    """执行查询, 返回结果ID和各次延迟."""
+    ids, latencies = [], []
+    for query in queries.tolist():
+        begin_time = time.perf_counter()
+        hits = await store.search(query, limit=TOP_K)
+        latencies.append(time.perf_counter() - begin_time)
+        ids.append([int(hit.content) for hit in hits])
+    return {"ids": ids, "latencies": latencies}
+
+
+@pytest.mark.performance
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", _sizes())
+async def test_hnsw_recall_vs_exact(size: int) -> None:
+    """测试HNSW相对精确检索的召回率和延迟."""
+    rng = np.random.default_rng(0)
+    vectors = _clustered(size, rng)
+    queries = _clustered(N_QUERIES, rng)
+
+    exact = InMemoryVectorStore(initial_capacity=size)
+    await _fill(exact, vectors)
+    truth = await _run_queries(exact, queries)
+
+    hnsw = HNSWVectorStore(
+        initial_capacity=size,
+        m=16,
+        ef_construction=100,
+        exact_threshold=0,
+        seed=0,
+    )
+    build_time = await _fill(hnsw, vectors)
+
+    print(f"\nn={size} dim={DIM} build={build_time:.1f}s")
+    print(f"{'engine':<14}{'recall@k':>10}{'p50(ms)':>10}{'p95(ms)':>10}")
+    exact_latencies = np.asarray(truth["latencies"]) * 1000
+    print(
+        f"{'exact':<14}{1.0:>10.3f}"
+        f"{np.percentile(exact_latencies, 50):>10.2f}"
+        f"{np.percentile(exact_latencies, 95):>10.2f}"
+    )
+
+    recalls = {}
+    for ef in EF_SEARCH:
+        hnsw.ef_search = ef
+        result = await _run_queries(hnsw, queries)
+        recalls[ef] = np.mean(
+            [len(set(a) & set(b)) / TOP_K for a, b in zip(result["ids"], truth["ids"])]
+        )
+        latencies = np.asarray(result["latencies"]) * 1000
+        print(
+            f"{f'hnsw ef={ef}':<14}{recalls[ef]:>10.3f}"
+            f"{np.percentile(latencies, 50):>10.2f}"
+            f"{np.percentile(latencies, 95):>10.2f}"
+        )
+
+    assert recalls[max(EF_SEARCH)] >= 0.9
+    assert recalls[max(EF_SEARCH)] >= recalls[min(EF_SEARCH)]
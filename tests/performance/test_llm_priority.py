@@ -0,0 +1,89 @@
+"""LLM请求优先级基准测试.
+
+模拟批量导入占满OpenAI并发名额时交互请求的延迟: 导入一次提交大量嵌入
+请求, 交互请求按固定间隔到达. 比较无导入、单一FIFO队列和按优先级类别
+加权公平准入三种情况下交互请求的p50/p95延迟(排队+调用).
+"""
+import asyncio
+import statistics
+import time
+from typing import Dict, List, Optional
+
+import pytest
+
+from scriptai.core.ratelimit import AdaptiveRateLimiter
+
+CONCURRENCY = 4
+BATCH_REQUESTS = 200
+BATCH_LATENCY = 0.05
+INTERACTIVE_REQUESTS = 40
+INTERACTIVE_LATENCY = 0.02
+INTERACTIVE_INTERVAL = 0.025
+WEIGHTS = {"interactive": 8, "background": 2, "batch": 1}
+
+
+async def _call(
+    limiter: AdaptiveRateLimiter,
+    priority: Optional[str],
+    latency: float,
+) -> float:
+    """模拟一次API调用, 返回排队+调用的总耗时."""
+    begin_time = time.perf_counter()
+    async with limiter.acquire(priority=priority):
+        await asyncio.sleep(latency)
+    return time.perf_counter() - begin_time
+
+
+async def _run(import_load: bool, weighted: bool) -> Dict[str, float]:
+    """运行一种场景, 返回交互请求的延迟分位数(毫秒)."""
+    limiter = AdaptiveRateLimiter(
+        "bench",
+        max_concurrency=CONCURRENCY,
+        weights=WEIGHTS if weighted else None,
+    )
+    interactive = "interactive" if weighted else None
+    batch = "batch" if weighted else None
+
+    tasks: List[asyncio.Task] = []
+    if import_load:
+        tasks = [
+            asyncio.create_task(_call(limiter, batch, BATCH_LATENCY))
+            for _ in range(BATCH_REQUESTS)
+        ]
+        await asyncio.sleep(0)
+
+    pending = []
+    for _ in range(INTERACTIVE_REQUESTS):
+        pending.append(
+            asyncio.create_task(_call(limiter, interactive, INTERACTIVE_LATENCY))
+        )
+        await asyncio.sleep(INTERACTIVE_INTERVAL)
+    latencies = await asyncio.gather(*pending)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    quantiles = statistics.quantiles(latencies, n=20)
+    return {"p50": quantiles[9] * 1000, "p95": quantiles[18] * 1000}
+
+
+@pytest.mark.performance
+@pytest.mark.asyncio
+async def test_interactive_latency_during_import() -> None:
+    """测试批量导入期间交互请求的p95延迟保持平稳."""
+    idle = await _run(import_load=False, weighted=True)
+    fifo = await _run(import_load=True, weighted=False)
+    weighted = await _run(import_load=True, weighted=True)
+
+    print(f"\n{'scenario':<20}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, result in (
+        ("idle", idle),
+        ("import, fifo", fifo),
+        ("import, priority", weighted),
+    ):
+        print(f"{name:<20}{result['p50']:>10.1f}{result['p95']:>10.1f}")
+
+    # 交互请求最多等待一个批量请求让出名额
+    assert weighted["p95"] < idle["p95"] + BATCH_LATENCY * 1000 * 2
+    assert weighted["p95"] * 5 < fifo["p95"]
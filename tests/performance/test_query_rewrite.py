@@ -0,0 +1,143 @@
+"""查询重写策略基准测试.
+
+比较不同重写模式的延迟, 以及检索结果与基准模式的重合度(overlap@k).
+检索使用本地的字符二元组哈希向量, 以排除嵌入服务的影响;
+配置了OPENAI_API_KEY时才会运行LLM重写模式.
+"""
+import hashlib
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+import pytest
+
+from scriptai.config import settings
+from scriptai.services.rag.models.openai import OpenAILLM
+from scriptai.services.rag.processors.text import DefaultTextProcessor
+from scriptai.services.rag.rewriters import (
+    CachedLLMRewriter,
+    NoopRewriter,
+    TemplateRewriter,
+)
+
+DIM = 512
+TOP_K = 5
+
+QUERIES = [
+    "如何写好三幕结构的高潮",
+    "三幕结构高潮技巧",
+    "人物弧光怎么设计",
+    "对白如何体现潜台词",
+    "场景标题的格式规范",
+    "第一幕的激励事件应该放在哪里",
+    "如何设置伏笔和呼应",
+    "怎样控制剧本节奏",
+    "角色动机不清晰怎么办",
+    "INT. 和 EXT. 的写法",
+]
+
+
+def _embed(text: str) -> np.ndarray:
+    """字符二元组哈希向量."""
+    vector = np.zeros(DIM, dtype=np.float32)
+    for i in range(len(text) - 1):
+        digest = hashlib.md5(text[i : i + 2].encode("utf-8")).digest()
+        vector[int.from_bytes(digest[:4], "little") % DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _top_k(matrix: np.ndarray, query: str) -> List[int]:
+    """暴力检索top-k."""
+    scores = matrix @ _embed(query)
+    return [int(i) for i in np.argsort(-scores)[:TOP_K]]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """计算分位数."""
+    return float(np.percentile(np.asarray(values), q))
+
+
+@pytest.mark.performance
+@pytest.mark.asyncio
+async def test_query_rewrite_modes(
+    knowledge_base_texts: Dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """测试各重写模式的延迟和检索重合度."""
+    # 关闭补全缓存, 使冷启动的LLM重写反映真实往返延迟
+    monkeypatch.setattr(settings, "OPENAI_ENABLE_CACHE", False)
+
+    processor = DefaultTextProcessor()
+    chunks: List[str] = []
+    for text in knowledge_base_texts.values():
+        chunks.extend(await processor.split(await processor.clean(text)))
+    matrix = np.vstack([_embed(chunk) for chunk in chunks])
+
+    modes = {"none": NoopRewriter(), "template": TemplateRewriter()}
+    if os.environ.get("OPENAI_API_KEY"):
+        # 仅用进程内缓存, 不依赖Redis
+        llm_rewriter = CachedLLMRewriter(OpenAILLM(), use_redis=False)
+        modes["llm(cold)"] = llm_rewriter
+        modes["llm(warm)"] = llm_rewriter
+
+    latencies: Dict[str, List[float]] = {}
+    rankings: Dict[str, List[List[int]]] = {}
+    for mode, rewriter in modes.items():
+        latencies[mode] = []
+        rankings[mode] = []
+        for query in QUERIES:
+            begin_time = time.perf_counter()
+            rewritten = await rewriter.rewrite(query)
+            latencies[mode].append(time.perf_counter() - begin_time)
+            rankings[mode].append(_top_k(matrix, rewritten))
+
+    baseline = "llm(cold)" if "llm(cold)" in rankings else "none"
+    print(f"\n{'mode':<12}{'mean(ms)':>10}{'p95(ms)':>10}{'overlap@k':>12}")
+    for mode in modes:
+        overlap = np.mean(
+            [
+                len(set(a) & set(b)) / TOP_K
+                for a, b in zip(rankings[mode], rankings[baseline])
+            ]
+        )
+        print(
+            f"{mode:<12}"
+            f"{np.mean(latencies[mode]) * 1000:>10.2f}"
+            f"{_percentile(latencies[mode], 95) * 1000:>10.2f}"
+            f"{overlap:>12.2f}"
+        )
+
+    # 本地模式不应产生网络级延迟
+    assert _percentile(latencies["template"], 95) < 0.005
+    if "llm(warm)" in latencies:
+        assert np.mean(latencies["llm(warm)"]) < np.mean(latencies["llm(cold)"])
+
+
+@pytest.mark.asyncio
+async def test_template_rewriter_expands_terms() -> None:
+    """测试术语扩展."""
+    rewriter = TemplateRewriter()
+    rewritten = await rewriter.rewrite("如何写好三幕结构的高潮")
+    assert rewritten.startswith("如何写好三幕结构的高潮")
+    assert "建置" in rewritten
+    assert "转折点" in rewritten
+    assert await rewriter.rewrite("你好") == "你好"
+
+
+@pytest.mark.asyncio
+async def test_template_rewriter_matches_whole_words() -> None:
+    """测试拉丁字母触发词不匹配单词内部."""
+    rewriter = TemplateRewriter()
+    for query in [
+        "how to write characters with depth",
+        "fact checking the action line",
+        "what comes next.",
+        "give me a hint.",
+    ]:
+        assert await rewriter.rewrite(query) == query
+
+    assert "三幕结构" in await rewriter.rewrite("the second act")
+    assert "内景" in await rewriter.rewrite("INT. 咖啡馆 - 日")
+    assert "三幕结构" in await rewriter.rewrite("第二act")
@@ -0,0 +1,98 @@
+"""剧本分块基准测试.
+
+在内置知识库语料上比较按句子分块与按场景/对白块分块的分块数、索引文本量
+和被切断的对白块数; 在数MB的合成剧本上测量吞吐量, 验证耗时随文本大小线性
+增长. 通过环境变量RAG_SCREENPLAY_BENCH_MB指定文本大小, 默认"1,4".
+"""
+import os
+import time
+from typing import Dict, List
+
+import pytest
+
+from scriptai.services.rag.base import TextProcessor
+from scriptai.services.rag.processors.screenplay import ScreenplayTextProcessor
+from scriptai.services.rag.processors.text import (
+    DefaultTextProcessor,
+    TextProcessingConfig,
+)
+
+
+def _sizes() -> List[int]:
+    """基准文本大小(MB)."""
+    value = os.environ.get("RAG_SCREENPLAY_BENCH_MB", "1,4")
+    return [int(size) for size in value.split(",") if size.strip()]
+
+
+def _compact(text: str) -> str:
+    """去掉空白和换行占位符, 便于比较不同清理方式下的文本."""
+    return "".join(text.replace("<br>", "").split())
+
+
+async def _dialogues(text: str) -> List[str]:
+    """文本中的对白块(角色提示行及其台词)."""
+    processor = ScreenplayTextProcessor()
+    return [
+        _compact(block)
+        for _, block, character in processor._blocks(await processor.clean(text))
+        if character is not None
+    ]
+
+
+def _script(megabytes: int) -> str:
+    """生成指定大小(UTF-8字节)的剧本文本."""
+    scene = (
+        "### 场景{index}：咖啡馆 - 日 - 内景\n"
+        "林夏推门而入，环顾四周。窗外下着小雨，店里只有一位客人。\n\n"
+        "陈默：（放下杯子）\n我从来没有忘记过。那天你走得太急了。\n\n"
+        "林夏：\n我知道。所以我回来了。\n\n"
+    )
+    size = len(scene.encode("utf-8"))
+    return "".join(
+        scene.format(index=index)
+        for index in range(megabytes * 1024 * 1024 // size + 1)
+    )
+
+
+@pytest.mark.performance
+@pytest.mark.asyncio
+async def test_chunk_count_on_knowledge_base(
+    knowledge_base_texts: Dict[str, str],
+) -> None:
+    """测试知识库语料上的分块数与索引文本量."""
+    config = TextProcessingConfig(chunk_unit="char")
+    processors: Dict[str, TextProcessor] = {
+        "default": DefaultTextProcessor(config),
+        "screenplay": ScreenplayTextProcessor(config),
+    }
+
+    print(f"\n{'processor':<12}{'chunks':>8}{'indexed chars':>16}{'cut dialogues':>16}")
+    for name, processor in processors.items():
+        chunks: List[str] = []
+        cut = 0
+        for text in knowledge_base_texts.values():
+            document_chunks = await processor.split(await processor.clean(text))
+            chunks.extend(document_chunks)
+            compacted = [_compact(chunk) for chunk in document_chunks]
+            cut += sum(
+                not any(dialogue in chunk for chunk in compacted)
+                for dialogue in await _dialogues(text)
+            )
+        print(f"{name:<12}{len(chunks):>8}{sum(map(len, chunks)):>16}{cut:>16}")
+        if name == "screenplay":
+            assert cut == 0
+
+
+@pytest.mark.performance
+@pytest.mark.asyncio
+async def test_split_throughput() -> None:
+    """测试分块吞吐量随文本大小线性."""
+    processor = ScreenplayTextProcessor(TextProcessingConfig(chunk_unit="char"))
+
+    print(f"\n{'size':<8}{'chunks':>10}{'seconds':>10}{'MB/s':>10}")
+    for megabytes in _sizes():
+        text = await processor.clean(_script(megabytes))
+        begin_time = time.perf_counter()
+        count = sum(1 for _ in processor.iter_split_with_metadata(text))
+        elapsed = time.perf_counter() - begin_time
+        print(f"{megabytes:<8}{count:>10}{elapsed:>10.2f}{megabytes / elapsed:>10.1f}")
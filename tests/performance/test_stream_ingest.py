@@ -0,0 +1,171 @@
+"""流式上传入库内存基准测试.
+
+比较原先整体读入、解码后入库与边读边解码、按批入库两种方式的峰值内存
+(tracemalloc). 嵌入模型和向量库为只计数的替身, 只衡量入库流水线本身.
+通过环境变量RAG_STREAM_BENCH_MB指定文件大小, 默认"4,16".
+"""
+import io
+import os
+import time
+import tracemalloc
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+import pytest
+
+from scriptai.services.rag.base import (
+    Document,
+    EmbeddingModel,
+    IngestConfig,
+    LLMModel,
+    RAGService,
+    SearchResult,
+    VectorStore,
+)
+from scriptai.services.rag.processors.screenplay import ScreenplayTextProcessor
+from scriptai.services.rag.processors.text import TextProcessingConfig
+from scriptai.services.rag.streaming import decode_stream
+
+READ_SIZE = 65536
+
+
+def _sizes() -> List[int]:
+    """基准文件大小(MB)."""
+    value = os.environ.get("RAG_STREAM_BENCH_MB", "4,16")
+    return [int(size) for size in value.split(",") if size.strip()]
+
+
+class _CountingEmbedding(EmbeddingModel):
+    """返回固定向量的嵌入模型."""
+
+    async def encode(self, texts: List[str]) -> List[List[float]]:
+        return [[1.0, 0.0] for _ in texts]
+
+    async def encode_query(self, text: str) -> List[float]:
+        return [1.0, 0.0]
+
+
+class _CountingStore(VectorStore):
+    """只计数、不保存的向量库."""
+
+    def __init__(self) -> None:
+        self.count = 0
+
+    async def add(
+        self,
+        documents: List[Document],
+        embeddings: List[List[float]],
+    ) -> bool:
+        self.count += len(documents)
+        return True
+
+    async def search(
+        self,
+        query_embedding: List[float],
+        limit: int = 5,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[SearchResult]:
+        return []
+
+    async def existing_ids(self, ids: List[str]) -> Set[str]:
+        return set()
+
+    async def delete(self, filter: Dict[str, Any]) -> bool:
+        return True
+
+
+class _UnusedLLM(LLMModel):
+    """不使用的LLM."""
+
+    async def generate(
+        self,
+        prompt: str,
+        context: List[str],
+        **kwargs: Dict[str, Any],
+    ) -> str:
+        return ""
+
+    async def rewrite_query(self, query: str) -> str:
+        return query
+
+
+def _service() -> RAGService:
+    """构建基准服务."""
+    return RAGService(
+        vector_store=_CountingStore(),
+        text_processor=ScreenplayTextProcessor(TextProcessingConfig(chunk_unit="char")),
+        embedding_model=_CountingEmbedding(),
+        llm_model=_UnusedLLM(),
+        ingest_config=IngestConfig(),
+    )
+
+
+def _upload(megabytes: int) -> bytes:
+    """生成指定大小的剧本文件内容."""
+    scene = (
+        "### 场景{index}：咖啡馆 - 日 - 内景\n"
+        "林夏推门而入，环顾四周。窗外下着小雨，店里只有一位客人。\n\n"
+        "陈默：（放下杯子）\n我从来没有忘记过。那天你走得太急了。{index}\n\n"
+        "林夏：\n我知道。所以我回来了。\n\n"
+    )
+    size = len(scene.encode("utf-8"))
+    return "".join(
+        scene.format(index=index)
+        for index in range(megabytes * 1024 * 1024 // size + 1)
+    ).encode("utf-8")
+
+
+async def _legacy(service: RAGService, file: io.BytesIO) -> int:
+    """原先的上传入库: 整体读入并解码."""
+    text = file.read().decode("utf-8")
+    await service.add_document(text, metadata={"type": "example"})
+    return service.vector_store.count
+
+
+async def _streaming(service: RAGService, file: io.BytesIO) -> int:
+    """流式上传入库."""
+
+    async def read() -> AsyncIterator[bytes]:
+        while chunk := file.read(READ_SIZE):
+            yield chunk
+
+    await service.add_document_stream(
+        decode_stream(read()), metadata={"type": "example"}
+    )
+    return service.vector_store.count
+
+
+async def _measure(
+    ingest: Callable[[RAGService, io.BytesIO], Awaitable[int]],
+    data: bytes,
+) -> Dict[str, float]:
+    """测量入库耗时与峰值内存(不含文件内容本身)."""
+    service = _service()
+    file = io.BytesIO(data)
+    tracemalloc.start()
+    begin_time = time.perf_counter()
+    chunks = await ingest(service, file)
+    elapsed = time.perf_counter() - begin_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"chunks": chunks, "seconds": elapsed, "peak_mb": peak / 1024 / 1024}
+
+
+@pytest.mark.performance
+@pytest.mark.asyncio
+async def test_stream_ingest_memory() -> None:
+    """测试流式入库的峰值内存与文件大小无关."""
+    peaks = []
+    print(f"\n{'size':<6}{'mode':<12}{'chunks':>10}{'seconds':>10}{'peak MB':>10}")
+    for megabytes in _sizes():
+        data = _upload(megabytes)
+        for name, ingest in (("legacy", _legacy), ("streaming", _streaming)):
+            result = await _measure(ingest, data)
+            print(
+                f"{megabytes:<6}{name:<12}{result['chunks']:>10}"
+                f"{result['seconds']:>10.2f}{result['peak_mb']:>10.1f}"
+            )
+            if name == "streaming":
+                peaks.append(result["peak_mb"])
+
+    # 除去分块ID(每块约100字节)外, 峰值内存不随文件增大
+    assert max(peaks) < min(peaks) * 2
@@ -0,0 +1,98 @@
+"""文本清理基准测试.
+
+在数MB的上传文本上比较原先固定七步的清理实现与按配置预生成步骤的实现,
+并校验两者结果一致. 通过环境变量RAG_CLEAN_BENCH_MB指定文本大小, 默认"1,8".
+"""
+import os
+import re
+import time
+from typing import Callable, Dict, List
+
+import pytest
+
+from scriptai.services.rag.processors.text import (
+    DefaultTextProcessor,
+    TextProcessingConfig,
+)
+
+CONFIGS: Dict[str, Dict[str, bool]] = {
+    "default": {},
+    "no_line_breaks": {"preserve_line_breaks": False},
+    "remove_urls": {"remove_urls": True},
+    "spaces_only": {"normalize_whitespace": False},
+    "keep_spaces": {"remove_extra_spaces": False, "normalize_whitespace": False},
+}
+ROUNDS = 3
+
+
+def _sizes() -> List[int]:
+    """基准文本大小(MB)."""
+    value = os.environ.get("RAG_CLEAN_BENCH_MB", "1,8")
+    return [int(size) for size in value.split(",") if size.strip()]
+
+
+def _legacy_clean(text: str, config: TextProcessingConfig) -> str:
+    """原先的清理实现."""
+    if config.preserve_line_breaks:
+        text = text.replace("\n", " <br> ")
+    if config.remove_extra_spaces:
+        text = re.sub(r"\s+", " ", text)
+    if config.remove_urls:
+        text = re.sub(
+            r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+",
+            "",
+            text,
+        )
+    if config.remove_email:
+        text = re.sub(r"[\w\.-]+@[\w\.-]+\.\w+", "", text)
+    if config.normalize_whitespace:
+        text = " ".join(text.split())
+    if config.preserve_line_breaks:
+        text = text.replace(" <br> ", "\n")
+    return text.strip()
+
+
+def _upload(megabytes: int) -> str:
+    """生成指定大小(UTF-8字节)的上传文本, 含多余空白、空行和链接."""
+    block = (
+        "第一场  内景 咖啡馆 - 日\r\n\n"
+        "林夏推门而入，\t环顾四周。  参考 https://example.com/ref?id=42 \n"
+        "陈默：（放下杯子）我从来没有忘记过。   联系 writer@example.com\n\n\n"
+    )
+    repeat = megabytes * 1024 * 1024 // len(block.encode("utf-8")) + 1
+    return block * repeat
+
+
+def _best(run: Callable[[], str]) -> float:
+    """多轮取最短耗时."""
+    timings = []
+    for _ in range(ROUNDS):
+        begin_time = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - begin_time)
+    return min(timings)
+
+
+@pytest.mark.performance
+@pytest.mark.asyncio
+@pytest.mark.parametrize("megabytes", _sizes())
+async def test_clean_throughput(megabytes: int) -> None:
+    """测试清理吞吐量."""
+    text = _upload(megabytes)
+
+    print(f"\ntext={megabytes}MB")
+    print(f"{'config':<16}{'legacy MB/s':>14}{'current MB/s':>14}{'speedup':>10}")
+    for name, flags in CONFIGS.items():
+        config = TextProcessingConfig(**flags)
+        processor = DefaultTextProcessor(config)
+        assert await processor.clean(text) == _legacy_clean(text, config)
+
+        legacy = _best(lambda: _legacy_clean(text, config))
+        begin_time = time.perf_counter()
+        for _ in range(ROUNDS):
+            await processor.clean(text)
+        current = (time.perf_counter() - begin_time) / ROUNDS
+        print(
+            f"{name:<16}{megabytes / legacy:>14.1f}"
+            f"{megabytes / current:>14.1f}{legacy / current:>10.2f}"
+        )
@@ -0,0 +1,96 @@
+"""文本分块基准测试.
+
+在数MB的剧本文本上比较原先基于re.split的整篇分块与流式分块的吞吐量和
+额外峰值内存(tracemalloc, 不含输入文本本身). 流式分块逐块消费, 不保留结果.
+通过环境变量RAG_SPLIT_BENCH_MB指定文本大小, 默认"1,4".
+"""
+import os
+import re
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import pytest
+
+from scriptai.services.rag.processors.text import (
+    DefaultTextProcessor,
+    TextProcessingConfig,
+)
+
+
+def _sizes() -> List[int]:
+    """基准文本大小(MB)."""
+    value = os.environ.get("RAG_SPLIT_BENCH_MB", "1,4")
+    return [int(size) for size in value.split(",") if size.strip()]
+
+
+def _legacy_split(text: str, config: TextProcessingConfig) -> List[str]:
+    """原先的分块实现: 整篇re.split后拼接, 丢弃过小的块."""
+    chunks = []
+    current_chunk: List[str] = []
+    current_size = 0
+    sentences = re.split(r"([。！？.!?])", text)
+    for i in range(0, len(sentences), 2):
+        sentence = sentences[i]
+        if i + 1 < len(sentences):
+            sentence += sentences[i + 1]
+        if current_size + len(sentence) > config.chunk_size:
+            if current_chunk:
+                chunks.append("".join(current_chunk))
+            current_chunk = [sentence]
+            current_size = len(sentence)
+        else:
+            current_chunk.append(sentence)
+            current_size += len(sentence)
+    if current_chunk:
+        chunks.append("".join(current_chunk))
+    return [chunk.strip() for chunk in chunks if len(chunk) >= config.min_chunk_size]
+
+
+def _script(megabytes: int) -> str:
+    """生成指定大小(UTF-8字节)的剧本文本."""
+    scene = (
+        "内景 咖啡馆 - 日\n"
+        "林夏推门而入，环顾四周。她的目光停在角落里的陈默身上！\n"
+        "林夏：你还记得三年前的约定吗？\n"
+        "陈默：（放下杯子）我从来没有忘记过。\n"
+        "窗外下起了雨，两人沉默良久。\n"
+    )
+    repeat = megabytes * 1024 * 1024 // len(scene.encode("utf-8")) + 1
+    return scene * repeat
+
+
+def _measure(run: Callable[[], int]) -> Dict[str, float]:
+    """测量耗时和额外峰值内存."""
+    tracemalloc.start()
+    begin_time = time.perf_counter()
+    count = run()
+    elapsed = time.perf_counter() - begin_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"chunks": count, "seconds": elapsed, "peak_mb": peak / 1024 / 1024}
+
+
+@pytest.mark.performance
+@pytest.mark.parametrize("megabytes", _sizes())
+def test_streaming_vs_legacy_split(megabytes: int) -> None:
+    """测试流式分块的吞吐量和峰值内存."""
+    text = _script(megabytes)
+    processor = DefaultTextProcessor()
+    config = processor.config
+
+    legacy = _measure(lambda: len(_legacy_split(text, config)))
+    streaming = _measure(lambda: sum(1 for _ in processor.iter_split(text)))
+
+    print(f"\ntext={megabytes}MB ({len(text)} chars)")
+    print(f"{'splitter':<12}{'chunks':>8}{'MB/s':>10}{'peak(MB)':>10}")
+    for name, result in (("legacy", legacy), ("streaming", streaming)):
+        print(
+            f"{name:<12}{result['chunks']:>8}"
+            f"{megabytes / result['seconds']:>10.1f}"
+            f"{result['peak_mb']:>10.2f}"
+        )
+
+    # 流式分块的额外内存与文档大小无关
+    assert streaming["peak_mb"] < 1
+    assert streaming["peak_mb"] < legacy["peak_mb"] / 10
@@ -0,0 +1,165 @@
+"""RAG语义缓存测试."""
+import time
+from typing import Any, Dict, List
+
+import pytest
+
+from scriptai.services.rag.base import (
+    EmbeddingModel,
+    LLMModel,
+    QueryRewriter,
+    RAGService,
+)
+from scriptai.services.rag.cache import SemanticCache
+from scriptai.services.rag.processors.text import DefaultTextProcessor
+from scriptai.services.rag.stores.memory import InMemoryVectorStore
+
+
+@pytest.fixture
+def cache() -> SemanticCache:
+    """创建语义缓存."""
+    return SemanticCache(threshold=0.9, max_entries=2, ttl=60)
+
+
+def test_hit_for_similar_query(cache: SemanticCache) -> None:
+    """测试相近查询命中缓存."""
+    cache.store("ns", [1.0, 0.0, 0.0], ["c1"], "回答")
+    cached = cache.lookup("ns", [0.98, 0.05, 0.0])
+    assert cached is not None
+    assert cached.answer == "回答"
+    assert cached.context_ids == ["c1"]
+
+
+def test_miss_for_dissimilar_query(cache: SemanticCache) -> None:
+    """测试差异较大的查询不命中."""
+    cache.store("ns", [1.0, 0.0, 0.0], ["c1"], "回答")
+    assert cache.lookup("ns", [0.0, 1.0, 0.0]) is None
+
+
+def test_namespace_isolation(cache: SemanticCache) -> None:
+    """测试不同过滤条件互不共享."""
+    cache.store("type=theory", [1.0, 0.0], ["c1"], "回答")
+    assert cache.lookup("type=example", [1.0, 0.0]) is None
+
+
+def test_lru_eviction(cache: SemanticCache) -> None:
+    """测试超过容量时淘汰最久未使用的条目."""
+    cache.store("ns", [1.0, 0.0, 0.0], [], "a")
+    cache.store("ns", [0.0, 1.0, 0.0], [], "b")
+    assert cache.lookup("ns", [1.0, 0.0, 0.0]).answer == "a"
+    cache.store("ns", [0.0, 0.0, 1.0], [], "c")
+
+    assert len(cache) == 2
+    assert cache.lookup("ns", [0.0, 1.0, 0.0]) is None
+    assert cache.lookup("ns", [1.0, 0.0, 0.0]).answer == "a"
+
+
+def test_ttl_expiry(cache: SemanticCache, monkeypatch: pytest.MonkeyPatch) -> None:
+    """测试过期条目失效."""
+    cache.store("ns", [1.0, 0.0], [], "回答")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+    assert cache.lookup("ns", [1.0, 0.0]) is None
+    assert len(cache) == 0
+
+
+def test_invalidate_by_context(cache: SemanticCache) -> None:
+    """测试按上下文ID失效."""
+    cache.store("ns", [1.0, 0.0], ["c1", "c2"], "a")
+    cache.store("ns", [0.0, 1.0], ["c3"], "b")
+    assert cache.invalidate(["c2"]) == 1
+    assert cache.lookup("ns", [1.0, 0.0]) is None
+    assert cache.lookup("ns", [0.0, 1.0]).answer == "b"
+
+
+class _FakeEmbedding(EmbeddingModel):
+    """相同文本得到相同向量, 记录被嵌入的查询."""
+
+    def __init__(self) -> None:
+        self.queries: List[str] = []
+
+    async def encode(self, texts: List[str]) -> List[List[float]]:
+        return [[1.0, 0.0] for _ in texts]
+
+    async def encode_query(self, text: str) -> List[float]:
+        self.queries.append(text)
+        return [1.0, float(len(text))]
+
+
+class _CountingLLM(LLMModel):
+    """按调用次数编号回答."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def generate(
+        self,
+        prompt: str,
+        context: List[str],
+        **kwargs: Dict[str, Any],
+    ) -> str:
+        self.calls += 1
+        return f"回答{self.calls}"
+
+    async def rewrite_query(self, query: str) -> str:
+        return query
+
+
+@pytest.mark.asyncio
+async def test_generate_cache_scoped() -> None:
+    """测试回答只在同一作用域内共享, 且只按用户内容匹配."""
+    embedding = _FakeEmbedding()
+    service = RAGService(
+        vector_store=InMemoryVectorStore(),
+        text_processor=DefaultTextProcessor(),
+        embedding_model=embedding,
+        llm_model=_CountingLLM(),
+        semantic_cache=SemanticCache(threshold=0.99),
+    )
+    prompt = "请分析以下对话: 甲: 你好"
+
+    first = await service.generate(prompt, cache_scope="dialogue:1", cache_text="甲")
+    again = await service.generate(prompt, cache_scope="dialogue:1", cache_text="甲")
+    other_user = await service.generate(
+        prompt,
+        cache_scope="dialogue:2",
+        cache_text="甲",
+    )
+
+    assert first == again == "回答1"
+    assert other_user == "回答2"
+    # 缓存只嵌入用户内容, 检索仍使用完整提示词
+    assert embedding.queries == ["甲", prompt, "甲", "甲", prompt]
+
+
+class _SuffixRewriter(QueryRewriter):
+    """在查询后追加固定术语."""
+
+    async def rewrite(self, query: str) -> str:
+        return f"{query} 术语"
+
+
+@pytest.mark.asyncio
+async def test_generate_cache_per_rewrite_mode() -> None:
+    """测试不同重写模式的回答互不共享, 未重写时检索复用缓存查询的向量."""
+    embedding = _FakeEmbedding()
+    service = RAGService(
+        vector_store=InMemoryVectorStore(),
+        text_processor=DefaultTextProcessor(),
+        embedding_model=embedding,
+        llm_model=_CountingLLM(),
+        semantic_cache=SemanticCache(threshold=0.99),
+        query_rewriters={"template": _SuffixRewriter()},
+        rewrite_mode="none",
+    )
+
+    plain = await service.generate("三幕结构")
+    assert embedding.queries == ["三幕结构"]
+
+    rewritten = await service.generate("三幕结构", rewrite="template")
+    assert embedding.queries == ["三幕结构", "三幕结构", "三幕结构 术语"]
+
+    assert plain == "回答1"
+    assert rewritten == "回答2"
+    assert await service.generate("三幕结构", rewrite="none") == "回答1"
+    assert await service.generate("三幕结构", rewrite="template") == "回答2"
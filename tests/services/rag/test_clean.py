@@ -0,0 +1,105 @@
+"""文本清理测试: 与原逐步替换实现的差分测试."""
+import itertools
+import random
+import re
+from typing import Any, Dict, List
+
+import pytest
+
+from scriptai.services.rag.processors.text import (
+    DefaultTextProcessor,
+    TextProcessingConfig,
+)
+
+FLAGS = (
+    "preserve_line_breaks",
+    "remove_extra_spaces",
+    "remove_urls",
+    "remove_email",
+    "normalize_whitespace",
+)
+
+# 随机文本的组成片段, 覆盖各类空白、URL、邮箱和占位符的边界情况
+ALPHABET = [
+    " ",
+    "  ",
+    "\n",
+    "\n\n",
+    "\r\n",
+    "\t",
+    "　",
+    " ",
+    "\x1c",
+    "\xa0",
+    "a",
+    "剧本",
+    "。",
+    ".",
+    "@",
+    "-",
+    "http://",
+    "https://",
+    "x.com",
+    "user@",
+    "mail.cn",
+    "%2F",
+    "!",
+    "#",
+    "<",
+    ">",
+    "br",
+    "<br>",
+    " <br> ",
+]
+
+
+def _reference_clean(text: str, config: TextProcessingConfig) -> str:
+    """原先的逐步替换实现(作为对照)."""
+    if not text:
+        return ""
+    if config.preserve_line_breaks:
+        text = text.replace("\n", " <br> ")
+    if config.remove_extra_spaces:
+        text = re.sub(r"\s+", " ", text)
+    if config.remove_urls:
+        text = re.sub(
+            r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+",
+            "",
+            text,
+        )
+    if config.remove_email:
+        text = re.sub(r"[\w\.-]+@[\w\.-]+\.\w+", "", text)
+    if config.normalize_whitespace:
+        text = " ".join(text.split())
+    if config.preserve_line_breaks:
+        text = text.replace(" <br> ", "\n")
+    return text.strip()
+
+
+def _configs() -> List[Dict[str, Any]]:
+    """所有开关组合."""
+    return [
+        dict(zip(FLAGS, values))
+        for values in itertools.product([False, True], repeat=len(FLAGS))
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("flags", _configs())
+async def test_clean_matches_reference(flags: Dict[str, Any]) -> None:
+    """测试各配置下随机文本的清理结果与原实现一致."""
+    config = TextProcessingConfig(**flags)
+    processor = DefaultTextProcessor(config)
+    rng = random.Random(str(sorted(flags.items())))
+    for _ in range(500):
+        text = "".join(rng.choices(ALPHABET, k=rng.randint(0, 40)))
+        assert await processor.clean(text) == _reference_clean(text, config), text
+
+
+@pytest.mark.asyncio
+async def test_clean_default_config() -> None:
+    """测试默认配置下换行保留、空白折叠."""
+    processor = DefaultTextProcessor()
+    text = "  第一幕\n\n  内景   咖啡馆\t- 日\n林夏：你好。  "
+    assert await processor.clean(text) == "第一幕\n<br> 内景 咖啡馆 - 日\n林夏：你好。"
+    assert await processor.clean("") == ""
@@ -0,0 +1,154 @@
+"""元数据过滤DSL测试."""
+from typing import Any, Dict, List
+
+import numpy as np
+import pytest
+
+from scriptai.services.rag.base import Document
+from scriptai.services.rag.filters import matches, partition_values, to_milvus_expr
+from scriptai.services.rag.stores.lexical import LexicalIndex
+from scriptai.services.rag.stores.memory import InMemoryVectorStore
+
+METADATA: List[Dict[str, Any]] = [
+    {"type": "theory", "importance": "high", "year": 1990},
+    {"type": "theory", "importance": "medium", "year": 2005},
+    {"type": "example", "importance": "high", "year": 2010},
+    {"type": "guideline", "importance": "low"},
+    {"type": "example", "importance": "medium", "year": "2008"},
+]
+
+FILTERS: List[Dict[str, Any]] = [
+    {"type": "theory"},
+    {"type": ["theory", "example"]},
+    {"type": {"$ne": "theory"}},
+    {"importance": {"$nin": ["low", "medium"]}},
+    {"year": {"$gte": 2000, "$lt": 2010}},
+    {"year": {"$gt": 1990}, "importance": "high"},
+    {"$or": [{"type": "guideline"}, {"year": {"$lte": 1990}}]},
+    {"$and": [{"type": {"$in": ["example"]}}, {"$or": [{"year": 2010}, {"a": 1}]}]},
+]
+
+
+def test_to_milvus_expr() -> None:
+    """测试编译为Milvus表达式."""
+    assert to_milvus_expr({"type": "theory", "year": {"$gte": 2000}}) == (
+        'metadata["type"] == "theory" && metadata["year"] >= 2000'
+    )
+    assert to_milvus_expr(
+        {"$or": [{"type": ["a", 'b"c']}, {"importance": {"$nin": ["low"]}}]},
+        scalar_fields=("importance",),
+    ) == ('(metadata["type"] in ["a", "b\\"c"] || importance not in ["low"])')
+    assert to_milvus_expr({"flag": True}) == 'metadata["flag"] == true'
+
+
+@pytest.mark.parametrize(
+    "filter",
+    [
+        {"type": {"$like": "a%"}},
+        {"year": {"$gt": "2000"}},
+        {"type": {"$in": "theory"}},
+        {"$or": []},
+        {'type"] == 1 || metadata["a': 1},
+        {"type": {}},
+    ],
+)
+def test_invalid_filters(filter: Dict[str, Any]) -> None:
+    """测试非法条件."""
+    with pytest.raises(ValueError):
+        to_milvus_expr(filter)
+
+
+def test_partition_values() -> None:
+    """测试分区裁剪取值."""
+    assert partition_values({"type": "theory"}) == ["theory"]
+    assert partition_values({"type": {"$in": ["a", "b"]}}) == ["a", "b"]
+    assert partition_values({"type": {"$ne": "a"}}) == []
+    assert partition_values({"category": "a"}) == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("filter", FILTERS)
+async def test_stores_agree(filter: Dict[str, Any]) -> None:
+    """测试向量库掩码、词法索引与逐条判断结果一致."""
+    expected = [i for i, metadata in enumerate(METADATA) if matches(filter, metadata)]
+
+    store = InMemoryVectorStore(indexed_fields=("type",))
+    rng = np.random.default_rng(0)
+    await store.add(
+        [Document(content=str(i), metadata=m) for i, m in enumerate(METADATA)],
+        rng.normal(size=(len(METADATA), 4)).tolist(),
+    )
+    results = await store.search([1.0, 0.0, 0.0, 0.0], limit=10, filter=filter)
+    assert sorted(int(result.content) for result in results) == expected
+
+    index = LexicalIndex()
+    index.add(
+        [str(i) for i in range(len(METADATA))],
+        [Document(content="剧本", metadata=m) for m in METADATA],
+    )
+    assert sorted(int(doc_id) for doc_id in index.match(filter)) == expected
+
+
+@pytest.mark.asyncio
+async def test_milvus_filters_use_json_path_by_default() -> None:
+    """测试未迁移标量列时, Milvus过滤表达式按JSON字段访问元数据."""
+    pytest.importorskip("pymilvus")
+    from scriptai.services.rag.stores.milvus import MilvusVectorStore
+
+    class _Manager:
+        def __init__(self) -> None:
+            self.exprs: List[str] = []
+
+        async def search(self, expr: str, **kwargs: Any) -> List[Dict[str, Any]]:
+            self.exprs.append(expr)
+            return []
+
+    manager = _Manager()
+    store = MilvusVectorStore(manager=manager)  # type: ignore[arg-type]
+    await store.search([1.0], filter={"category": "悬疑"})
+
+    assert manager.exprs == ['metadata["category"] == "悬疑"']
+
+
+@pytest.mark.asyncio
+async def test_milvus_rebuilds_chunk_ids_on_connect(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """测试连接时以Milvus中的分块重建Redis分块ID集合."""
+    pytest.importorskip("pymilvus")
+    from scriptai.core.redis import redis_client
+    from scriptai.services.rag.stores.milvus import MilvusVectorStore
+
+    class _Manager:
+        async def connect(self) -> None:
+            return None
+
+        async def query(self, expr: str, **kwargs: Any) -> List[Dict[str, Any]]:
+            assert expr == 'metadata["chunk_id"] != ""'
+            return [
+                {"id": 1, "metadata": {"chunk_id": "a"}},
+                {"id": 2, "metadata": {"chunk_id": "b"}},
+            ]
+
+    class _Redis:
+        def __init__(self) -> None:
+            self.sets: Dict[str, set] = {"rag:chunks:stale": {"a", "dropped"}}
+
+        async def delete(self, key: str) -> int:
+            return int(self.sets.pop(key, None) is not None)
+
+        async def sadd(self, key: str, *members: str) -> int:
+            self.sets.setdefault(key, set()).update(members)
+            return len(members)
+
+        async def rename(self, src: str, dst: str) -> bool:
+            self.sets[dst] = self.sets.pop(src)
+            return True
+
+    redis = _Redis()
+    monkeypatch.setattr(redis_client, "_client", redis)
+    store = MilvusVectorStore(manager=_Manager())  # type: ignore[arg-type]
+    store.ids_key = "rag:chunks:stale"
+    await store.connect()
+
+    assert redis.sets == {"rag:chunks:stale": {"a", "b"}}
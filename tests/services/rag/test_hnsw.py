@@ -0,0 +1,161 @@
+"""HNSW向量存储测试."""
+import asyncio
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pytest
+
+from scriptai.services.rag.base import Document
+from scriptai.services.rag.stores.hnsw import HNSWVectorStore
+
+N_VECTORS = 1000
+DIM = 16
+TOP_K = 10
+
+
+def _dataset() -> np.ndarray:
+    """随机单位向量."""
+    vectors = np.random.default_rng(0).normal(size=(N_VECTORS, DIM))
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _documents() -> List[Document]:
+    """测试文档, 按序号奇偶分为两类."""
+    return [
+        Document(content=str(i), metadata={"type": "odd" if i % 2 else "even"})
+        for i in range(N_VECTORS)
+    ]
+
+
+async def _build(metric: str = "cosine", **kwargs: object) -> HNSWVectorStore:
+    """构建测试索引."""
+    store = HNSWVectorStore(metric=metric, exact_threshold=0, seed=0, **kwargs)
+    assert await store.add(_documents(), _dataset().tolist())
+    return store
+
+
+def _recall(results: List[List[int]], expected: List[List[int]]) -> float:
+    """recall@k."""
+    return float(
+        np.mean([len(set(a) & set(b)) / TOP_K for a, b in zip(results, expected)])
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("metric", ["cosine", "l2"])
+async def test_recall(metric: str) -> None:
+    """测试近似检索召回率."""
+    store = await _build(metric, ef_construction=100)
+    vectors = _dataset()
+    queries = np.random.default_rng(1).normal(size=(50, DIM))
+
+    results, expected = [], []
+    for query in queries:
+        hits = await store.search(query.tolist(), limit=TOP_K)
+        results.append([int(hit.content) for hit in hits])
+        if metric == "cosine":
+            scores = vectors @ (query / np.linalg.norm(query))
+        else:
+            scores = -np.linalg.norm(vectors - query, axis=1)
+        expected.append(np.argsort(-scores)[:TOP_K].tolist())
+
+    assert _recall(results, expected) >= 0.9
+
+
+@pytest.mark.asyncio
+async def test_filter_and_delete() -> None:
+    """测试过滤与标记删除."""
+    store = await _build(ef_construction=64)
+    query = _dataset()[3].tolist()
+
+    hits = await store.search(query, limit=5, filter={"type": "odd"})
+    assert len(hits) == 5
+    assert all(int(hit.content) % 2 == 1 for hit in hits)
+    assert hits[0].content == "3"
+
+    assert await store.delete({"type": "odd"})
+    hits = await store.search(query, limit=5)
+    assert len(hits) == 5
+    assert all(int(hit.content) % 2 == 0 for hit in hits)
+
+
+@pytest.mark.asyncio
+async def test_persist_and_load(tmp_path: Path) -> None:
+    """测试图结构持久化后检索结果一致."""
+    path = str(tmp_path / "vectors")
+    store = await _build(ef_construction=64, path=path)
+    queries = np.random.default_rng(2).normal(size=(10, DIM)).tolist()
+    before = [await store.search(query, limit=TOP_K) for query in queries]
+    await store.close()
+
+    loaded = HNSWVectorStore(path=path, exact_threshold=0)
+    await loaded.connect()
+    assert isinstance(loaded._vectors, np.memmap)
+    after = [await loaded.search(query, limit=TOP_K) for query in queries]
+    assert [[hit.content for hit in hits] for hits in after] == [
+        [hit.content for hit in hits] for hits in before
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rebuild_after_deletes(tmp_path: Path) -> None:
+    """测试大量删除后持久化会压缩并重建图."""
+    store = await _build(ef_construction=32, path=str(tmp_path / "vectors"))
+    await store.delete({"type": "odd"})
+    await store.persist()
+
+    assert store._size == N_VECTORS // 2
+    hits = await store.search(_dataset()[4].tolist(), limit=1)
+    assert hits[0].content == "4"
+
+
+@pytest.mark.asyncio
+async def test_load_fallback_keeps_deletes(tmp_path: Path) -> None:
+    """测试图文件缺失时按向量重建, 已删除的文档不会恢复."""
+    path = str(tmp_path / "vectors")
+    store = HNSWVectorStore(path=path, exact_threshold=0, ef_construction=32, seed=0)
+    documents = [
+        Document(content=str(i), metadata={"type": "drop" if i % 10 == 0 else "keep"})
+        for i in range(N_VECTORS)
+    ]
+    await store.add(documents, _dataset().tolist())
+    await store.delete({"type": "drop"})
+    await store.persist()
+    # 删除未超过四分之一, 行未压缩
+    assert store._size == N_VECTORS
+
+    Path(path).with_suffix(".graph.npz").unlink()
+    loaded = HNSWVectorStore(path=path, exact_threshold=0)
+    await loaded.connect()
+
+    assert len(loaded) == N_VECTORS - N_VECTORS // 10
+    hits = await loaded.search(_dataset()[10].tolist(), limit=5)
+    assert all(int(hit.content) % 10 for hit in hits)
+
+
+@pytest.mark.asyncio
+async def test_add_does_not_block_event_loop() -> None:
+    """测试图插入在线程中执行, 期间事件循环保持响应."""
+    store = HNSWVectorStore(exact_threshold=0, ef_construction=32, seed=0)
+    gaps: List[float] = []
+    done = False
+
+    async def ticker() -> None:
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    task = asyncio.create_task(ticker())
+    begin = time.perf_counter()
+    assert await store.add(_documents()[:500], _dataset()[:500].tolist())
+    elapsed = time.perf_counter() - begin
+    done = True
+    await task
+
+    assert elapsed > 0.2
+    assert max(gaps) < 0.1
@@ -0,0 +1,391 @@
+"""批量入库流水线测试."""
+import asyncio
+from typing import Any, AsyncIterator, Dict, List
+
+import pytest
+
+from scriptai.core.openai import Priority, current_priority
+from scriptai.services.rag.base import (
+    Document,
+    EmbeddingModel,
+    IngestConfig,
+    LLMModel,
+    RAGService,
+)
+from scriptai.services.rag.processors.text import DefaultTextProcessor
+from scriptai.services.rag.stores.lexical import LexicalIndex
+from scriptai.services.rag.stores.memory import InMemoryVectorStore
+
+
+class _FakeEmbedding(EmbeddingModel):
+    """按文本长度生成向量, 记录每次批量调用及其优先级."""
+
+    def __init__(self) -> None:
+        self.calls: List[int] = []
+        self.priorities: List[Priority] = []
+
+    async def encode(self, texts: List[str]) -> List[List[float]]:
+        self.calls.append(len(texts))
+        self.priorities.append(current_priority())
+        return [[float(len(text)), 1.0] for text in texts]
+
+    async def encode_query(self, text: str) -> List[float]:
+        return [float(len(text)), 1.0]
+
+
+class _FakeLLM(LLMModel):
+    """不使用的LLM."""
+
+    async def generate(
+        self,
+        prompt: str,
+        context: List[str],
+        **kwargs: Dict[str, Any],
+    ) -> str:
+        return ""
+
+    async def rewrite_query(self, query: str) -> str:
+        return query
+
+
+class _RejectingStore(InMemoryVectorStore):
+    """拒绝写入指定类型的向量库, 并记录每次写入的分块数."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.writes: List[int] = []
+
+    async def add(
+        self,
+        documents: List[Document],
+        embeddings: List[List[float]],
+    ) -> bool:
+        self.writes.append(len(documents))
+        if documents[0].metadata.get("type") == "bad":
+            return False
+        return await super().add(documents, embeddings)
+
+
+def _text(seed: int) -> str:
+    """生成可分为多个分块的文本."""
+    return "".join(f"第{seed}号文档第{i}句描述人物在故事中的成长与转变，以及冲突如何推动情节发展。" for i in range(30))
+
+
+def _service(store: InMemoryVectorStore, **config: Any) -> RAGService:
+    """构建测试服务."""
+    return RAGService(
+        vector_store=store,
+        text_processor=DefaultTextProcessor(),
+        embedding_model=_FakeEmbedding(),
+        llm_model=_FakeLLM(),
+        ingest_config=IngestConfig(**config),
+    )
+
+
+@pytest.mark.asyncio
+async def test_add_documents_batches_across_documents() -> None:
+    """测试嵌入跨文档合并, 写入合并为大批量."""
+    store = _RejectingStore()
+    service = _service(store, embed_batch_size=64, insert_batch_size=1000)
+    documents = [
+        Document(content=_text(i), metadata={"type": "theory"}) for i in range(10)
+    ]
+
+    results = await service.add_documents(documents)
+
+    assert all(result.success for result in results)
+    assert all(result.chunks > 1 for result in results)
+    total = sum(result.chunks for result in results)
+    assert len(store) == total
+    assert len(service.embedding_model.calls) < len(documents)
+    assert store.writes == [total]
+    assert {chunk for result in results for chunk in result.chunk_ids} == {
+        metadata["chunk_id"] for metadata in store._metadata
+    }
+
+
+@pytest.mark.asyncio
+async def test_add_documents_reports_per_document_failures() -> None:
+    """测试单个文档失败不影响其他文档."""
+    store = _RejectingStore()
+    service = _service(store)
+    documents = [
+        Document(content=_text(0), metadata={"type": "theory"}),
+        Document(content=_text(1), metadata={"type": "bad"}),
+        Document(content="", metadata={}),
+        Document(content=_text(2), metadata={"type": "example"}),
+    ]
+
+    results = await service.add_documents(documents)
+
+    assert [result.success for result in results] == [True, False, True, True]
+    assert results[1].error == "写入向量库失败"
+    assert results[2].chunks == 0
+    # 不同分区分别写入
+    assert sorted(store.writes) == sorted(
+        [results[0].chunks, len(results[1].chunk_ids), results[3].chunks]
+    )
+
+
+@pytest.mark.asyncio
+async def test_add_documents_in_process_pool() -> None:
+    """测试清理分块在进程池中执行, 结果与当前进程中执行一致."""
+    documents = [Document(content=_text(i), metadata={}) for i in range(4)]
+    local = InMemoryVectorStore()
+    await _service(local).add_documents(documents)
+
+    store = InMemoryVectorStore()
+    service = _service(store, workers=2)
+    try:
+        assert service._get_ingest_pool() is not None
+        results = await service.add_documents(documents)
+    finally:
+        service.shutdown_ingest_pool()
+
+    assert all(result.success for result in results)
+    assert len(store) == sum(result.chunks for result in results)
+    assert sorted(store._contents) == sorted(local._contents)
+
+
+class _FailOnceEmbedding(_FakeEmbedding):
+    """第一次批量编码失败, 之后放行等待中的文档."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.failed = asyncio.Event()
+
+    async def encode(self, texts: List[str]) -> List[List[float]]:
+        if not self.failed.is_set():
+            self.failed.set()
+            raise RuntimeError("编码失败")
+        return await super().encode(texts)
+
+
+class _GatedProcessor(DefaultTextProcessor):
+    """带等待标记的文本在第一次编码失败后才处理, 标记本身被去掉."""
+
+    MARK = "<wait>"
+
+    def __init__(self, gate: asyncio.Event) -> None:
+        super().__init__()
+        self.gate = gate
+
+    async def clean(self, text: str) -> str:
+        if text.startswith(self.MARK):
+            await self.gate.wait()
+            text = text[len(self.MARK) :]
+        return await super().clean(text)
+
+
+@pytest.mark.asyncio
+async def test_failed_embed_releases_claims() -> None:
+    """测试生成向量失败的分块释放认领, 之后的相同分块仍能写入."""
+    store = InMemoryVectorStore()
+    embedding = _FailOnceEmbedding()
+    service = RAGService(
+        vector_store=store,
+        text_processor=_GatedProcessor(embedding.failed),
+        embedding_model=embedding,
+        llm_model=_FakeLLM(),
+        ingest_config=IngestConfig(),
+    )
+
+    first, second = await service.add_documents(
+        [
+            Document(content=_text(0), metadata={}),
+            Document(content=_GatedProcessor.MARK + _text(0), metadata={}),
+        ]
+    )
+
+    assert not first.success
+    assert first.failed > 0
+    assert second.success
+    assert second.skipped == 0
+    assert second.chunks == len(store) == first.failed
+
+
+@pytest.mark.asyncio
+async def test_add_document() -> None:
+    """测试单文档接口沿用流水线."""
+    store = InMemoryVectorStore()
+    service = _service(store)
+    assert await service.add_document(_text(0), metadata={"type": "theory"})
+    results = await store.search([100.0, 1.0], filter={"type": "theory"})
+    assert results
+
+
+@pytest.mark.asyncio
+async def test_add_documents_skips_existing_chunks() -> None:
+    """测试重复入库时跳过已存在的分块, 不再生成向量."""
+    store = InMemoryVectorStore()
+    service = _service(store)
+    documents = [Document(content=_text(i), metadata={}) for i in range(3)]
+
+    first = await service.add_documents(documents)
+    size = len(store)
+    calls = len(service.embedding_model.calls)
+    second = await service.add_documents(documents)
+
+    assert all(result.success for result in second)
+    assert [result.skipped for result in second] == [result.chunks for result in first]
+    assert sum(result.chunks for result in second) == 0
+    assert [result.chunk_ids for result in second] == [
+        result.chunk_ids for result in first
+    ]
+    assert len(store) == size
+    assert len(service.embedding_model.calls) == calls
+
+
+@pytest.mark.asyncio
+async def test_add_documents_dedupes_within_batch() -> None:
+    """测试同一批次中不同文档的相同分块只写入一次."""
+    store = InMemoryVectorStore()
+    service = _service(store)
+
+    results = await service.add_documents(
+        [Document(content=_text(0), metadata={}) for _ in range(2)]
+    )
+
+    assert all(result.success for result in results)
+    assert results[0].chunks + results[1].chunks == len(results[0].chunk_ids)
+    assert results[0].skipped + results[1].skipped == len(results[0].chunk_ids)
+    assert len(store) == len(results[0].chunk_ids)
+
+
+@pytest.mark.asyncio
+async def test_delete_chunks() -> None:
+    """测试按分块ID删除后可重新入库."""
+    store = InMemoryVectorStore()
+    service = _service(store)
+    documents = [Document(content=_text(i), metadata={}) for i in range(2)]
+    first = await service.add_documents(documents)
+
+    assert await service.delete_chunks(first[0].chunk_ids)
+    assert len(store) == first[1].chunks
+    assert await store.existing_ids(first[0].chunk_ids) == set()
+
+    again = await service.add_documents(documents[:1])
+    assert again[0].chunks == first[0].chunks
+    assert again[0].skipped == 0
+
+
+@pytest.mark.asyncio
+async def test_delete_documents_updates_lexical_index() -> None:
+    """测试按过滤条件删除时同步清理词法索引."""
+    store = InMemoryVectorStore()
+    service = _service(store)
+    service.lexical_index = LexicalIndex()
+    await service.add_documents(
+        [
+            Document(content=_text(0), metadata={"source": "a.md"}),
+            Document(content=_text(1), metadata={"source": "b.md"}),
+        ]
+    )
+
+    assert await service.delete_documents({"source": "a.md"})
+    remaining = service.lexical_index.match(None)
+    assert remaining == service.lexical_index.match({"source": "b.md"})
+    assert len(remaining) == len(store)
+
+
+@pytest.mark.asyncio
+async def test_same_text_in_different_sources() -> None:
+    """测试不同文件中的相同文本各自入库, 删除一个文件不影响另一个."""
+    store = InMemoryVectorStore()
+    service = _service(store)
+    text = _text(0)
+    first, second = await service.add_documents(
+        [
+            Document(content=text, metadata={"filename": "a.md"}),
+            Document(content=text, metadata={"filename": "b.md"}),
+        ]
+    )
+
+    assert first.chunks == second.chunks > 0
+    assert not set(first.chunk_ids) & set(second.chunk_ids)
+    assert len(store) == first.chunks + second.chunks
+
+    assert await service.delete_documents({"filename": "a.md"})
+    assert len(store) == second.chunks
+    assert await store.existing_ids(second.chunk_ids) == set(second.chunk_ids)
+
+
+async def _pieces(text: str, size: int) -> AsyncIterator[str]:
+    """按固定长度分片产出文本."""
+    for start in range(0, len(text), size):
+        yield text[start : start + size]
+
+
+@pytest.mark.asyncio
+async def test_add_document_stream_rolling_batches() -> None:
+    """测试流式入库按批生成向量和写入, 结果与整篇入库一致."""
+    store = _RejectingStore()
+    service = _service(
+        store,
+        embed_batch_size=16,
+        insert_batch_size=32,
+        stream_segment_size=2048,
+    )
+    text = "\n\n".join(_text(i) for i in range(20))
+
+    result = await service.add_document_stream(
+        _pieces(text, 1000), metadata={"type": "theory"}
+    )
+
+    assert result.success
+    assert result.chunks == len(store) == len(result.chunk_ids)
+    assert len(service.embedding_model.calls) > 1
+    assert max(service.embedding_model.calls) <= 16
+    assert len(store.writes) > 1
+    assert max(store.writes) < 32 + 16
+    assert set(result.chunk_ids) == {
+        metadata["chunk_id"] for metadata in store._metadata
+    }
+    assert {metadata["type"] for metadata in store._metadata} == {"theory"}
+
+
+@pytest.mark.asyncio
+async def test_add_document_stream_skips_existing_chunks() -> None:
+    """测试流式重复入库时跳过已存在的分块."""
+    store = InMemoryVectorStore()
+    service = _service(store, embed_batch_size=16, stream_segment_size=2048)
+    text = "\n\n".join(_text(i) for i in range(5))
+
+    first = await service.add_document_stream(_pieces(text, 1000))
+    second = await service.add_document_stream(_pieces(text, 700))
+
+    assert second.success
+    assert second.chunks == 0
+    assert second.skipped == first.chunks
+    assert second.chunk_ids == first.chunk_ids
+
+
+@pytest.mark.asyncio
+async def test_add_document_stream_reports_processing_error() -> None:
+    """测试读取失败时返回错误, 已写入的分块ID保留在结果中."""
+    store = InMemoryVectorStore()
+    service = _service(store, embed_batch_size=4, stream_segment_size=1024)
+
+    async def broken() -> AsyncIterator[str]:
+        yield "\n\n".join(_text(i) for i in range(4))
+        raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+
+    result = await service.add_document_stream(broken())
+
+    assert not result.success
+    assert result.error.startswith("文本处理失败")
+    assert len(store) == result.chunks
+
+
+@pytest.mark.asyncio
+async def test_ingest_tags_llm_priority() -> None:
+    """测试入库的嵌入请求带上调用方指定的优先级, 结束后恢复."""
+    service = _service(InMemoryVectorStore(), embed_batch_size=8)
+
+    await service.add_documents([Document(content=_text(0), metadata={})])
+    assert set(service.embedding_model.priorities) == {Priority.BACKGROUND}
+
+    service.embedding_model.priorities.clear()
+    await service.add_document_stream(_pieces(_text(1), 500), priority=Priority.BATCH)
+    assert set(service.embedding_model.priorities) == {Priority.BATCH}
+    assert current_priority() == Priority.INTERACTIVE
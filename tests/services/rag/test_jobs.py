@@ -0,0 +1,351 @@
+"""后台入库任务测试."""
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import pytest
+
+from scriptai.services.rag import jobs
+from scriptai.services.rag.base import (
+    EmbeddingModel,
+    IngestConfig,
+    LLMModel,
+    RAGService,
+)
+from scriptai.services.rag.jobs import FAILED, SUCCEEDED, IngestJobQueue
+from scriptai.services.rag.processors.text import DefaultTextProcessor
+from scriptai.services.rag.stores.memory import InMemoryVectorStore
+
+
+class _FakeRedis:
+    """模拟任务队列用到的Redis命令(单个流、单个消费组)."""
+
+    def __init__(self) -> None:
+        self.values: Dict[str, str] = {}
+        self.lists: Dict[str, List[bytes]] = {}
+        self.entries: List[tuple] = []
+        self.delivered = 0
+        # 消息ID -> (消费者, 最近投递时间)
+        self.pending: Dict[str, tuple] = {}
+        self.events: List[Dict[str, Any]] = []
+        self.subscriptions = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        return self.values.get(key)
+
+    async def set(self, key: str, value: str, ex: Optional[int] = None) -> bool:
+        self.values[key] = value
+        return True
+
+    async def rpush(self, key: str, value: bytes) -> int:
+        self.lists.setdefault(key, []).append(value)
+        return len(self.lists[key])
+
+    async def lrange(self, key: str, start: int, end: int) -> List[bytes]:
+        return self.lists.get(key, [])[start : end + 1]
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        return key in self.lists
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self.lists.pop(key, None) is not None for key in keys)
+
+    async def xadd(self, stream: str, fields: Dict[str, str]) -> str:
+        message_id = f"{len(self.entries) + 1}-0"
+        self.entries.append((message_id, fields))
+        return message_id
+
+    async def xgroup_create(self, *args: Any, **kwargs: Any) -> bool:
+        return True
+
+    async def xreadgroup(
+        self,
+        group: str,
+        consumer: str,
+        streams: Dict[str, str],
+        count: int,
+        block: int,
+    ) -> list:
+        if self.delivered == len(self.entries):
+            await asyncio.sleep(0.01)
+            return []
+        message_id, fields = self.entries[self.delivered]
+        self.delivered += 1
+        self.pending[message_id] = (consumer, time.monotonic())
+        return [["stream", [(message_id, fields)]]]
+
+    async def xautoclaim(
+        self,
+        stream: str,
+        group: str,
+        consumer: str,
+        min_idle_time: int,
+        start_id: str,
+        count: int,
+    ) -> list:
+        now = time.monotonic()
+        for message_id, (_, delivered_at) in self.pending.items():
+            if (now - delivered_at) * 1000 >= min_idle_time:
+                self.pending[message_id] = (consumer, now)
+                fields = dict(self.entries)[message_id]
+                return ["0-0", [(message_id, fields)], []]
+        return ["0-0", [], []]
+
+    async def xclaim(
+        self,
+        stream: str,
+        group: str,
+        consumer: str,
+        min_idle_time: int,
+        message_ids: List[str],
+        justid: bool,
+    ) -> List[str]:
+        for message_id in message_ids:
+            self.pending[message_id] = (consumer, time.monotonic())
+        return message_ids
+
+    async def xack(self, stream: str, group: str, *ids: str) -> int:
+        return sum(self.pending.pop(message_id, None) is not None for message_id in ids)
+
+    async def publish(self, channel: str, data: str) -> int:
+        self.events.append(json.loads(data))
+        return 0
+
+    def pubsub(self) -> "_FakePubSub":
+        self.subscriptions += 1
+        return _FakePubSub(self.events, fail=self.subscriptions == 1)
+
+
+class _FakePubSub:
+    """重放已发布的事件; 第一次订阅在投递前断开."""
+
+    def __init__(self, events: List[Dict[str, Any]], fail: bool) -> None:
+        self.events = events
+        self.fail = fail
+        self.closed = False
+
+    async def subscribe(self, channel: str) -> None:
+        return None
+
+    async def listen(self) -> AsyncIterator[Dict[str, Any]]:
+        if self.fail:
+            raise ConnectionError("connection lost")
+        yield {"type": "subscribe", "data": 1}
+        for event in self.events:
+            yield {"type": "message", "data": json.dumps(event)}
+        await asyncio.Event().wait()
+
+    async def unsubscribe(self, channel: str) -> None:
+        return None
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+class _FakeEmbedding(EmbeddingModel):
+    """按文本长度生成向量, 记录每次批量调用."""
+
+    def __init__(self) -> None:
+        self.calls: List[int] = []
+
+    async def encode(self, texts: List[str]) -> List[List[float]]:
+        self.calls.append(len(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    async def encode_query(self, text: str) -> List[float]:
+        return [float(len(text)), 1.0]
+
+
+class _FakeLLM(LLMModel):
+    """不使用的LLM."""
+
+    async def generate(
+        self,
+        prompt: str,
+        context: List[str],
+        **kwargs: Dict[str, Any],
+    ) -> str:
+        return ""
+
+    async def rewrite_query(self, query: str) -> str:
+        return query
+
+
+def _text() -> bytes:
+    """生成可分为多批分块的上传内容."""
+    return "\n\n".join(
+        f"第{i}段描述人物在故事中的成长与转变，以及冲突如何推动情节发展。" * 8 for i in range(40)
+    ).encode("utf-8")
+
+
+async def _upload(data: bytes) -> AsyncIterator[bytes]:
+    """按固定大小分片产出上传内容."""
+    for start in range(0, len(data), 1000):
+        yield data[start : start + 1000]
+
+
+def _queue(store: InMemoryVectorStore, **kwargs: Any) -> IngestJobQueue:
+    """构建测试任务队列, 暂存内容与任务记录共用同一个假Redis."""
+    service = RAGService(
+        vector_store=store,
+        text_processor=DefaultTextProcessor(),
+        embedding_model=_FakeEmbedding(),
+        llm_model=_FakeLLM(),
+        ingest_config=IngestConfig(
+            embed_batch_size=8, insert_batch_size=8, stream_segment_size=4096
+        ),
+    )
+    client = kwargs.pop("client", None) or _FakeRedis()
+    return IngestJobQueue(
+        service,
+        client=client,
+        binary_client=client,
+        progress_interval=0,
+        block_ms=10,
+        **kwargs,
+    )
+
+
+async def _wait(queue: IngestJobQueue, job_id: str) -> Any:
+    """等待任务结束."""
+    for _ in range(500):
+        job = await queue.get(job_id)
+        if job.status in (SUCCEEDED, FAILED):
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError("任务未结束")
+
+
+@pytest.mark.asyncio
+async def test_submit_and_process(monkeypatch: pytest.MonkeyPatch) -> None:
+    """测试提交后立即返回, 后台入库并推送进度."""
+    monkeypatch.setattr(jobs.settings, "RAG_UPLOAD_READ_SIZE", 4096)
+    store = InMemoryVectorStore()
+    queue = _queue(store)
+    data = _text()
+
+    job = await queue.submit(_upload(data), user_id=7, metadata={"type": "theory"})
+    assert job.status == "queued"
+    assert job.size == len(data)
+    segments = queue.client.lists[queue._data_key(job.id)]
+    assert len(segments) > 1
+    assert b"".join(segments) == data
+
+    worker = asyncio.create_task(queue._consume("worker-0"))
+    try:
+        job = await _wait(queue, job.id)
+    finally:
+        worker.cancel()
+
+    assert job.status == SUCCEEDED
+    assert job.chunks == len(store) > 8
+    assert job.processed_bytes == len(data)
+    assert queue.client.lists == {}
+    assert queue.client.pending == {}
+
+    events = queue.client.events
+    assert [event["status"] for event in events][:2] == ["queued", "running"]
+    running = [event for event in events if event["status"] == "running"]
+    assert len(running) > 2
+    assert all(event["user_id"] == "7" for event in events)
+    assert events[-1]["status"] == SUCCEEDED
+    assert events[-1]["progress"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_resume_after_worker_restart() -> None:
+    """测试失联消费者的任务被其他主机认领, 已提交的分块不再生成向量."""
+    store = InMemoryVectorStore()
+    queue = _queue(store, claim_idle_ms=0)
+    data = _text()
+    job = await queue.submit(_upload(data), user_id=1, metadata={})
+
+    # 上一个工作协程读取了任务, 写入前半部分后退出, 未确认消息
+    await queue.client.xreadgroup("ingest", "dead", {"jobs": ">"}, count=1, block=0)
+    half = data[: data.index("第20段".encode("utf-8"))]
+    first = await queue.service.add_document_stream(_decode([half]))
+
+    # 另一台主机上的队列只共享Redis和向量库
+    other = _queue(store, client=queue.client, claim_idle_ms=0)
+    worker = asyncio.create_task(other._consume("worker-1"))
+    try:
+        job = await _wait(other, job.id)
+    finally:
+        worker.cancel()
+
+    assert job.status == SUCCEEDED
+    assert job.skipped >= first.chunks - 1
+    assert len(store) == first.chunks + job.chunks
+    assert sum(other.service.embedding_model.calls) == job.chunks
+    assert queue.client.pending == {}
+    assert queue.client.lists == {}
+
+
+@pytest.mark.asyncio
+async def test_fail_after_max_attempts() -> None:
+    """测试超过最大尝试次数的任务标记为失败."""
+    queue = _queue(InMemoryVectorStore(), max_attempts=1)
+    job = await queue.submit(_upload(b"abc"), user_id=1)
+    job.attempts = 1
+    await queue._save(job)
+
+    worker = asyncio.create_task(queue._consume("worker-0"))
+    try:
+        job = await _wait(queue, job.id)
+    finally:
+        worker.cancel()
+
+    assert job.status == FAILED
+    assert "最大尝试次数" in job.error
+    assert queue.client.lists == {}
+
+
+@pytest.mark.asyncio
+async def test_deliver_to_uploader(monkeypatch: pytest.MonkeyPatch) -> None:
+    """测试进度事件推送给上传者."""
+    sent = []
+
+    async def fake_send(message: dict, user_id: str) -> None:
+        sent.append((user_id, message["job_id"]))
+
+    monkeypatch.setattr(jobs.ws_manager, "send_personal_message", fake_send)
+    queue = IngestJobQueue(None, client=_FakeRedis())
+
+    await queue._deliver(json.dumps({"job_id": "j1", "user_id": "7"}))
+    await queue._deliver("not json")
+
+    assert sent == [("7", "j1")]
+
+
+@pytest.mark.asyncio
+async def test_forward_events_resubscribes(monkeypatch: pytest.MonkeyPatch) -> None:
+    """测试订阅断开后重新订阅并继续推送."""
+    sent = []
+
+    async def fake_send(message: dict, user_id: str) -> None:
+        sent.append((user_id, message["job_id"]))
+
+    monkeypatch.setattr(jobs.ws_manager, "send_personal_message", fake_send)
+    client = _FakeRedis()
+    client.events.append({"job_id": "j1", "user_id": "7"})
+    queue = IngestJobQueue(None, client=client, retry_delay=0)
+
+    forwarder = asyncio.create_task(queue.forward_events())
+    try:
+        for _ in range(100):
+            if sent:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        forwarder.cancel()
+        await asyncio.gather(forwarder, return_exceptions=True)
+
+    assert client.subscriptions == 2
+    assert sent == [("7", "j1")]
+
+
+async def _decode(pieces: List[bytes]) -> AsyncIterator[str]:
+    """把字节分片解码为文本."""
+    for piece in pieces:
+        yield piece.decode("utf-8")
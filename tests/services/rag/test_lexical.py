@@ -0,0 +1,80 @@
+"""BM25词法索引测试."""
+from pathlib import Path
+
+import pytest
+
+from scriptai.services.rag.base import Document
+from scriptai.services.rag.stores.lexical import LexicalIndex, tokenize
+
+
+def _docs(*contents: str, type: str = "theory") -> list:
+    return [Document(content=content, metadata={"type": type}) for content in contents]
+
+
+def test_tokenize_mixed_text() -> None:
+    """测试中文二元组与英文缩写切分."""
+    assert tokenize("林晓说") == ["林晓", "晓说"]
+    assert tokenize("INT. 办公室 O.S.") == ["int.", "办公", "公室", "o.s."]
+
+
+def test_exact_term_ranking() -> None:
+    """测试精确词命中排在前面."""
+    index = LexicalIndex()
+    index.add(
+        ["a", "b", "c"],
+        _docs("林晓坐在办公室里发呆", "陈远在街头作画", "王琳敲门进入办公室"),
+    )
+    results = index.search("陈远", limit=2)
+    assert results[0][0] == "b"
+
+
+def test_filter_and_delete() -> None:
+    """测试过滤与删除."""
+    index = LexicalIndex()
+    index.add(["a"], _docs("三幕结构的高潮", type="theory"))
+    index.add(["b"], _docs("三幕结构示例", type="example"))
+
+    results = index.search("三幕", filter={"type": "example"})
+    assert [doc_id for doc_id, _ in results] == ["b"]
+    assert index.delete(["b", "missing"]) == 1
+    assert [doc_id for doc_id, _ in index.search("三幕")] == ["a"]
+
+
+@pytest.mark.asyncio
+async def test_persist_and_reload(tmp_path: Path) -> None:
+    """测试追加日志持久化与恢复."""
+    path = tmp_path / "lexical.jsonl"
+    index = LexicalIndex(str(path))
+    index.add(["a", "b"], _docs("画外音O.S.的用法", "场景标题INT.的格式"))
+    await index.persist()
+    index.delete(["a"])
+    await index.persist()
+
+    restored = LexicalIndex(str(path))
+    restored.load()
+    assert len(restored) == 1
+    assert "b" in restored
+    assert restored.search("int.")[0][0] == "b"
+
+    await restored.persist(compact=True)
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 1
+
+
+@pytest.mark.asyncio
+async def test_compact_keeps_other_writers(tmp_path: Path) -> None:
+    """测试两个进程共用日志时, 压缩保留对方追加的记录."""
+    path = tmp_path / "lexical.jsonl"
+    api = LexicalIndex(str(path))
+    script = LexicalIndex(str(path))
+    api.add(["a"], _docs("林晓坐在办公室里发呆"))
+    await api.persist()
+    script.add(["b", "c"], _docs("陈远在街头作画", "王琳敲门进入办公室"))
+    script.delete(["c"])
+    await script.persist()
+
+    await api.persist(compact=True)
+
+    restored = LexicalIndex(str(path))
+    restored.load()
+    assert sorted(restored.match(None)) == ["a", "b"]
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 2
@@ -0,0 +1,148 @@
+"""进程内向量存储测试."""
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pytest
+
+from scriptai.services.rag.base import Document
+from scriptai.services.rag.stores.memory import InMemoryVectorStore
+
+
+def _documents() -> List[Document]:
+    """测试文档."""
+    return [
+        Document(content="三幕结构", metadata={"type": "structure", "source": "a"}),
+        Document(content="人物弧光", metadata={"type": "character", "source": "a"}),
+        Document(content="对白技巧", metadata={"type": "dialogue", "source": "b"}),
+        Document(content="场景格式", metadata={"type": "structure", "source": "b"}),
+    ]
+
+
+EMBEDDINGS = [
+    [1.0, 0.0, 0.0],
+    [0.0, 1.0, 0.0],
+    [0.0, 0.0, 1.0],
+    [0.8, 0.6, 0.0],
+]
+
+
+@pytest.mark.asyncio
+async def test_search_cosine() -> None:
+    """测试余弦相似度检索."""
+    store = InMemoryVectorStore(initial_capacity=2)
+    assert await store.add(_documents(), EMBEDDINGS)
+
+    results = await store.search([2.0, 0.0, 0.0], limit=2)
+    assert [result.content for result in results] == ["三幕结构", "场景格式"]
+    assert results[0].score == pytest.approx(1.0)
+    assert results[1].score == pytest.approx(0.8)
+
+
+@pytest.mark.asyncio
+async def test_search_l2() -> None:
+    """测试欧氏距离检索."""
+    store = InMemoryVectorStore(metric="l2")
+    await store.add(_documents(), EMBEDDINGS)
+
+    results = await store.search([0.0, 0.9, 0.0], limit=1)
+    assert results[0].content == "人物弧光"
+    assert results[0].score == pytest.approx(1.0 - 0.01)
+
+
+@pytest.mark.asyncio
+async def test_search_filter() -> None:
+    """测试元数据过滤(预建掩码与逐行比较)."""
+    store = InMemoryVectorStore(indexed_fields=("type",))
+    await store.add(_documents(), EMBEDDINGS)
+
+    results = await store.search([0.0, 1.0, 0.0], filter={"type": "structure"})
+    assert [result.content for result in results] == ["场景格式", "三幕结构"]
+
+    results = await store.search(
+        [0.0, 1.0, 0.0],
+        filter={"type": ["dialogue", "character"], "source": "b"},
+    )
+    assert [result.content for result in results] == ["对白技巧"]
+
+    assert await store.search([0.0, 1.0, 0.0], filter={"type": "unknown"}) == []
+
+
+@pytest.mark.asyncio
+async def test_delete() -> None:
+    """测试按条件删除."""
+    store = InMemoryVectorStore()
+    await store.add(_documents(), EMBEDDINGS)
+
+    assert await store.delete({"source": "a"})
+    assert not await store.delete({"source": "a"})
+    assert len(store) == 2
+    results = await store.search([1.0, 0.0, 0.0], limit=4)
+    assert [result.content for result in results] == ["场景格式", "对白技巧"]
+
+
+@pytest.mark.asyncio
+async def test_dimension_mismatch() -> None:
+    """测试维度不一致时拒绝写入."""
+    store = InMemoryVectorStore()
+    await store.add(_documents()[:1], EMBEDDINGS[:1])
+    assert not await store.add(_documents()[:1], [[1.0, 0.0]])
+
+
+@pytest.mark.asyncio
+async def test_persist_and_mmap_load(tmp_path: Path) -> None:
+    """测试持久化后以内存映射加载, 并可继续写入."""
+    path = str(tmp_path / "vectors")
+    store = InMemoryVectorStore(path=path)
+    await store.add(_documents(), EMBEDDINGS)
+    await store.delete({"type": "dialogue"})
+    await store.close()
+
+    loaded = InMemoryVectorStore(path=path)
+    await loaded.connect()
+    assert len(loaded) == 3
+    assert isinstance(loaded._vectors, np.memmap)
+
+    results = await loaded.search([0.0, 0.0, 1.0], limit=3)
+    assert "对白技巧" not in [result.content for result in results]
+    results = await loaded.search([1.0, 0.0, 0.0], filter={"type": "structure"})
+    assert [result.content for result in results] == ["三幕结构", "场景格式"]
+
+    await loaded.add(
+        [Document(content="伏笔", metadata={"type": "plot"})],
+        [[0.0, 0.0, 1.0]],
+    )
+    assert not isinstance(loaded._vectors, np.memmap)
+    results = await loaded.search([0.0, 0.0, 1.0], limit=1)
+    assert results[0].content == "伏笔"
+
+
+@pytest.mark.asyncio
+async def test_autosave_and_retry(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """测试变更达到阈值时自动落盘, 落盘失败后下次继续重试."""
+    path = str(tmp_path / "vectors")
+    store = InMemoryVectorStore(path=path, persist_rows=4, persist_interval=3600)
+    await store.add(_documents()[:2], EMBEDDINGS[:2])
+    assert not Path(path).with_suffix(".npy").exists()
+
+    save = store._save
+
+    def fail(*args: object) -> None:
+        raise OSError("disk full")
+
+    monkeypatch.setattr(store, "_save", fail)
+    await store.add(_documents()[2:], EMBEDDINGS[2:])
+    assert store._dirty
+    assert store._changes == 4
+
+    monkeypatch.setattr(store, "_save", save)
+    await store.delete({"type": "dialogue"})
+    assert not store._dirty
+
+    # 未关闭即可从磁盘恢复
+    loaded = InMemoryVectorStore(path=path)
+    await loaded.connect()
+    assert len(loaded) == 3
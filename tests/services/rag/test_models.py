@@ -0,0 +1,166 @@
+"""RAG模型层测试."""
+import asyncio
+import threading
+from typing import List
+
+import numpy as np
+import pytest
+
+from scriptai.core.openai import (
+    Priority,
+    current_priority,
+    current_user_id,
+    llm_priority,
+    llm_user,
+)
+from scriptai.core.tokens import token_counter
+from scriptai.services.rag.models.batching import EmbeddingBatcher
+from scriptai.services.rag.models.local import LocalEmbedding
+from scriptai.services.rag.models.openai import OpenAILLM
+
+
+class _Recorder:
+    """记录批量编码调用."""
+
+    def __init__(self, fail: bool = False) -> None:
+        self.calls: List[List[str]] = []
+        self.fail = fail
+
+    async def __call__(self, texts: List[str]) -> List[List[float]]:
+        self.calls.append(texts)
+        if self.fail:
+            raise RuntimeError("编码失败")
+        return [[float(len(text))] for text in texts]
+
+
+@pytest.mark.asyncio
+async def test_batcher_coalesces_concurrent_queries() -> None:
+    """测试并发查询被合并为一次请求."""
+    recorder = _Recorder()
+    batcher = EmbeddingBatcher(recorder, window_ms=20, max_batch_size=16)
+
+    results = await asyncio.gather(
+        batcher.submit("a"),
+        batcher.submit("bb"),
+        batcher.submit("a"),
+    )
+
+    assert results == [[1.0], [2.0], [1.0]]
+    assert recorder.calls == [["a", "bb"]]
+
+
+@pytest.mark.asyncio
+async def test_batcher_flushes_at_size_cap() -> None:
+    """测试达到批大小上限时立即发送."""
+    recorder = _Recorder()
+    batcher = EmbeddingBatcher(recorder, window_ms=10_000, max_batch_size=2)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(*(batcher.submit(text) for text in ["a", "bb", "ccc", "dddd"])),
+        timeout=1,
+    )
+
+    assert results == [[1.0], [2.0], [3.0], [4.0]]
+    assert recorder.calls == [["a", "bb"], ["ccc", "dddd"]]
+
+
+@pytest.mark.asyncio
+async def test_batcher_propagates_errors() -> None:
+    """测试批量失败时每个调用方都收到异常."""
+    batcher = EmbeddingBatcher(_Recorder(fail=True), window_ms=1, max_batch_size=8)
+
+    results = await asyncio.gather(
+        batcher.submit("a"),
+        batcher.submit("b"),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_batcher_uses_highest_pending_priority() -> None:
+    """测试交互查询加入后台调用方发起的批次时, 批次按交互优先级发送."""
+    priorities: List[Priority] = []
+
+    async def encode(texts: List[str]) -> List[List[float]]:
+        priorities.append(current_priority())
+        return [[float(len(text))] for text in texts]
+
+    batcher = EmbeddingBatcher(encode, window_ms=20, max_batch_size=16)
+
+    async def submit(text: str, priority: Priority) -> List[float]:
+        with llm_priority(priority):
+            return await batcher.submit(text)
+
+    background = asyncio.create_task(submit("a", Priority.BATCH))
+    await asyncio.sleep(0)
+    await asyncio.gather(background, submit("bb", Priority.INTERACTIVE))
+
+    assert priorities == [Priority.INTERACTIVE]
+
+
+@pytest.mark.asyncio
+async def test_batcher_does_not_charge_first_user() -> None:
+    """测试两个用户的查询合并为一批时, 批量请求不以发起者的名义发送."""
+    users: List[object] = []
+
+    async def encode(texts: List[str]) -> List[List[float]]:
+        users.append(current_user_id())
+        return [[float(len(text))] for text in texts]
+
+    batcher = EmbeddingBatcher(encode, window_ms=20, max_batch_size=16)
+
+    async def submit(text: str, user_id: str) -> List[float]:
+        with llm_user(user_id):
+            return await batcher.submit(text)
+
+    results = await asyncio.gather(submit("a", "alice"), submit("bb", "bob"))
+
+    assert results == [[1.0], [2.0]]
+    assert users == [None]
+
+
+class _FakeSentenceModel:
+    """记录调用线程和批次的假模型."""
+
+    def __init__(self) -> None:
+        self.calls: List[List[str]] = []
+        self.threads: List[str] = []
+
+    def encode(self, texts: List[str], **kwargs: object) -> np.ndarray:
+        self.calls.append(list(texts))
+        self.threads.append(threading.current_thread().name)
+        return np.array([[float(len(text)), 1.0] for text in texts])
+
+
+@pytest.mark.asyncio
+async def test_local_embedding_runs_off_loop() -> None:
+    """测试本地推理在专用线程中执行, 并发查询合并为一次前向计算."""
+    embedding = LocalEmbedding(model_name="fake", window_ms=20, max_batch_size=16)
+    fake = _FakeSentenceModel()
+    embedding._model = fake
+
+    try:
+        results = await asyncio.gather(
+            embedding.encode_query("a"),
+            embedding.encode_query("bb"),
+        )
+        assert results == [[1.0, 1.0], [2.0, 1.0]]
+        assert await embedding.encode([]) == []
+        assert fake.calls == [["a", "bb"]]
+        assert fake.threads[0].startswith("local-embedding")
+    finally:
+        embedding.close()
+
+
+def test_openai_llm_packs_context_within_budget() -> None:
+    """测试系统提示词只装入token预算内的参考资料."""
+    llm = OpenAILLM(context_token_budget=200)
+    context = [f"资料{i}：" + "人物弧光" * 30 for i in range(5)]
+
+    prompt = llm._build_system_prompt(context)
+
+    assert "资料0" in prompt
+    assert "资料4" not in prompt
+    assert token_counter.count("\n\n".join(c for c in context if c in prompt)) <= 200
@@ -0,0 +1,181 @@
+"""剧本文本处理器测试."""
+from typing import Any, AsyncIterator
+
+import pytest
+
+from scriptai.services.rag.base import _prepare_document
+from scriptai.services.rag.processors.screenplay import ScreenplayTextProcessor
+from scriptai.services.rag.processors.text import TextProcessingConfig
+
+SCRIPT = """# 《城市之光》
+
+## 第一幕：都市迷茫
+
+### 场景1：广告公司办公室 - 日 - 内景
+林晓坐在宽敞明亮的办公室里，盯着电脑屏幕发呆。墙上挂满获奖证书。
+
+王琳：（敲门进入）
+林总监，新项目的提案准备好了。
+
+林晓：（回过神来）
+好的，马上看。
+（翻看文件，若有所思）
+这个创意还不够打动人。
+
+### 场景2：街头艺术区 - 日 - 外景
+陈远在墙上作画，路人驻足观看。画的是一个被高楼大厦包围的小女孩。
+
+老周：（推着小车经过）
+又在祸害墙了？
+
+陈远：（继续画画）
+这叫艺术，周叔。你看这城市，像不像个牢笼？
+
+## 第二幕：意外相遇
+
+### 场景3：林晓家 - 晚 - 内景
+林晓回到家，母亲张美玲正在厨房忙碌。
+
+张美玲：
+回来了？饭马上就好。
+"""
+
+DIALOGUES = [
+    "王琳：（敲门进入）\n林总监，新项目的提案准备好了。",
+    "林晓：（回过神来）\n好的，马上看。\n（翻看文件，若有所思）\n这个创意还不够打动人。",
+    "老周：（推着小车经过）\n又在祸害墙了？",
+    "陈远：（继续画画）\n这叫艺术，周叔。你看这城市，像不像个牢笼？",
+    "张美玲：\n回来了？饭马上就好。",
+]
+
+
+def _processor(**config: Any) -> ScreenplayTextProcessor:
+    """构建测试用处理器."""
+    return ScreenplayTextProcessor(TextProcessingConfig(**config))
+
+
+@pytest.mark.asyncio
+async def test_merge_whole_scenes() -> None:
+    """测试完整场景在chunk_size内合并, 只在场景边界断开."""
+    processor = _processor(chunk_size=500)
+    chunks = await processor.split_with_metadata(await processor.clean(SCRIPT))
+
+    assert len(chunks) == 1
+    chunk, metadata = chunks[0]
+    assert metadata["scene"] == "场景1：广告公司办公室 - 日 - 内景"
+    assert metadata["scene_index"] == 0
+    assert len(metadata["scenes"]) == 3
+    assert metadata["characters"] == ["王琳", "林晓", "老周", "陈远", "张美玲"]
+
+    processor = _processor(chunk_size=180)
+    chunks = await processor.split_with_metadata(await processor.clean(SCRIPT))
+    assert [metadata["scene_index"] for _, metadata in chunks] == [0, 1, 2]
+    assert chunks[0][0].startswith("# 《城市之光》\n\n## 第一幕：都市迷茫\n\n### 场景1")
+    assert chunks[1][0].startswith("### 场景2")
+    assert chunks[2][1]["section"] == "第二幕：意外相遇"
+    assert chunks[1][1]["characters"] == ["老周", "陈远"]
+
+
+@pytest.mark.asyncio
+async def test_dialogue_blocks_not_split() -> None:
+    """测试场景过长时在块边界续分, 续块以场景标题开头, 对白不被切断."""
+    processor = _processor(chunk_size=100)
+    chunks = await processor.split_with_metadata(await processor.clean(SCRIPT))
+
+    assert all(len(chunk) <= 100 for chunk, _ in chunks)
+    for dialogue in DIALOGUES:
+        assert sum(dialogue in chunk for chunk, _ in chunks) == 1
+
+    scene1 = [chunk for chunk, metadata in chunks if metadata.get("scene_index") == 0]
+    assert len(scene1) > 1
+    assert all("### 场景1：广告公司办公室 - 日 - 内景" in chunk for chunk in scene1)
+    assert not any("场景1" in chunk and "场景2" in chunk for chunk, _ in chunks)
+
+
+@pytest.mark.asyncio
+async def test_oversize_block_falls_back_to_sentences() -> None:
+    """测试单个对白块超过chunk_size时按句子切分."""
+    speech = "".join(f"第{i}句台词说得很长很长。" for i in range(30))
+    text = f"第一场 内景 咖啡馆 - 日\n\n陈默：\n{speech}\n\n林夏：\n嗯。"
+    processor = _processor(chunk_size=100, chunk_overlap=0)
+    chunks = await processor.split_with_metadata(await processor.clean(text))
+
+    assert len(chunks) > 2
+    assert all(len(chunk) <= 100 for chunk, _ in chunks)
+    assert all(chunk.startswith("第一场 内景 咖啡馆 - 日\n\n") for chunk, _ in chunks)
+    assert chunks[0][1]["characters"] == ["陈默"]
+    assert chunks[-1][1]["characters"] == ["林夏"]
+    assert chunks[-1][0].endswith("林夏：\n嗯。")
+
+
+@pytest.mark.asyncio
+async def test_english_screenplay() -> None:
+    """测试英文场景标题和角色提示."""
+    text = (
+        "INT. COFFEE SHOP - DAY\n\nMara enters.\n\nMARA (V.O.)\nI never forgot.\n\n"
+        "EXT. STREET - NIGHT\n\nJON\nThen why did you leave?"
+    )
+    processor = _processor(chunk_size=100)
+    chunks = await processor.split_with_metadata(await processor.clean(text))
+
+    assert [metadata["scene"] for _, metadata in chunks] == [
+        "INT. COFFEE SHOP - DAY",
+        "EXT. STREET - NIGHT",
+    ]
+    assert chunks[0][1]["characters"] == ["MARA"]
+    assert chunks[1][1]["characters"] == ["JON"]
+
+
+@pytest.mark.asyncio
+async def test_clean_and_metadata() -> None:
+    """测试清理保留行结构, 元数据统计场景数."""
+    processor = ScreenplayTextProcessor()
+    cleaned = await processor.clean("  场景1：办公室 \r\n\n\n\n林晓：\t你好。  \n")
+    assert cleaned == "场景1：办公室\n\n林晓： 你好。"
+
+    metadata = await processor.extract_metadata(await processor.clean(SCRIPT))
+    assert metadata["scene_count"] == 3
+    assert metadata["title"] == "《城市之光》"
+    assert await processor.split("") == []
+
+
+@pytest.mark.asyncio
+async def test_prepare_document_carries_chunk_metadata() -> None:
+    """测试分块元数据随分块一起返回."""
+    chunks, extracted = await _prepare_document(_processor(chunk_size=180), SCRIPT)
+
+    assert extracted["scene_count"] == 3
+    assert [metadata["scene_index"] for _, metadata in chunks] == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_split_stream_continues_scenes() -> None:
+    """测试流式分块时场景序号、章节和未结束的场景跨段延续."""
+    processor = _processor(chunk_size=100)
+    text = await processor.clean(SCRIPT)
+    expected = await processor.split_with_metadata(text)
+
+    async def segments() -> AsyncIterator[str]:
+        # 在场景中间和场景标题之后切分
+        cuts = [
+            0,
+            SCRIPT.index("林晓：（回过神来）"),
+            SCRIPT.index("陈远在墙上"),
+            len(SCRIPT),
+        ]
+        for start, end in zip(cuts, cuts[1:]):
+            yield SCRIPT[start:end]
+
+    chunks = [item async for item in processor.split_stream(segments())]
+
+    # 每段都在块边界切分时, 结果与整篇分块一致
+    assert chunks == expected
+    assert chunks[2][0].startswith("# 《城市之光》\n\n## 第一幕：都市迷茫\n\n### 场景1")
+
+
+def test_segment_boundary_before_scene_heading() -> None:
+    """测试流式分段在最后一个场景标题之前切分."""
+    processor = ScreenplayTextProcessor()
+    position = processor.segment_boundary(SCRIPT)
+    assert SCRIPT[position:].startswith("### 场景3")
+    assert processor.segment_boundary("没有标题\n\n的文本") == len("没有标题\n\n")
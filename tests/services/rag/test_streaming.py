@@ -0,0 +1,63 @@
+"""流式解码与分段测试."""
+from typing import AsyncIterator, List
+
+import pytest
+
+from scriptai.services.rag.streaming import decode_stream, iter_segments
+
+
+async def _aiter(items: List) -> AsyncIterator:
+    """把列表包装为异步迭代器."""
+    for item in items:
+        yield item
+
+
+async def _collect(iterator: AsyncIterator) -> List:
+    """收集异步迭代器的全部元素."""
+    return [item async for item in iterator]
+
+
+@pytest.mark.asyncio
+async def test_decode_stream_across_boundaries() -> None:
+    """测试多字节字符和\\r\\n跨读取边界时正确解码."""
+    data = "第一场\r\n林夏：你好。\r\n".encode("utf-8")
+    pieces = [data[i : i + 1] for i in range(len(data))]
+
+    decoded = await _collect(decode_stream(_aiter(pieces)))
+
+    assert "".join(decoded) == "第一场\n林夏：你好。\n"
+
+
+@pytest.mark.asyncio
+async def test_decode_stream_invalid_bytes() -> None:
+    """测试非法编码抛出UnicodeDecodeError."""
+    with pytest.raises(UnicodeDecodeError):
+        await _collect(decode_stream(_aiter([b"abc", b"\xff\xfe"])))
+
+
+@pytest.mark.asyncio
+async def test_iter_segments() -> None:
+    """测试按边界切分, 拼接后与原文一致且段长有界."""
+    text = "".join(f"第{i}段内容。\n\n" for i in range(200))
+    pieces = [text[i : i + 37] for i in range(0, len(text), 37)]
+
+    def boundary(buffer: str) -> int:
+        position = buffer.rfind("\n\n")
+        return position + 2 if position >= 0 else 0
+
+    segments = await _collect(iter_segments(_aiter(pieces), boundary, 256))
+
+    assert "".join(segments) == text
+    assert len(segments) > 1
+    assert all(segment.endswith("\n\n") for segment in segments)
+    assert all(len(segment) <= 256 for segment in segments)
+
+    # 切分与读取分片方式无关
+    pieces = [text[i : i + 101] for i in range(0, len(text), 101)]
+    assert await _collect(iter_segments(_aiter(pieces), boundary, 256)) == segments
+
+    # 没有切分位置时在最后一个换行处切分, 再没有则硬切
+    segments = await _collect(
+        iter_segments(_aiter(["a" * 100, "b\n" + "c" * 60]), lambda _: 0, 50)
+    )
+    assert segments == ["a" * 50, "a" * 50, "b\n", "c" * 50, "c" * 10]
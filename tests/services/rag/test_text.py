@@ -0,0 +1,107 @@
+"""文本处理器测试."""
+import types
+from typing import Any, List
+
+import pytest
+
+from scriptai.core.tokens import token_counter
+from scriptai.services.rag.processors.text import (
+    DefaultTextProcessor,
+    TextProcessingConfig,
+)
+
+
+def _processor(**config: Any) -> DefaultTextProcessor:
+    """构建测试用处理器."""
+    return DefaultTextProcessor(TextProcessingConfig(**config))
+
+
+def _sentences(count: int) -> List[str]:
+    """长度不同的测试句子."""
+    return [f"第{i}句{'描述' * (i % 7 + 3)}。" for i in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_split_sizes_and_coverage() -> None:
+    """测试分块不超过chunk_size且不丢内容."""
+    sentences = _sentences(200)
+    processor = _processor(chunk_size=100, chunk_overlap=30, min_chunk_size=50)
+    chunks = await processor.split("".join(sentences))
+
+    assert len(chunks) > 1
+    assert len(chunks[-1]) <= 100 + 50
+    assert all(len(chunk) <= 100 for chunk in chunks[:-1])
+    for sentence in sentences:
+        assert any(sentence in chunk for chunk in chunks)
+
+
+@pytest.mark.asyncio
+async def test_split_overlap() -> None:
+    """测试相邻分块按整句重叠."""
+    processor = _processor(chunk_size=100, chunk_overlap=30, min_chunk_size=50)
+    chunks = await processor.split("".join(_sentences(100)))
+
+    for previous, current in zip(chunks, chunks[1:]):
+        head = current.split("。")[0] + "。"
+        assert len(head) <= 30
+        assert previous.endswith(head)
+
+
+@pytest.mark.asyncio
+async def test_split_without_overlap() -> None:
+    """测试关闭重叠时分块首尾相接."""
+    text = "".join(_sentences(100))
+    processor = _processor(chunk_size=100, chunk_overlap=0, min_chunk_size=50)
+    assert "".join(await processor.split(text)) == text
+
+
+@pytest.mark.asyncio
+async def test_split_keeps_short_tail() -> None:
+    """测试过小的末块并入上一块而不是被丢弃."""
+    text = "".join(_sentences(30)) + "结尾。"
+    processor = _processor(chunk_size=100, chunk_overlap=0, min_chunk_size=50)
+    chunks = await processor.split(text)
+
+    assert chunks[-1].endswith("结尾。")
+    assert len(chunks[-1]) > 100 - 50
+    assert "".join(chunks) == text
+
+
+@pytest.mark.asyncio
+async def test_split_short_document() -> None:
+    """测试短文档保留为一个分块."""
+    processor = _processor()
+    assert await processor.split("  很短的文档。  ") == ["很短的文档。"]
+    assert await processor.split("") == []
+
+
+@pytest.mark.asyncio
+async def test_split_long_sentence() -> None:
+    """测试没有标点的超长文本按长度硬切."""
+    processor = _processor(chunk_size=100, chunk_overlap=20, min_chunk_size=50)
+    chunks = await processor.split("字" * 1000)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert sum(len(chunk) for chunk in chunks) >= 1000
+
+
+def test_iter_split_is_lazy() -> None:
+    """测试分块惰性生成."""
+    processor = _processor(chunk_size=100, chunk_overlap=20, min_chunk_size=50)
+    chunks = processor.iter_split("".join(_sentences(10)) * 100_000)
+    assert isinstance(chunks, types.GeneratorType)
+    assert len(next(chunks)) <= 100
+
+
+@pytest.mark.asyncio
+async def test_split_by_tokens() -> None:
+    """测试按token计量分块."""
+    processor = _processor(
+        chunk_unit="token", chunk_size=100, chunk_overlap=20, min_chunk_size=50
+    )
+    sentences = _sentences(200) + ["English sentences are counted differently."] * 50
+    chunks = await processor.split("".join(sentences))
+
+    assert len(chunks) > 1
+    assert all(token_counter.count(chunk) <= 100 for chunk in chunks[:-1])
+    for sentence in sentences:
+        assert any(sentence in chunk for chunk in chunks)
@@ -0,0 +1,25 @@
+"""上下文打包测试."""
+from scriptai.core.tokens import TokenCounter
+from scriptai.services.rag.tokens import pack_context
+
+
+def _estimator() -> TokenCounter:
+    """不依赖tiktoken的估算计数器."""
+    counter = TokenCounter(cache_size=16)
+    counter._loaded = True
+    counter._encoding = None
+    return counter
+
+
+def test_pack_context() -> None:
+    """测试按顺序装入预算内的上下文."""
+    counter = _estimator()
+    contexts = ["甲" * 40, "乙" * 50, "丙" * 5, "丁" * 5]
+
+    packed = pack_context(contexts, 60, separator="\n\n", counter=counter)
+    # 乙放不下被跳过, 后面较短的丙丁继续装入
+    assert packed == ["甲" * 40, "丙" * 5, "丁" * 5]
+
+    # 第一条超出预算时截断保留
+    assert pack_context(contexts, 10, counter=counter) == ["甲" * 10]
+    assert pack_context([], 10, counter=counter) == []